@@ -2,6 +2,7 @@
 from fastapi import Header, HTTPException, status
 
 from app.core.security import AuthContext, authenticate_api_key
+from app.services.key_usage import key_usage
 
 
 async def require_auth(x_api_key: str = Header(..., alias="X-Api-Key")) -> AuthContext:
@@ -12,6 +13,7 @@ async def require_auth(x_api_key: str = Header(..., alias="X-Api-Key")) -> AuthC
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid or missing API key",
         )
+    key_usage.record(ctx.api_key_id)
     return ctx
 
 
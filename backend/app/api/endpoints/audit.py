@@ -1,12 +1,13 @@
 """Audit log - immutable event trail of evaluations."""
 from uuid import UUID
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy import desc, select
 
 from app.api.deps import AuthContext, require_auth, require_scope
 from app.db.models import Evaluation
 from app.db.session import async_session
+from app.services.payload_store import payload_store
 
 router = APIRouter()
 
@@ -29,21 +30,38 @@ async def list_audit(
             .limit(limit)
         )
         rows = result.scalars().all()
-        return [
-            {
-                "id": str(r.id),
-                "created_at": r.created_at.isoformat(),
-                "action_type": r.action_type,
-                "actor": r.actor,
-                "agent": r.agent,
-                "tool_name": r.tool_name,
-                "aws_service": r.aws_service,
-                "aws_operation": r.aws_operation,
-                "decision": r.decision,
-                "risk_score": r.risk_score,
-                "reason": r.reason,
-                "policy_hits": r.policy_hits,
-                "trace_id": r.trace_id,
-            }
-            for r in rows
-        ]
+        return [_audit_entry(r) for r in rows]
+
+
+@router.get("/audit/{evaluation_id}")
+async def get_audit_entry(
+    evaluation_id: UUID,
+    ctx: AuthContext = Depends(require_auth),
+):
+    """One evaluation with its full request payload. Requires admin scope."""
+    require_scope(ctx, "admin")
+
+    async with async_session() as session:
+        ev = await session.get(Evaluation, evaluation_id)
+        if not ev or ev.tenant_id != UUID(ctx.tenant_id):
+            raise HTTPException(status_code=404, detail="Evaluation not found")
+        payload = await payload_store.load(session, ev.request_hash)
+        return {**_audit_entry(ev), "risk_signals": ev.risk_signals, "request_payload": payload}
+
+
+def _audit_entry(r: Evaluation) -> dict:
+    return {
+        "id": str(r.id),
+        "created_at": r.created_at.isoformat(),
+        "action_type": r.action_type,
+        "actor": r.actor,
+        "agent": r.agent,
+        "tool_name": r.tool_name,
+        "aws_service": r.aws_service,
+        "aws_operation": r.aws_operation,
+        "decision": r.decision,
+        "risk_score": r.risk_score,
+        "reason": r.reason,
+        "policy_hits": r.policy_hits,
+        "trace_id": r.trace_id,
+    }
@@ -1,26 +1,48 @@
 """Evaluate agent actions - gate tool calls and AWS API."""
-import hashlib
+import asyncio
 import json
-from uuid import UUID
+import logging
+from datetime import datetime
+from typing import Any
+from uuid import UUID, uuid4
 
-from fastapi import APIRouter, Depends, Header
-from sqlalchemy import select
+from fastapi import APIRouter, Depends, Header, HTTPException, WebSocket, WebSocketDisconnect, status
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.deps import AuthContext, require_auth
-from app.api.schemas import EvaluateRequest, EvaluateResponse
-from app.core.idempotency import get_by_idempotency
-from app.db.models import ApprovalRequest, Evaluation, Policy
+from app.api.schemas import (
+    EvaluateBatchRequest,
+    EvaluateBatchResponse,
+    EvaluateRequest,
+    EvaluateResponse,
+    EvaluateStreamMessage,
+)
+from app.core.config import settings
+from app.core.idempotency import (
+    idempotency_cache,
+    idempotency_flights,
+    is_idempotency_conflict,
+    lock_idempotency_key,
+    release_expired_keys,
+    render_evaluation,
+)
+from app.core.security import authenticate_api_key
+from app.db.models import ApprovalRequest, Evaluation
 from app.db.session import async_session
 from app.services.approvals import wait_for_approval
-from app.services.policy_engine import evaluate_policies
-from app.services.risk import score_risk
-
-router = APIRouter()
+from app.services.audit_journal import audit_journal
+from app.services.key_usage import key_usage
+from app.services.payload_store import payload_store, request_hash
+from app.services.policy_cache import PolicySnapshot, policy_cache
+from app.services.policy_engine import match_context
+from app.services.policy_memo import decision_memo
+from app.services.risk_scanner import risk_scanner
 
+logger = logging.getLogger(__name__)
 
-def _stable_hash(payload: dict) -> str:
-    raw = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
-    return hashlib.sha256(raw).hexdigest()
+router = APIRouter()
 
 
 @router.post("/evaluate", response_model=EvaluateResponse)
@@ -30,116 +52,288 @@ async def evaluate(
     idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
 ):
     """Evaluate an agent action. Returns ALLOW, DENY, or REQUIRE_APPROVAL."""
-    tenant_id = ctx.tenant_id
+    return await evaluate_action(body, ctx.tenant_id, idempotency_key)
+
 
+async def evaluate_action(
+    body: EvaluateRequest, tenant_id: str, idempotency_key: str | None
+) -> EvaluateResponse:
+    """Evaluate one action for tenant_id, honoring an idempotency key."""
     if idempotency_key and idempotency_key.strip():
-        existing = await get_by_idempotency(tenant_id, idempotency_key)
-        if existing:
-            approval_id = None
+        cached = await idempotency_cache.get(tenant_id, idempotency_key)
+        if cached:
+            return EvaluateResponse(**cached)
+        # Concurrent retries in this worker wait for the first one's result
+        return await idempotency_flights.run(
+            (tenant_id, idempotency_key),
+            lambda: _evaluate(body, tenant_id, idempotency_key),
+        )
+
+    return await _evaluate(body, tenant_id, None)
+
+
+@router.websocket("/evaluate/stream")
+async def evaluate_stream(websocket: WebSocket):
+    """
+    Persistent evaluate channel, authenticated once by the X-Api-Key header.
+    Send {"id": ..., "request": {EvaluateRequest}, "idempotency_key": ...}
+    messages without waiting; each is answered with {"id": ..., "result":
+    {EvaluateResponse}} or {"id": ..., "error": {"status", "detail"}} as soon
+    as it completes, so replies can arrive out of order. At most
+    EVALUATE_STREAM_MAX_INFLIGHT messages per connection are processed at once.
+    """
+    api_key = websocket.headers.get("x-api-key", "")
+    ctx = await authenticate_api_key(api_key)
+    if not ctx:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Invalid or missing API key")
+        return
+    await websocket.accept()
+
+    send_lock = asyncio.Lock()
+    slots = asyncio.Semaphore(settings.EVALUATE_STREAM_MAX_INFLIGHT)
+    tasks: set[asyncio.Task] = set()
+
+    async def reply(message: dict[str, Any]) -> None:
+        async with send_lock:
+            try:
+                await websocket.send_json(message)
+            except (WebSocketDisconnect, RuntimeError):
+                # The client went away before its reply
+                pass
+
+    async def handle(message: Any) -> None:
+        request_id = message.get("id") if isinstance(message, dict) else None
+        try:
+            # Served from the auth cache, so a revoked key stops working mid-connection
+            current = await authenticate_api_key(api_key)
+            if not current:
+                await reply({"id": request_id, "error": {"status": 401, "detail": "Invalid or missing API key"}})
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+                return
+            # Each message counts as a use of the key, like a POST /v1/evaluate
+            key_usage.record(current.api_key_id)
+            try:
+                msg = EvaluateStreamMessage.model_validate(message)
+            except ValidationError as e:
+                await reply({"id": request_id, "error": {"status": 422, "detail": str(e)}})
+                return
+            result = await evaluate_action(msg.request, ctx.tenant_id, msg.idempotency_key)
+            await reply({"id": request_id, "result": result.model_dump()})
+        except Exception:
+            logger.exception("Streamed evaluation failed")
+            await reply({"id": request_id, "error": {"status": 500, "detail": "Internal error"}})
+        finally:
+            slots.release()
+
+    try:
+        while True:
+            raw = await websocket.receive_text()
+            try:
+                message = json.loads(raw)
+            except ValueError:
+                message = None
+            await slots.acquire()
+            task = asyncio.create_task(handle(message))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Evaluations already started still complete (and are recorded)
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _records(
+    body: EvaluateRequest, tenant_id: str, idempotency_key: str | None, snapshot: PolicySnapshot, scored: tuple
+) -> tuple[Evaluation, ApprovalRequest | None]:
+    """Decide on a scored action and build its rows. Ids and timestamps are set
+    here, so nothing has to be read back after the INSERTs."""
+    req_payload, (risk_score, risk_signals) = scored
+    pd = decision_memo.evaluate(snapshot, match_context(body, risk_score))
+    now = datetime.utcnow()
+    ev = Evaluation(
+        id=uuid4(),
+        tenant_id=UUID(tenant_id),
+        idempotency_key=idempotency_key,
+        trace_id=body.trace_id,
+        action_type=body.action_type,
+        actor=body.actor,
+        agent=body.agent,
+        tool_name=body.tool_name,
+        aws_service=body.aws_service,
+        aws_operation=body.aws_operation,
+        request_hash=request_hash(tenant_id, req_payload),
+        risk_signals=risk_signals,
+        decision=pd.decision,
+        reason=pd.reason,
+        risk_score=risk_score,
+        policy_hits=pd.resolve_hits(),
+        created_at=now,
+    )
+    appr = None
+    if pd.decision == "REQUIRE_APPROVAL":
+        appr = ApprovalRequest(
+            id=uuid4(),
+            tenant_id=ev.tenant_id,
+            evaluation_id=ev.id,
+            status="PENDING",
+            created_at=now,
+        )
+    return ev, appr
+
+
+async def _score(body: EvaluateRequest, snapshot: PolicySnapshot) -> tuple:
+    # Only the request itself (not a batch item's idempotency_key), so a
+    # tenant's equal requests hash alike on every endpoint
+    req_payload = body.model_dump(include=set(EvaluateRequest.model_fields))
+    return req_payload, await risk_scanner.score_risk(body.action_type, req_payload, snapshot.disabled_stages)
+
+
+async def _persist(
+    session: AsyncSession,
+    records: list[tuple[Evaluation, ApprovalRequest | None]],
+    payloads: dict[str, dict],
+) -> None:
+    """
+    Write evaluations and approvals in one transaction (multi-row INSERTs),
+    along with any request payloads (by request_hash) not already stored.
+    Unkeyed ALLOW/DENY rows go to the audit journal instead when it is on;
+    keyed rows stay synchronous so other workers see the key.
+    """
+    evaluations = []
+    journaled = []
+    for ev, appr in records:
+        if appr is None and ev.idempotency_key is None and audit_journal.enabled:
+            journaled.append(audit_journal.append(ev, payloads[ev.request_hash]))
+        else:
+            evaluations.append(ev)
+    if journaled:
+        # Concurrent appends share one journal write and fsync
+        await asyncio.gather(*journaled)
+    approvals = [appr for _, appr in records if appr is not None]
+
+    # Before add_all(): the payload INSERT would autoflush evaluations ahead of their FK target
+    stored = await payload_store.write(
+        session, {ev.request_hash: payloads[ev.request_hash] for ev in evaluations}
+    )
+    session.add_all(evaluations)
+    if approvals:
+        # No relationship() orders the INSERTs; the FK needs the evaluations first
+        await session.flush()
+        session.add_all(approvals)
+    await session.commit()
+    payload_store.remember(stored)
+
+
+async def _evaluate(body: EvaluateRequest, tenant_id: str, idempotency_key: str | None) -> EvaluateResponse:
+    # Scored before taking a connection: the key lock is held only for the re-check and the INSERTs
+    snapshot = await policy_cache.get(tenant_id)
+    scored = await _score(body, snapshot)
+
+    for attempt in range(2):
+        try:
             async with async_session() as session:
-                result = await session.execute(
-                    select(ApprovalRequest).where(
-                        ApprovalRequest.evaluation_id == existing.id
-                    )
-                )
-                appr = result.scalar_one_or_none()
-                if appr:
-                    approval_id = str(appr.id)
-
-            payload = existing.request_payload or {}
+                if idempotency_key:
+                    # Serialize with other workers evaluating the same key, then re-check on the same connection
+                    await lock_idempotency_key(session, tenant_id, idempotency_key)
+                    cached = await idempotency_cache.get(tenant_id, idempotency_key, session)
+                    if cached:
+                        return EvaluateResponse(**cached)
+
+                ev, appr = _records(body, tenant_id, idempotency_key, snapshot, scored)
+                await _persist(session, [(ev, appr)], {ev.request_hash: scored[0]})
+            break
+        except IntegrityError as e:
+            # The key is still held by an expired evaluation: release it and write again
+            if attempt or not idempotency_key or not is_idempotency_conflict(e):
+                raise
+            await release_expired_keys(tenant_id, [idempotency_key])
+
+    approval_id = str(appr.id) if appr else None
+    response = render_evaluation(ev, approval_id)
+    if idempotency_key:
+        # What a retry renders: the stored decision, not a later approval outcome
+        await idempotency_cache.set(tenant_id, idempotency_key, response)
+
+    if body.wait_for_approval and approval_id:
+        resolved = await wait_for_approval(tenant_id, approval_id)
+        if resolved:
+            final_decision = "ALLOW" if resolved.status == "APPROVED" else "DENY"
             return EvaluateResponse(
-                decision=existing.decision,
-                reason=existing.reason,
-                risk_score=existing.risk_score,
-                risk_signals=payload.get("risk_signals", []),
-                policy_hits=existing.policy_hits or [],
-                evaluation_id=str(existing.id),
-                approval_id=approval_id,
+                **{**response, "decision": final_decision, "reason": f"approval:{resolved.status}"}
             )
 
-    req_payload = body.model_dump()
-    req_hash = _stable_hash(req_payload)
-    risk_score, risk_signals = score_risk(body.action_type, req_payload)
-
-    match_ctx = {
-        "action_type": body.action_type,
-        "actor": body.actor,
-        "agent": body.agent,
-        "tool_name": body.tool_name,
-        "aws_service": body.aws_service,
-        "aws_operation": body.aws_operation,
-        "risk_score": risk_score,
-        "default_decision": "REQUIRE_APPROVAL" if risk_score >= 60 else "ALLOW",
-    }
-
-    async with async_session() as session:
-        result = await session.execute(
-            select(Policy).where(
-                Policy.tenant_id == UUID(tenant_id),
-                Policy.enabled == True,
-            )
-        )
-        policies = result.scalars().all()
-        policy_dsls = [
-            {"name": p.name, "enabled": p.enabled, "rules": (p.dsl or {}).get("rules", [])}
-            for p in policies
-        ]
-
-        pd = evaluate_policies(policy_dsls, match_ctx)
-
-        ev = Evaluation(
-            tenant_id=UUID(tenant_id),
-            idempotency_key=idempotency_key,
-            trace_id=body.trace_id,
-            action_type=body.action_type,
-            actor=body.actor,
-            agent=body.agent,
-            tool_name=body.tool_name,
-            aws_service=body.aws_service,
-            aws_operation=body.aws_operation,
-            request_payload={**req_payload, "risk_signals": risk_signals},
-            request_hash=req_hash,
-            decision=pd.decision,
-            reason=pd.reason,
-            risk_score=risk_score,
-            policy_hits=pd.hits,
-        )
-        session.add(ev)
-        await session.commit()
-        await session.refresh(ev)
-
-        approval_id = None
-        if pd.decision == "REQUIRE_APPROVAL":
-            appr = ApprovalRequest(
-                tenant_id=UUID(tenant_id),
-                evaluation_id=ev.id,
-                status="PENDING",
-            )
-            session.add(appr)
-            await session.commit()
-            await session.refresh(appr)
-            approval_id = str(appr.id)
-
-            if body.wait_for_approval and approval_id:
-                resolved = await wait_for_approval(tenant_id, approval_id)
-                if resolved:
-                    final_decision = "ALLOW" if resolved.status == "APPROVED" else "DENY"
-                    return EvaluateResponse(
-                        decision=final_decision,
-                        reason=f"approval:{resolved.status}",
-                        risk_score=risk_score,
-                        risk_signals=risk_signals,
-                        policy_hits=pd.hits,
-                        evaluation_id=str(ev.id),
-                        approval_id=approval_id,
-                    )
-
-        return EvaluateResponse(
-            decision=pd.decision,
-            reason=pd.reason,
-            risk_score=risk_score,
-            risk_signals=risk_signals,
-            policy_hits=pd.hits,
-            evaluation_id=str(ev.id),
-            approval_id=approval_id,
+    return EvaluateResponse(**response)
+
+
+@router.post("/evaluate/batch", response_model=EvaluateBatchResponse)
+async def evaluate_batch(
+    body: EvaluateBatchRequest,
+    ctx: AuthContext = Depends(require_auth),
+):
+    """
+    Evaluate many agent actions with one policy load and one write
+    transaction. Results are in request order; items with an
+    idempotency_key behave like /evaluate retries. Never waits for approval.
+    """
+    tenant_id = ctx.tenant_id
+    if len(body.items) > settings.EVALUATE_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=422, detail=f"At most {settings.EVALUATE_BATCH_MAX_ITEMS} items per batch"
         )
+
+    keys = sorted({item.idempotency_key for item in body.items if item.idempotency_key})
+    responses = await idempotency_cache.get_many(tenant_id, keys) if keys else {}
+
+    # First occurrence of each new key is evaluated; repeats share its result.
+    # Scored before taking a connection, so the key locks are held only for
+    # the re-check and the INSERTs.
+    snapshot = await policy_cache.get(tenant_id)
+    todo = []
+    claimed = set(responses)
+    for i, item in enumerate(body.items):
+        if item.idempotency_key in claimed:
+            continue
+        if item.idempotency_key:
+            claimed.add(item.idempotency_key)
+        todo.append(i)
+    scored = dict(zip(todo, await asyncio.gather(*(_score(body.items[i], snapshot) for i in todo))))
+
+    pending = [k for k in keys if k not in responses]
+    for attempt in range(2):
+        try:
+            async with async_session() as session:
+                if pending:
+                    # Sorted, so concurrent batches take the locks in the same order
+                    for idem_key in pending:
+                        await lock_idempotency_key(session, tenant_id, idem_key)
+                    responses.update(await idempotency_cache.get_many(tenant_id, pending, session))
+                    # Keys another worker wrote meanwhile are answered from its result
+                    todo = [i for i in todo if body.items[i].idempotency_key not in responses]
+
+                records = {
+                    i: _records(body.items[i], tenant_id, body.items[i].idempotency_key, snapshot, scored[i])
+                    for i in todo
+                }
+                payloads = {records[i][0].request_hash: scored[i][0] for i in todo}
+                await _persist(session, list(records.values()), payloads)
+            break
+        except IntegrityError as e:
+            # A key is still held by an expired evaluation: release them and write again
+            if attempt or not pending or not is_idempotency_conflict(e):
+                raise
+            await release_expired_keys(tenant_id, pending)
+
+    results = []
+    for i, item in enumerate(body.items):
+        if i in records:
+            ev, appr = records[i]
+            response = render_evaluation(ev, str(appr.id) if appr else None)
+            if item.idempotency_key:
+                await idempotency_cache.set(tenant_id, item.idempotency_key, response)
+                responses[item.idempotency_key] = response
+        else:
+            response = responses[item.idempotency_key]
+        results.append(EvaluateResponse(**response))
+    return EvaluateBatchResponse(results=results)
@@ -0,0 +1,34 @@
+"""Worker-local cache and scanner metrics."""
+from fastapi import APIRouter, Depends
+
+from app.api.deps import AuthContext, require_auth, require_scope
+from app.core.idempotency import idempotency_cache
+from app.core.security import api_key_cache
+from app.services.audit_journal import audit_journal
+from app.services.idempotency_expiry import idempotency_expirer
+from app.services.payload_store import payload_store
+from app.services.policy_cache import policy_cache
+from app.services.policy_memo import decision_memo
+from app.services.risk import RISK_STAGES, risk_cache
+from app.services.risk_scanner import risk_scanner
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def metrics(ctx: AuthContext = Depends(require_auth)):
+    """Counters for this worker process. Requires admin scope."""
+    require_scope(ctx, "admin")
+
+    return {
+        "risk_scanner": risk_scanner.stats(),
+        "risk_cache": risk_cache.stats(),
+        "risk_stages": {name: stage.stats() for name, stage in RISK_STAGES.items()},
+        "policy_memo": decision_memo.stats(),
+        "policy_cache": {"hits": policy_cache.hits, "loads": policy_cache.loads},
+        "auth_cache": api_key_cache.stats(),
+        "idempotency_cache": idempotency_cache.stats(),
+        "idempotency_expiry": idempotency_expirer.stats(),
+        "audit_journal": audit_journal.stats(),
+        "payload_store": payload_store.stats(),
+    }
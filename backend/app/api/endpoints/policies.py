@@ -1,13 +1,20 @@
 """Policy CRUD and management."""
+from datetime import datetime
+from dataclasses import asdict
 from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy import select
 
 from app.api.deps import AuthContext, require_auth, require_scope
-from app.api.schemas import PolicyUpsert
-from app.db.models import Policy
+from app.api.schemas import PolicyReplayRequest, PolicyReplayResponse, PolicyUpsert
+from app.core.config import settings
+from app.db.models import Policy, RuleStat
 from app.db.session import async_session
+from app.services.policy_cache import policy_cache
+from app.services.policy_engine import PolicyValidationError, compile_policies
+from app.services.replay import replay_policies
+from app.services.rule_stats import pending_rule_stats
 
 router = APIRouter()
 
@@ -34,6 +41,41 @@ async def list_policies(ctx: AuthContext = Depends(require_auth)):
         ]
 
 
+@router.get("/policies/stats")
+async def policy_stats(ctx: AuthContext = Depends(require_auth)):
+    """Per-rule evaluation and match counters. Requires admin scope."""
+    require_scope(ctx, "admin")
+
+    async with async_session() as session:
+        result = await session.execute(
+            select(RuleStat).where(RuleStat.tenant_id == UUID(ctx.tenant_id))
+        )
+        stored = {(s.policy_name, s.rule_name): s for s in result.scalars().all()}
+
+    # Add this worker's unflushed counters without writing them
+    pending = pending_rule_stats(ctx.tenant_id)
+    stats = []
+    for key in stored.keys() | pending.keys():
+        row = stored.get(key)
+        evaluated, matched = pending.get(key, (0, 0))
+        updated_at = datetime.utcnow() if key in pending else row.updated_at
+        if row is not None:
+            evaluated += row.evaluated
+            matched += row.matched
+        stats.append(
+            {
+                "policy": key[0],
+                "rule": key[1],
+                "evaluated": evaluated,
+                "matched": matched,
+                "match_rate": round(matched / evaluated, 4) if evaluated else 0.0,
+                "updated_at": updated_at.isoformat(),
+            }
+        )
+    stats.sort(key=lambda s: s["evaluated"], reverse=True)
+    return stats
+
+
 @router.put("/policies", summary="Upsert policy by name")
 async def upsert_policy(
     body: PolicyUpsert,
@@ -42,6 +84,11 @@ async def upsert_policy(
     """Create or update policy. Requires admin scope."""
     require_scope(ctx, "admin")
 
+    try:
+        compile_policies([{"name": body.name, "rules": body.dsl.get("rules", [])}], strict=True)
+    except PolicyValidationError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
     async with async_session() as session:
         result = await session.execute(
             select(Policy).where(
@@ -63,10 +110,42 @@ async def upsert_policy(
             p.enabled = body.enabled
             p.dsl = body.dsl
             p.version += 1
+        await policy_cache.publish_change(session, ctx.tenant_id)
         await session.commit()
+        policy_cache.invalidate(ctx.tenant_id)
         return {"ok": True, "name": body.name, "id": str(p.id)}
 
 
+@router.post("/policies/replay", response_model=PolicyReplayResponse)
+async def replay_policy(
+    body: PolicyReplayRequest,
+    ctx: AuthContext = Depends(require_auth),
+):
+    """
+    What-if: re-evaluate past evaluations with a candidate policy upserted and
+    report which decisions would flip. Read-only. Requires admin scope.
+    """
+    require_scope(ctx, "admin")
+    if body.limit is not None and body.limit > settings.REPLAY_MAX_LIMIT:
+        raise HTTPException(status_code=422, detail=f"limit must be at most {settings.REPLAY_MAX_LIMIT}")
+
+    try:
+        compile_policies([{"name": body.name, "rules": body.dsl.get("rules", [])}], strict=True)
+    except PolicyValidationError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    candidate = {"name": body.name, "enabled": body.enabled, "rules": body.dsl.get("rules", [])}
+
+    report = await replay_policies(
+        ctx.tenant_id,
+        candidate,
+        since=body.since,
+        limit=body.limit or settings.REPLAY_DEFAULT_LIMIT,
+        sample_size=body.sample_size,
+    )
+    return PolicyReplayResponse(**asdict(report))
+
+
 @router.post("/policies/{policy_id}/toggle")
 async def toggle_policy(
     policy_id: str,
@@ -92,5 +171,7 @@ async def toggle_policy(
         if not p:
             raise HTTPException(status_code=404, detail="Policy not found")
         p.enabled = enabled
+        await policy_cache.publish_change(session, ctx.tenant_id)
         await session.commit()
+        policy_cache.invalidate(ctx.tenant_id)
         return {"ok": True, "enabled": enabled, "policy_id": policy_id}
@@ -0,0 +1,57 @@
+"""Per-tenant risk pipeline stage settings."""
+from datetime import datetime
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.api.deps import AuthContext, require_auth, require_scope
+from app.api.schemas import RiskStageUpdate
+from app.db.models import RiskStageSetting
+from app.db.session import async_session
+from app.services.policy_cache import policy_cache
+from app.services.risk import RISK_STAGES
+
+router = APIRouter()
+
+
+@router.get("/risk/stages")
+async def list_risk_stages(ctx: AuthContext = Depends(require_auth)):
+    """Registered risk stages in run order, with the tenant's settings. Requires admin scope."""
+    require_scope(ctx, "admin")
+
+    snapshot = await policy_cache.get(ctx.tenant_id)
+    return [
+        {"name": name, "enabled": name not in snapshot.disabled_stages, **stage.stats()}
+        for name, stage in RISK_STAGES.items()
+    ]
+
+
+@router.put("/risk/stages/{name}")
+async def update_risk_stage(
+    name: str,
+    body: RiskStageUpdate,
+    ctx: AuthContext = Depends(require_auth),
+):
+    """Enable or disable a risk stage for the tenant. Requires admin scope."""
+    require_scope(ctx, "admin")
+
+    if name not in RISK_STAGES:
+        raise HTTPException(status_code=404, detail="Unknown risk stage")
+
+    async with async_session() as session:
+        stmt = pg_insert(RiskStageSetting).values(
+            tenant_id=UUID(ctx.tenant_id),
+            stage=name,
+            enabled=body.enabled,
+            updated_at=datetime.utcnow(),
+        )
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_risk_stage_tenant_stage",
+            set_={"enabled": stmt.excluded.enabled, "updated_at": stmt.excluded.updated_at},
+        )
+        await session.execute(stmt)
+        await policy_cache.publish_change(session, ctx.tenant_id)
+        await session.commit()
+    policy_cache.invalidate(ctx.tenant_id)
+    return {"ok": True, "name": name, "enabled": body.enabled}
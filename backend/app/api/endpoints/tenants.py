@@ -5,9 +5,9 @@ from fastapi import APIRouter, Depends, Header, HTTPException
 from sqlalchemy import select
 
 from app.api.deps import AuthContext, require_auth, require_scope
-from app.api.schemas import ApiKeyCreate, ApiKeyCreated, TenantCreate
+from app.api.schemas import ApiKeyCreate, ApiKeyCreated, ApiKeyUpdate, TenantCreate
 from app.core.config import settings
-from app.core.security import generate_api_key, hash_api_key
+from app.core.security import api_key_cache, generate_api_key, hash_api_key
 from app.db.models import ApiKey, Tenant
 from app.db.session import async_session
 
@@ -59,6 +59,8 @@ async def create_api_key(
         session.add(ak)
         await session.commit()
         await session.refresh(ak)
+    # In case the key was looked up (and negatively cached) before it existed
+    await api_key_cache.forget(ak.key_hash)
 
     return ApiKeyCreated(
         api_key=raw,
@@ -66,3 +68,42 @@ async def create_api_key(
         tenant_id=tenant_id,
         scopes=body.scopes,
     )
+
+
+@router.patch("/tenants/{tenant_id}/api-keys/{api_key_id}")
+async def update_api_key(
+    tenant_id: str,
+    api_key_id: str,
+    body: ApiKeyUpdate,
+    ctx: AuthContext = Depends(require_auth),
+):
+    """Re-scope or deactivate an API key. Requires admin scope. Same-tenant only."""
+    require_scope(ctx, "admin")
+    if tenant_id != ctx.tenant_id:
+        raise HTTPException(status_code=403, detail="Cross-tenant forbidden")
+
+    try:
+        kid = UUID(api_key_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid API key ID")
+
+    async with async_session() as session:
+        result = await session.execute(
+            select(ApiKey).where(
+                ApiKey.id == kid,
+                ApiKey.tenant_id == UUID(tenant_id),
+            )
+        )
+        ak = result.scalar_one_or_none()
+        if not ak:
+            raise HTTPException(status_code=404, detail="API key not found")
+        if body.scopes is not None:
+            ak.scopes = body.scopes
+        if body.is_active is not None:
+            ak.is_active = body.is_active
+        # Other workers drop the key from their caches on commit
+        await api_key_cache.publish_change(session, ak.key_hash)
+        await session.commit()
+    await api_key_cache.forget(ak.key_hash)
+
+    return {"ok": True, "api_key_id": api_key_id, "scopes": ak.scopes, "is_active": ak.is_active}
@@ -1,7 +1,7 @@
 """API route aggregation."""
 from fastapi import APIRouter
 
-from app.api.endpoints import approvals, audit, evaluate, policies, tenants
+from app.api.endpoints import approvals, audit, evaluate, metrics, policies, risk, tenants
 
 router = APIRouter(prefix="/v1")
 router.include_router(evaluate.router, tags=["evaluate"])
@@ -9,3 +9,5 @@ router.include_router(approvals.router, tags=["approvals"])
 router.include_router(policies.router, tags=["policies"])
 router.include_router(audit.router, tags=["audit"])
 router.include_router(tenants.router, tags=["tenants"])
+router.include_router(risk.router, tags=["risk"])
+router.include_router(metrics.router, tags=["metrics"])
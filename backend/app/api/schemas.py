@@ -1,7 +1,8 @@
 """Pydantic request/response schemas."""
+from datetime import datetime
 from typing import Any, Literal
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 
 ActionType = Literal["tool_call", "aws_api", "codegen", "other"]
 Decision = Literal["ALLOW", "DENY", "REQUIRE_APPROVAL"]
@@ -34,6 +35,32 @@ class EvaluateResponse(BaseModel):
     approval_id: str | None = None
 
 
+class IdempotencyKeyField(BaseModel):
+    idempotency_key: str | None = Field(default=None, max_length=200)
+
+    @field_validator("idempotency_key")
+    @classmethod
+    def _blank_key_is_none(cls, v: str | None) -> str | None:
+        return v if v and v.strip() else None
+
+
+class EvaluateBatchItem(EvaluateRequest, IdempotencyKeyField):
+    pass
+
+
+class EvaluateBatchRequest(BaseModel):
+    items: list[EvaluateBatchItem] = Field(min_length=1)
+
+
+class EvaluateBatchResponse(BaseModel):
+    results: list[EvaluateResponse]
+
+
+class EvaluateStreamMessage(IdempotencyKeyField):
+    id: Any = None
+    request: EvaluateRequest
+
+
 class ApprovalResponse(BaseModel):
     id: str
     status: str
@@ -55,6 +82,26 @@ class PolicyUpsert(BaseModel):
     dsl: dict
 
 
+class RiskStageUpdate(BaseModel):
+    enabled: bool
+
+
+class PolicyReplayRequest(PolicyUpsert):
+    since: datetime | None = None
+    limit: int | None = Field(default=None, ge=1)
+    sample_size: int = Field(default=20, ge=0, le=200)
+
+
+class PolicyReplayResponse(BaseModel):
+    total: int
+    flipped: int
+    by_transition: dict[str, int]
+    by_rule: dict[str, int]
+    by_actor: dict[str, int]
+    by_tool: dict[str, int]
+    samples: list[dict]
+
+
 class TenantCreate(BaseModel):
     name: str
 
@@ -64,6 +111,11 @@ class ApiKeyCreate(BaseModel):
     scopes: list[str] = Field(default_factory=list)
 
 
+class ApiKeyUpdate(BaseModel):
+    scopes: list[str] | None = None
+    is_active: bool | None = None
+
+
 class ApiKeyCreated(BaseModel):
     api_key: str
     api_key_id: str
@@ -15,9 +15,84 @@ class Settings(BaseSettings):
     API_KEY_PREFIX: str = "ash_live_"
     ADMIN_BOOTSTRAP_SECRET: str = "change-me"
 
+    # API key auth cache: entries and TTL for valid keys, and for unknown keys
+    AUTH_CACHE_SIZE: int = 10000
+    AUTH_CACHE_TTL: int = 60
+    AUTH_NEGATIVE_CACHE_SIZE: int = 10000
+    AUTH_NEGATIVE_TTL: int = 10
+
+    # Seconds between batched API key last_used_at writes (0 = only on shutdown)
+    API_KEY_USAGE_FLUSH_INTERVAL: int = 30
+
     IDEMPOTENCY_TTL: int = 86400
+    # Rendered responses kept per worker for idempotent retries (0 = no cache)
+    IDEMPOTENCY_CACHE_SIZE: int = 20000
+    IDEMPOTENCY_CACHE_TTL: int = 3600
+    # Seconds between expiry runs for keys older than IDEMPOTENCY_TTL (0 = off), rows per batch
+    IDEMPOTENCY_EXPIRY_INTERVAL: int = 300
+    IDEMPOTENCY_EXPIRY_BATCH: int = 1000
     APPROVAL_WAIT_TIMEOUT: int = 15
 
+    # Max actions per POST /v1/evaluate/batch
+    EVALUATE_BATCH_MAX_ITEMS: int = 100
+    # Messages evaluated concurrently per /v1/evaluate/stream connection
+    EVALUATE_STREAM_MAX_INFLIGHT: int = 64
+
+    # Write-behind audit journal for ALLOW/DENY without Idempotency-Key (empty dir = off):
+    # seconds between drains into Postgres, rows per INSERT, fsync every append
+    AUDIT_JOURNAL_DIR: str = ""
+    AUDIT_JOURNAL_FLUSH_INTERVAL: float = 1.0
+    AUDIT_JOURNAL_BATCH: int = 1000
+    AUDIT_JOURNAL_FSYNC: bool = True
+    # Payload hashes each worker remembers as already stored (skips their INSERT)
+    PAYLOAD_STORE_CACHE_SIZE: int = 50000
+    # Payloads over this many bytes of JSON are zlib-compressed out of row (0 = never);
+    # their row keeps a preview with strings cut to PAYLOAD_PREVIEW_CHARS
+    PAYLOAD_COMPRESS_THRESHOLD: int = 16384
+    PAYLOAD_PREVIEW_CHARS: int = 256
+
+    # Max seconds a cached policy snapshot is trusted without a NOTIFY (0 = no cache)
+    POLICY_CACHE_TTL: int = 300
+
+    # Memoized policy decisions: max entries across tenants and entry TTL (0 = no TTL)
+    POLICY_MEMO_SIZE: int = 50000
+    POLICY_MEMO_TTL: int = 600
+
+    # Seconds between per-rule stats flushes and rule re-ordering
+    RULE_STATS_FLUSH_INTERVAL: int = 60
+
+    # Policy replay: process pool size (0 = in-process) and rows per chunk
+    REPLAY_WORKERS: int = 4
+    REPLAY_CHUNK_SIZE: int = 5000
+    # Rows replayed per POST /v1/policies/replay when no limit is given, and the max limit
+    REPLAY_DEFAULT_LIMIT: int = 100000
+    REPLAY_MAX_LIMIT: int = 1000000
+
+    # Risk signature library file (empty = bundled app/data/risk_signatures.json)
+    RISK_SIGNATURES_PATH: str = ""
+
+    # Max values / characters of tool_args or params visited per risk scan
+    RISK_SCAN_MAX_NODES: int = 10000
+    RISK_SCAN_MAX_CHARS: int = 1_000_000
+
+    # Cached risk scores keyed on scanned content (0 = no cache)
+    RISK_CACHE_SIZE: int = 20000
+
+    # Risk scans of payloads with at least RISK_OFFLOAD_MIN_CHARS of text run in a
+    # process pool (0 workers = always inline), bounded queue, per-scan deadline
+    RISK_POOL_WORKERS: int = 2
+    RISK_OFFLOAD_MIN_CHARS: int = 65536
+    RISK_POOL_QUEUE_SIZE: int = 32
+    RISK_SCAN_TIMEOUT: float = 2.0
+
+    # Default per-stage budgets of the risk pipeline: characters a stage may
+    # inspect (past it the stage stops and the score is floored at the
+    # approval threshold) and time before a run counts as over_budget in
+    # metrics; and modules that register custom stages (comma-separated)
+    RISK_STAGE_MAX_CHARS: int = 1_000_000
+    RISK_STAGE_BUDGET_MS: float = 50.0
+    RISK_STAGE_MODULES: str = ""
+
     CORS_ORIGINS: str = "http://localhost:3000,http://localhost:8080"
 
 
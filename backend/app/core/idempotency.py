@@ -1,26 +1,244 @@
 """Idempotency lookup for safe agent retries."""
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Hashable, TypeVar
 from uuid import UUID
 
-from sqlalchemy import select
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db.models import Evaluation
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.core.redis import shared_redis
+from app.db.models import ApprovalRequest, Evaluation
 from app.db.session import async_session
 
+_REDIS_PREFIX = "agentshield:idem:"
 
-async def get_by_idempotency(tenant_id: str, idempotency_key: str) -> Evaluation | None:
-    """Return existing evaluation for tenant + idempotency key, if any."""
-    if not idempotency_key or not idempotency_key.strip():
-        return None
-    try:
-        tid = UUID(tenant_id)
-    except (ValueError, TypeError):
-        return None
+T = TypeVar("T")
 
+
+def idempotency_cutoff() -> datetime:
+    """Evaluations created before this no longer hold their idempotency key."""
+    return datetime.utcnow() - timedelta(seconds=settings.IDEMPOTENCY_TTL)
+
+
+def render_evaluation(ev: Evaluation, approval_id: str | None) -> dict[str, Any]:
+    """The EvaluateResponse fields a retry of ev gets back."""
+    return {
+        "decision": ev.decision,
+        "reason": ev.reason,
+        "risk_score": ev.risk_score,
+        "risk_signals": ev.risk_signals or [],
+        "policy_hits": ev.policy_hits or [],
+        "evaluation_id": str(ev.id),
+        "approval_id": approval_id,
+    }
+
+
+class IdempotencyCache:
+    """
+    Rendered responses per (tenant, idempotency key), stored when the
+    evaluation is written so retries are answered without touching the DB.
+    Shared across workers via Redis when REDIS_URL is set; a miss falls back
+    to one query joining the evaluation with its approval request.
+    """
+
+    def __init__(self, maxsize: int):
+        self._cache = LRUCache(maxsize=maxsize, ttl=settings.IDEMPOTENCY_CACHE_TTL)
+        self.redis_hits = 0
+        self.db_hits = 0
+
+    async def get(
+        self, tenant_id: str, idempotency_key: str, session: AsyncSession | None = None
+    ) -> dict[str, Any] | None:
+        return (await self.get_many(tenant_id, [idempotency_key], session)).get(idempotency_key)
+
+    async def get_many(
+        self, tenant_id: str, idempotency_keys: list[str], session: AsyncSession | None = None
+    ) -> dict[str, dict[str, Any]]:
+        """
+        Responses for those of idempotency_keys that were used; misses share
+        one query, run on session when given (e.g. the one holding the key
+        locks) and on a session of its own otherwise.
+        """
+        found: dict[str, dict[str, Any]] = {}
+        missing = []
+        for idem_key in dict.fromkeys(idempotency_keys):
+            response = self._cache.get((tenant_id, idem_key))
+            if response is not None:
+                found[idem_key] = response
+            else:
+                missing.append(idem_key)
+
+        redis = shared_redis.client() if missing else None
+        if redis is not None:
+            # Each value with its remaining lifetime, in one round trip
+            pipe = redis.pipeline(transaction=False)
+            for k in missing:
+                pipe.get(f"{_REDIS_PREFIX}{tenant_id}:{k}")
+                pipe.pttl(f"{_REDIS_PREFIX}{tenant_id}:{k}")
+            try:
+                replies = await pipe.execute()
+            except Exception:
+                shared_redis.failed()
+                replies = [None, -2] * len(missing)
+            still_missing = []
+            for idem_key, raw, pttl in zip(missing, replies[::2], replies[1::2]):
+                if raw is None:
+                    still_missing.append(idem_key)
+                    continue
+                self.redis_hits += 1
+                found[idem_key] = json.loads(raw)
+                # Never outlive the Redis entry, which expires with the key
+                ttl = settings.IDEMPOTENCY_CACHE_TTL
+                if pttl > 0:
+                    ttl = min(pttl / 1000, ttl)
+                self._cache.set((tenant_id, idem_key), found[idem_key], ttl=ttl)
+            missing = still_missing
+
+        if not missing:
+            return found
+        try:
+            tid = UUID(tenant_id)
+        except (ValueError, TypeError):
+            return found
+        cutoff = idempotency_cutoff()
+        stmt = (
+            select(Evaluation, ApprovalRequest.id)
+            .outerjoin(ApprovalRequest, ApprovalRequest.evaluation_id == Evaluation.id)
+            .where(
+                Evaluation.tenant_id == tid,
+                Evaluation.idempotency_key.in_(missing),
+                Evaluation.created_at >= cutoff,
+            )
+        )
+        if session is not None:
+            rows = (await session.execute(stmt)).all()
+        else:
+            async with async_session() as own:
+                rows = (await own.execute(stmt)).all()
+        for ev, approval_id in rows:
+            if ev.idempotency_key in found:
+                continue
+            self.db_hits += 1
+            response = render_evaluation(ev, str(approval_id) if approval_id else None)
+            remaining = (ev.created_at - cutoff).total_seconds()
+            await self.set(tenant_id, ev.idempotency_key, response, ttl=remaining)
+            found[ev.idempotency_key] = response
+        return found
+
+    async def set(
+        self, tenant_id: str, idempotency_key: str, response: dict[str, Any], ttl: float | None = None
+    ) -> None:
+        """Cache a response for ttl seconds (default: the full IDEMPOTENCY_TTL)."""
+        ttl = settings.IDEMPOTENCY_TTL if ttl is None else ttl
+        if ttl <= 0:
+            return
+        self._cache.set((tenant_id, idempotency_key), response, ttl=min(ttl, settings.IDEMPOTENCY_CACHE_TTL))
+        redis = shared_redis.client()
+        if redis is None:
+            return
+        try:
+            await redis.set(
+                f"{_REDIS_PREFIX}{tenant_id}:{idempotency_key}",
+                json.dumps(response),
+                ex=max(int(ttl), 1),
+            )
+        except Exception:
+            shared_redis.failed()
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> dict[str, Any]:
+        return {**self._cache.stats(), "redis_hits": self.redis_hits, "db_hits": self.db_hits}
+
+
+idempotency_cache = IdempotencyCache(maxsize=settings.IDEMPOTENCY_CACHE_SIZE)
+
+
+async def lock_idempotency_key(session: AsyncSession, tenant_id: str, idempotency_key: str) -> None:
+    """
+    Take a transaction-scoped advisory lock on (tenant, key), so workers
+    evaluating the same key run one after another. Released on commit.
+    """
+    digest = hashlib.blake2b(f"{tenant_id}:{idempotency_key}".encode("utf-8"), digest_size=8).digest()
+    await session.execute(select(func.pg_advisory_xact_lock(int.from_bytes(digest, "big", signed=True))))
+
+
+def is_idempotency_conflict(exc: IntegrityError) -> bool:
+    """Whether exc is a unique violation on an evaluation's (tenant, idempotency key)."""
+    return "uq_eval_tenant_idempotency" in str(exc.orig)
+
+
+async def release_expired_keys(tenant_id: str, idempotency_keys: list[str]) -> int:
+    """
+    Release keys still held by evaluations past IDEMPOTENCY_TTL that the
+    expiry task has not reached yet, so they can be reused. Only called when
+    an INSERT collides with one. Returns the number of rows cleared.
+    """
     async with async_session() as session:
         result = await session.execute(
-            select(Evaluation).where(
-                Evaluation.tenant_id == tid,
-                Evaluation.idempotency_key == idempotency_key,
+            update(Evaluation)
+            .where(
+                Evaluation.tenant_id == UUID(tenant_id),
+                Evaluation.idempotency_key.in_(idempotency_keys),
+                Evaluation.created_at < idempotency_cutoff(),
             )
+            .values(idempotency_key=None)
+            .execution_options(synchronize_session=False)
         )
-        return result.scalar_one_or_none()
+        await session.commit()
+    return result.rowcount
+
+
+class _LeaderCancelled(Exception):
+    """The call a SingleFlight follower was waiting on was cancelled."""
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share one execution and its result."""
+
+    def __init__(self) -> None:
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+        self.coalesced = 0
+
+    async def run(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        while (fut := self._inflight.get(key)) is not None:
+            self.coalesced += 1
+            try:
+                # Shielded: a cancelled follower must not cancel the shared call
+                return await asyncio.shield(fut)
+            except _LeaderCancelled:
+                # The leader's caller went away; the first follower takes over
+                continue
+
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            # Only the leader is cancelled: followers re-run fn rather than inherit it
+            fut.set_exception(_LeaderCancelled())
+            fut.exception()
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            # Followers (if any) re-raise it; don't warn when there are none
+            fut.exception()
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            del self._inflight[key]
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+
+idempotency_flights = SingleFlight()
@@ -0,0 +1,55 @@
+"""Optional shared Redis client, used when REDIS_URL is set."""
+from __future__ import annotations
+
+import logging
+import time
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # pragma: no cover
+    aioredis = None
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Keep Redis off the request's critical path when it is slow or down
+_SOCKET_TIMEOUT = 0.25
+_RETRY_AFTER = 30.0
+
+
+class SharedRedis:
+    """
+    Lazily connected Redis client. After an error, callers get None for
+    _RETRY_AFTER seconds and fall back to their local caches and the DB.
+    """
+
+    def __init__(self) -> None:
+        self._client = None
+        self._down_until = 0.0
+        self.errors = 0
+
+    def client(self):
+        if not settings.REDIS_URL or aioredis is None or time.monotonic() < self._down_until:
+            return None
+        if self._client is None:
+            self._client = aioredis.from_url(
+                settings.REDIS_URL,
+                socket_timeout=_SOCKET_TIMEOUT,
+                socket_connect_timeout=_SOCKET_TIMEOUT,
+                decode_responses=True,
+            )
+        return self._client
+
+    def failed(self) -> None:
+        self.errors += 1
+        self._down_until = time.monotonic() + _RETRY_AFTER
+        logger.warning("Redis unavailable, using local caches for %ss", _RETRY_AFTER, exc_info=True)
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+shared_redis = SharedRedis()
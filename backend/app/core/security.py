@@ -1,15 +1,25 @@
 """API key generation, hashing, and authentication."""
 import hashlib
 import hmac
+import json
 import secrets
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
+from typing import Any
 
-from sqlalchemy import select
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.cache import LRUCache
 from app.core.config import settings
+from app.core.redis import shared_redis
 from app.db.models import ApiKey
 from app.db.session import async_session
 
+API_KEY_NOTIFY_CHANNEL = "agentshield_api_key_changed"
+_REDIS_PREFIX = "agentshield:apikey:"
+# Redis marker for an unknown or inactive key
+_UNKNOWN = "-"
+
 
 def generate_api_key(prefix: str | None = None) -> str:
     """Generate a URL-safe random API key with optional prefix."""
@@ -35,13 +45,123 @@ class AuthContext:
     scopes: list[str]
 
 
+class ApiKeyCache:
+    """
+    key_hash -> AuthContext for active keys (AUTH_CACHE_TTL), plus a separate
+    short-lived negative cache of unknown keys (AUTH_NEGATIVE_TTL) so a flood
+    of bad keys neither reaches the DB nor evicts valid ones. With REDIS_URL
+    set, entries are shared by all workers. Deactivating or re-scoping a key
+    drops it everywhere via Postgres NOTIFY (see publish_change).
+    """
+
+    def __init__(self) -> None:
+        self._known = LRUCache(maxsize=settings.AUTH_CACHE_SIZE, ttl=settings.AUTH_CACHE_TTL)
+        self._unknown = LRUCache(maxsize=settings.AUTH_NEGATIVE_CACHE_SIZE, ttl=settings.AUTH_NEGATIVE_TTL)
+        self.generation = 0
+        self.redis_hits = 0
+
+    async def get(self, key_hash: str) -> tuple[bool, AuthContext | None]:
+        """(found, ctx): found is False on a miss; ctx is None for a cached unknown key."""
+        ctx = self._known.get(key_hash)
+        if ctx is not None:
+            return True, ctx
+        if self._unknown.get(key_hash):
+            return True, None
+
+        redis = shared_redis.client()
+        if redis is None:
+            return False, None
+        try:
+            raw = await redis.get(_REDIS_PREFIX + key_hash)
+        except Exception:
+            shared_redis.failed()
+            return False, None
+        if raw is None:
+            return False, None
+        self.redis_hits += 1
+        ctx = None if raw == _UNKNOWN else AuthContext(**json.loads(raw))
+        self._store_local(key_hash, ctx)
+        return True, ctx
+
+    async def set(self, key_hash: str, ctx: AuthContext | None, generation: int) -> None:
+        """Cache a DB lookup started at generation, unless an invalidation raced with it."""
+        if generation != self.generation:
+            return
+        self._store_local(key_hash, ctx)
+
+        redis = shared_redis.client()
+        if redis is None:
+            return
+        ttl = settings.AUTH_CACHE_TTL if ctx else settings.AUTH_NEGATIVE_TTL
+        try:
+            await redis.set(
+                _REDIS_PREFIX + key_hash,
+                json.dumps(asdict(ctx)) if ctx else _UNKNOWN,
+                ex=max(int(ttl), 1),
+            )
+        except Exception:
+            shared_redis.failed()
+
+    def _store_local(self, key_hash: str, ctx: AuthContext | None) -> None:
+        if ctx is None:
+            self._unknown.set(key_hash, True)
+        else:
+            self._known.set(key_hash, ctx)
+
+    def invalidate(self, key_hash: str | None = None) -> None:
+        """Drop one key from this worker's cache, or all keys if key_hash is None."""
+        self.generation += 1
+        if key_hash is None:
+            self._known.clear()
+            self._unknown.clear()
+        else:
+            self._known.pop(key_hash)
+            self._unknown.pop(key_hash)
+
+    async def publish_change(self, session: AsyncSession, key_hash: str) -> None:
+        """
+        Queue a NOTIFY for other workers in the caller's transaction.
+        Postgres delivers it on commit; call forget() after committing.
+        """
+        await session.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": API_KEY_NOTIFY_CHANNEL, "payload": key_hash},
+        )
+
+    async def forget(self, key_hash: str) -> None:
+        """Drop a changed key from this worker's cache and from Redis."""
+        self.invalidate(key_hash)
+        redis = shared_redis.client()
+        if redis is None:
+            return
+        try:
+            await redis.delete(_REDIS_PREFIX + key_hash)
+        except Exception:
+            shared_redis.failed()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "known": self._known.stats(),
+            "unknown": self._unknown.stats(),
+            "redis_hits": self.redis_hits,
+            "redis_errors": shared_redis.errors,
+        }
+
+
+api_key_cache = ApiKeyCache()
+
+
 async def authenticate_api_key(raw_key: str) -> AuthContext | None:
-    """Validate API key and return auth context if valid."""
+    """Validate API key and return auth context if valid (cached, see ApiKeyCache)."""
     if not raw_key or not raw_key.strip():
         return None
 
     key_hash = hash_api_key(raw_key)
+    found, ctx = await api_key_cache.get(key_hash)
+    if found:
+        return ctx
 
+    generation = api_key_cache.generation
     async with async_session() as session:
         result = await session.execute(
             select(ApiKey).where(
@@ -50,11 +170,13 @@ async def authenticate_api_key(raw_key: str) -> AuthContext | None:
             )
         )
         api_key = result.scalar_one_or_none()
-        if not api_key:
-            return None
 
-        return AuthContext(
+    ctx = None
+    if api_key:
+        ctx = AuthContext(
             tenant_id=str(api_key.tenant_id),
             api_key_id=str(api_key.id),
             scopes=api_key.scopes or [],
         )
+    await api_key_cache.set(key_hash, ctx, generation)
+    return ctx
@@ -2,9 +2,20 @@
 import uuid
 from datetime import datetime
 
-from sqlalchemy import Boolean, DateTime, ForeignKey, Integer, String, UniqueConstraint
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    UniqueConstraint,
+    select,
+)
 from sqlalchemy.dialects.postgresql import JSONB, UUID
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+from sqlalchemy.orm import DeclarativeBase, Mapped, column_property, mapped_column
 
 
 def utcnow() -> datetime:
@@ -55,6 +66,29 @@ class Policy(Base):
     __table_args__ = (UniqueConstraint("tenant_id", "name", name="uq_policy_tenant_name"),)
 
 
+class RequestPayload(Base):
+    """An evaluated request body, stored once per tenant and content hash (see
+    payload_store.request_hash) and shared by that tenant's evaluations."""
+
+    __tablename__ = "request_payloads"
+
+    hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    # The full body, or a preview with long strings cut when compressed is set
+    payload: Mapped[dict] = mapped_column(JSONB, nullable=False)
+    compressed: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=utcnow, nullable=False)
+
+
+class RequestPayloadBlob(Base):
+    """The full body of an oversized request payload, zlib-compressed JSON."""
+
+    __tablename__ = "request_payload_blobs"
+
+    hash: Mapped[str] = mapped_column(String(64), ForeignKey("request_payloads.hash"), primary_key=True)
+    data: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    size: Mapped[int] = mapped_column(Integer, nullable=False)
+
+
 class Evaluation(Base):
     __tablename__ = "evaluations"
 
@@ -72,8 +106,21 @@ class Evaluation(Base):
     aws_service: Mapped[str | None] = mapped_column(String(80), nullable=True)
     aws_operation: Mapped[str | None] = mapped_column(String(120), nullable=True)
 
-    request_payload: Mapped[dict] = mapped_column(JSONB, nullable=False)
-    request_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    request_hash: Mapped[str] = mapped_column(String(64), ForeignKey("request_payloads.hash"), nullable=False)
+    risk_signals: Mapped[list] = mapped_column(JSONB, default=list, nullable=False)
+    # The request body (a preview if compressed), joined from request_payloads;
+    # only loaded when asked for (undefer() or selecting the column), never lazily
+    request_payload: Mapped[dict] = column_property(
+        select(RequestPayload.payload).where(RequestPayload.hash == request_hash).scalar_subquery(),
+        deferred=True,
+        raiseload=True,
+    )
+    # The compressed full body of an oversized payload, else None (see payload_store.inflate)
+    request_payload_blob: Mapped[bytes | None] = column_property(
+        select(RequestPayloadBlob.data).where(RequestPayloadBlob.hash == request_hash).scalar_subquery(),
+        deferred=True,
+        raiseload=True,
+    )
 
     decision: Mapped[str] = mapped_column(String(30), nullable=False)
     reason: Mapped[str] = mapped_column(String(500), nullable=False)
@@ -84,6 +131,12 @@ class Evaluation(Base):
 
     __table_args__ = (
         UniqueConstraint("tenant_id", "idempotency_key", name="uq_eval_tenant_idempotency"),
+        # Finds idempotency keys past IDEMPOTENCY_TTL for expiry
+        Index(
+            "ix_eval_idempotency_created_at",
+            "created_at",
+            postgresql_where=idempotency_key.isnot(None),
+        ),
     )
 
 
@@ -92,7 +145,9 @@ class ApprovalRequest(Base):
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     tenant_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("tenants.id"), nullable=False)
-    evaluation_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("evaluations.id"), nullable=False)
+    evaluation_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("evaluations.id"), nullable=False, index=True
+    )
 
     status: Mapped[str] = mapped_column(String(30), default="PENDING", nullable=False)
     approver: Mapped[str | None] = mapped_column(String(200), nullable=True)
@@ -100,3 +155,35 @@ class ApprovalRequest(Base):
 
     created_at: Mapped[datetime] = mapped_column(DateTime, default=utcnow, nullable=False)
     resolved_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+
+class RuleStat(Base):
+    __tablename__ = "rule_stats"
+
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    tenant_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("tenants.id"), nullable=False)
+
+    policy_name: Mapped[str] = mapped_column(String(200), nullable=False)
+    rule_name: Mapped[str] = mapped_column(String(200), nullable=False)
+    evaluated: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+    matched: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=utcnow, onupdate=utcnow, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("tenant_id", "policy_name", "rule_name", name="uq_rule_stats_tenant_rule"),
+    )
+
+
+class RiskStageSetting(Base):
+    __tablename__ = "risk_stage_settings"
+
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    tenant_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("tenants.id"), nullable=False)
+
+    stage: Mapped[str] = mapped_column(String(100), nullable=False)
+    enabled: Mapped[bool] = mapped_column(Boolean, default=True, nullable=False)
+
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=utcnow, onupdate=utcnow, nullable=False)
+
+    __table_args__ = (UniqueConstraint("tenant_id", "stage", name="uq_risk_stage_tenant_stage"),)
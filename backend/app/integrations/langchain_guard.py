@@ -4,10 +4,20 @@ Wrap LangChain tools so every invocation is gated by the security API.
 """
 from __future__ import annotations
 
+import asyncio
+import itertools
+import json
 from typing import Any, Callable
 
 import httpx
 
+try:
+    from websockets.asyncio.client import connect as ws_connect
+    from websockets.exceptions import ConnectionClosed
+except ImportError:  # pragma: no cover
+    ws_connect = None
+    ConnectionClosed = ConnectionError
+
 
 class AgentShieldClient:
     """HTTP client for AgentShield evaluate API."""
@@ -37,6 +47,99 @@ class AgentShieldClient:
             return r.json()
 
 
+class AgentShieldStreamClient:
+    """
+    Async client for the /v1/evaluate/stream WebSocket: one connection and
+    one API-key check for many evaluations. Concurrent evaluate() calls are
+    pipelined over the connection and resolved as replies arrive.
+    """
+
+    def __init__(self, base_url: str, api_key: str, timeout: float = 10.0):
+        self.url = base_url.rstrip("/").replace("http", "ws", 1) + "/v1/evaluate/stream"
+        self.api_key = api_key
+        self.timeout = timeout
+        self._ws = None
+        self._reader: asyncio.Task | None = None
+        self._pending: dict[str, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+        self._connecting = asyncio.Lock()
+
+    async def __aenter__(self) -> "AgentShieldStreamClient":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        await self.close()
+
+    async def connect(self) -> Any:
+        """Open the connection if it is not open, and return it."""
+        if ws_connect is None:
+            raise RuntimeError("AgentShieldStreamClient requires the websockets package")
+        async with self._connecting:
+            if self._ws is None:
+                self._ws = await ws_connect(
+                    self.url, additional_headers={"X-Api-Key": self.api_key}, open_timeout=self.timeout
+                )
+                self._reader = asyncio.create_task(self._read(self._ws))
+            return self._ws
+
+    async def _read(self, ws: Any) -> None:
+        error: Exception = ConnectionError("AgentShield stream closed")
+        try:
+            async for raw in ws:
+                message = json.loads(raw)
+                fut = self._pending.pop(str(message.get("id")), None)
+                if fut is None or fut.done():
+                    continue
+                if "error" in message:
+                    err = message["error"]
+                    fut.set_exception(RuntimeError(f"AgentShield error {err.get('status')}: {err.get('detail')}"))
+                else:
+                    fut.set_result(message["result"])
+        except Exception as e:
+            error = e
+        finally:
+            # Fail everything still waiting; the next evaluate() reconnects
+            if self._ws is ws:
+                self._ws = None
+            for fut in self._pending.values():
+                if not fut.done():
+                    fut.set_exception(error)
+            self._pending.clear()
+
+    async def evaluate(
+        self,
+        payload: dict[str, Any],
+        idempotency_key: str | None = None,
+    ) -> dict[str, Any]:
+        """Evaluate over the stream and return the decision."""
+        ws = await self.connect()
+        request_id = str(next(self._ids))
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = fut
+        message = {"id": request_id, "request": payload}
+        if idempotency_key:
+            message["idempotency_key"] = idempotency_key
+        try:
+            # The reader clears _ws once the connection is gone; it can't fail fut any more
+            if self._ws is not ws:
+                raise ConnectionError("AgentShield stream closed")
+            try:
+                await ws.send(json.dumps(message))
+            except ConnectionClosed as e:
+                raise ConnectionError("AgentShield stream closed") from e
+            return await asyncio.wait_for(fut, self.timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def close(self) -> None:
+        if self._ws is not None:
+            await self._ws.close()
+        if self._reader is not None:
+            await self._reader
+            self._reader = None
+
+
 def guard_tool(
     guard: AgentShieldClient,
     tool_name: str,
@@ -79,3 +182,47 @@ def guard_tool(
         return tool_fn(**kwargs)
 
     return wrapped
+
+
+def guard_tool_async(
+    guard: AgentShieldStreamClient,
+    tool_name: str,
+    tool_fn: Callable[..., Any],
+    *,
+    actor: str | None = None,
+    agent: str | None = None,
+    trace_id: str | None = None,
+) -> Callable[..., Any]:
+    """
+    Like guard_tool, for async agents: gate each call over a shared stream.
+
+    Example:
+        async with AgentShieldStreamClient("http://localhost:8080", "ash_live_...") as guard:
+            safe_shell = guard_tool_async(guard, "shell", shell_tool, actor="user-1")
+            await safe_shell(command="ls")
+    """
+
+    async def wrapped(**kwargs: Any) -> Any:
+        decision = await guard.evaluate(
+            {
+                "action_type": "tool_call",
+                "actor": actor,
+                "agent": agent,
+                "trace_id": trace_id,
+                "tool_name": tool_name,
+                "tool_args": kwargs,
+                "context": {},
+                "wait_for_approval": False,
+            },
+            idempotency_key=kwargs.get("idempotency_key"),
+        )
+        if decision["decision"] == "DENY":
+            raise RuntimeError(f"Blocked by AgentShield: {decision['reason']}")
+        if decision["decision"] == "REQUIRE_APPROVAL":
+            raise RuntimeError(
+                f"Approval required: approval_id={decision.get('approval_id')}"
+            )
+        result = tool_fn(**kwargs)
+        return await result if asyncio.iscoroutine(result) else result
+
+    return wrapped
@@ -7,7 +7,16 @@ from fastapi.middleware.cors import CORSMiddleware
 from app.api.routes import router as v1_router
 from app.core.config import settings
 from app.core.logging import setup_logging
+from app.core.redis import shared_redis
+from app.core.security import API_KEY_NOTIFY_CHANNEL, api_key_cache
 from app.db.init_db import init_db
+from app.services.audit_journal import audit_journal
+from app.services.idempotency_expiry import idempotency_expirer
+from app.services.key_usage import key_usage
+from app.services.policy_cache import policy_cache
+from app.services.replay import shutdown_replay_pool
+from app.services.risk_scanner import risk_scanner
+from app.services.rule_stats import rule_stats_flusher
 
 setup_logging()
 
@@ -15,7 +24,21 @@ setup_logging()
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await init_db()
+    policy_cache.subscribe(API_KEY_NOTIFY_CHANNEL, api_key_cache.invalidate)
+    policy_cache.start()
+    rule_stats_flusher.start()
+    key_usage.start()
+    idempotency_expirer.start()
+    await audit_journal.start()
     yield
+    await audit_journal.stop()
+    await idempotency_expirer.stop()
+    await key_usage.stop()
+    await rule_stats_flusher.stop()
+    await policy_cache.stop()
+    risk_scanner.shutdown()
+    shutdown_replay_pool()
+    await shared_redis.close()
 
 
 app = FastAPI(
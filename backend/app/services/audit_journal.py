@@ -0,0 +1,303 @@
+"""Write-behind audit journal: evaluations are appended locally, then drained into Postgres."""
+from __future__ import annotations
+
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.models import Evaluation
+from app.db.session import async_session
+from app.services.payload_store import payload_store, request_hash
+
+logger = logging.getLogger(__name__)
+
+_PATTERN = "audit-*.jsonl"
+# Rows Postgres refused are moved aside under this prefix for inspection
+_REJECTED_PREFIX = "rejected-"
+_COLUMNS = [c.key for c in Evaluation.__table__.columns]
+
+
+def _encode(ev: Evaluation, payload: dict[str, Any]) -> bytes:
+    row = {key: getattr(ev, key) for key in _COLUMNS}
+    # Carried alongside the row; drained into request_payloads
+    row["payload"] = payload
+    row["id"] = str(row["id"])
+    row["tenant_id"] = str(row["tenant_id"])
+    row["created_at"] = row["created_at"].isoformat()
+    return json.dumps(row, default=str).encode("utf-8") + b"\n"
+
+
+def _decode(line: bytes) -> dict[str, Any]:
+    row = json.loads(line)
+    if "payload" not in row:
+        # Written before payloads moved to request_payloads: the body, with
+        # risk_signals inside, was the request_payload column, and its hash
+        # did not include the tenant
+        payload = dict(row.pop("request_payload", None) or {})
+        row.setdefault("risk_signals", payload.pop("risk_signals", []))
+        row["payload"] = payload
+        row["request_hash"] = request_hash(row["tenant_id"], payload)
+    row["id"] = uuid.UUID(row["id"])
+    row["tenant_id"] = uuid.UUID(row["tenant_id"])
+    row["created_at"] = datetime.fromisoformat(row["created_at"])
+    return row
+
+
+def _try_lock(path: Path) -> int | None:
+    """
+    Open and exclusively lock path, or None if another process holds it or
+    it was drained and deleted while we waited for the lock.
+    """
+    try:
+        fd = os.open(path, os.O_RDWR)
+    except FileNotFoundError:
+        return None
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        st = os.stat(path)
+    except (BlockingIOError, FileNotFoundError):
+        os.close(fd)
+        return None
+    if os.path.samestat(st, os.fstat(fd)):
+        return fd
+    os.close(fd)
+    return None
+
+
+class AuditJournal:
+    """
+    Opt-in (AUDIT_JOURNAL_DIR) write-behind path for ALLOW/DENY evaluations.
+    Each worker appends rows to its own locked journal file and responds
+    without waiting for Postgres. Every AUDIT_JOURNAL_FLUSH_INTERVAL seconds
+    the file is sealed and drained with multi-row INSERTs; any journal not
+    locked by a live worker (including ones left by a crash) is drained on
+    startup and on every run. Rows keep their ids, so replaying a partly
+    drained journal inserts nothing twice. A file that fails to drain is
+    retried on the next run without holding up the others, and rows Postgres
+    rejects are set aside in rejected-*.jsonl files.
+
+    Appends are group-committed: lines arriving while a write is in flight
+    join the next one, and each group costs one write and one fsync, done in
+    a thread so a slow disk never blocks the event loop.
+    """
+
+    def __init__(self) -> None:
+        self._fd: int | None = None
+        self._path: Path | None = None
+        self._task: asyncio.Task | None = None
+        # Serializes file writes with sealing; guards _fd and _path
+        self._write_lock = asyncio.Lock()
+        self._group: list[bytes] | None = None
+        self._group_done: asyncio.Future | None = None
+        self._commits: set[asyncio.Task] = set()
+        self.appended = 0
+        self.writes = 0
+        self.drained = 0
+        self.rejected = 0
+        self.failures = 0
+        self.last_drain_ms = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(settings.AUDIT_JOURNAL_DIR)
+
+    def _directory(self) -> Path:
+        directory = Path(settings.AUDIT_JOURNAL_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        return directory
+
+    def _open(self) -> int:
+        if self._fd is None:
+            name = f"audit-{os.getpid()}-{uuid.uuid4().hex[:8]}.jsonl"
+            # Created and locked under a name drain() ignores, then renamed, so
+            # no other worker can lock (and drain and delete) it before we do
+            staging = self._directory() / f".{name}.open"
+            fd = os.open(staging, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o600)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            path = staging.with_name(name)
+            os.rename(staging, path)
+            self._fd, self._path = fd, path
+        return self._fd
+
+    async def append(self, ev: Evaluation, payload: dict[str, Any]) -> None:
+        """Durably record ev and its request payload (fsync'd when AUDIT_JOURNAL_FSYNC is set)."""
+        if self._group is None:
+            self._group = []
+            self._group_done = asyncio.get_running_loop().create_future()
+            task = asyncio.create_task(self._commit(self._group, self._group_done))
+            self._commits.add(task)
+            task.add_done_callback(self._commits.discard)
+        self._group.append(_encode(ev, payload))
+        # Shielded: a cancelled request must not cancel the group's write
+        await asyncio.shield(self._group_done)
+        self.appended += 1
+
+    async def _commit(self, lines: list[bytes], done: asyncio.Future) -> None:
+        async with self._write_lock:
+            # From here on, appends start the next group
+            self._group = self._group_done = None
+            try:
+                await asyncio.to_thread(self._write, b"".join(lines))
+            except Exception as e:
+                done.set_exception(e)
+                # Raised to the appenders; don't warn if they were all cancelled
+                done.exception()
+            else:
+                done.set_result(None)
+
+    def _write(self, data: bytes) -> None:
+        """Runs in a thread, under _write_lock."""
+        fd = self._open()
+        os.write(fd, data)
+        if settings.AUDIT_JOURNAL_FSYNC:
+            os.fsync(fd)
+        self.writes += 1
+
+    def _seal(self) -> None:
+        """Start a new journal file; the current one becomes drainable."""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = self._path = None
+
+    async def drain(self) -> int:
+        """Insert every unlocked journal into Postgres and delete it. Returns rows inserted."""
+        if not self.enabled:
+            return 0
+        start = time.monotonic()
+        async with self._write_lock:
+            self._seal()
+        total = 0
+        for path in sorted(self._directory().glob(_PATTERN)):
+            fd = _try_lock(path)
+            if fd is None:
+                continue
+            try:
+                total += await self._drain_file(path, fd)
+                # Already gone is fine: its rows are in Postgres either way
+                path.unlink(missing_ok=True)
+            except Exception:
+                # Left in place for the next run; the other files still drain
+                self.failures += 1
+                logger.warning("Draining audit journal %s failed", path, exc_info=True)
+            finally:
+                os.close(fd)
+        self.drained += total
+        self.last_drain_ms = round(1000 * (time.monotonic() - start), 3)
+        return total
+
+    async def _drain_file(self, path: Path, fd: int) -> int:
+        with os.fdopen(os.dup(fd), "rb") as f:
+            lines = f.read().splitlines()
+        rows = []
+        for n, line in enumerate(lines):
+            try:
+                rows.append((line, _decode(line)))
+            except (ValueError, KeyError, TypeError):
+                # A torn final line from a crash mid-write
+                logger.warning("Skipping unreadable audit journal line %s:%d", path, n + 1)
+
+        inserted = 0
+        stored: list[str] = []
+        rejected: list[bytes] = []
+        async with async_session() as session:
+            for i in range(0, len(rows), settings.AUDIT_JOURNAL_BATCH):
+                batch = rows[i : i + settings.AUDIT_JOURNAL_BATCH]
+                try:
+                    async with session.begin_nested():
+                        inserted += await self._insert(session, [row for _, row in batch], stored)
+                    continue
+                except Exception:
+                    logger.warning("Audit journal batch from %s failed, retrying row by row", path, exc_info=True)
+                # One bad row (e.g. a deleted tenant) fails the whole INSERT
+                for line, row in batch:
+                    try:
+                        async with session.begin_nested():
+                            inserted += await self._insert(session, [row], stored)
+                    except Exception:
+                        rejected.append(line)
+            await session.commit()
+        payload_store.remember(stored)
+        if rejected:
+            self._reject(path, rejected)
+        return inserted
+
+    async def _insert(self, session: AsyncSession, rows: list[dict[str, Any]], stored: list[str]) -> int:
+        """INSERT rows and their payloads; adds the payload hashes written to stored on success."""
+        payloads = {row["request_hash"]: row["payload"] for row in rows}
+        written = await payload_store.write(session, payloads)
+        values = [{k: v for k, v in row.items() if k != "payload"} for row in rows]
+        result = await session.execute(pg_insert(Evaluation).values(values).on_conflict_do_nothing())
+        stored += written
+        return result.rowcount
+
+    def _reject(self, path: Path, lines: list[bytes]) -> None:
+        """Set aside rows Postgres refused, so the journal can be deleted."""
+        target = path.with_name(_REJECTED_PREFIX + path.name)
+        with open(target, "ab") as f:
+            f.write(b"".join(line + b"\n" for line in lines))
+            f.flush()
+            os.fsync(f.fileno())
+        self.rejected += len(lines)
+        logger.error("Moved %d rejected audit journal rows to %s", len(lines), target)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.AUDIT_JOURNAL_FLUSH_INTERVAL)
+            try:
+                await self.drain()
+            except Exception:
+                self.failures += 1
+                logger.warning("Audit journal drain failed", exc_info=True)
+
+    async def start(self) -> None:
+        """Replay journals left undrained by earlier processes, then drain periodically."""
+        if not self.enabled:
+            return
+        try:
+            await self.drain()
+        except Exception:
+            self.failures += 1
+            logger.warning("Audit journal replay failed", exc_info=True)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._commits:
+            # Rows of requests still in flight are in the final drain
+            await asyncio.gather(*self._commits, return_exceptions=True)
+        try:
+            await self.drain()
+        except Exception:
+            logger.warning("Final audit journal drain failed", exc_info=True)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "appended": self.appended,
+            "writes": self.writes,
+            "drained": self.drained,
+            "rejected": self.rejected,
+            "failures": self.failures,
+            "last_drain_ms": self.last_drain_ms,
+        }
+
+
+audit_journal = AuditJournal()
@@ -0,0 +1,107 @@
+"""Background expiry of idempotency keys older than IDEMPOTENCY_TTL."""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any
+
+from sqlalchemy import select, update
+
+from app.core.config import settings
+from app.core.idempotency import idempotency_cutoff
+from app.db.models import Evaluation
+from app.db.session import async_session
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on batches per run; the rest waits for the next run
+_MAX_BATCHES = 100
+
+
+async def expire_idempotency_keys(batch_size: int | None = None) -> int:
+    """
+    Clear idempotency_key on evaluations past IDEMPOTENCY_TTL, batch_size
+    rows per transaction (rows locked elsewhere are skipped), so the unique
+    index only holds live keys. Returns the number of rows cleared.
+    """
+    batch_size = batch_size or settings.IDEMPOTENCY_EXPIRY_BATCH
+    cutoff = idempotency_cutoff()
+    total = 0
+    for _ in range(_MAX_BATCHES):
+        expired = (
+            select(Evaluation.id)
+            .where(Evaluation.idempotency_key.isnot(None), Evaluation.created_at < cutoff)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        async with async_session() as session:
+            result = await session.execute(
+                update(Evaluation)
+                .where(Evaluation.id.in_(expired))
+                .values(idempotency_key=None)
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+        total += result.rowcount
+        if result.rowcount < batch_size:
+            break
+        # Let request handlers run between batches
+        await asyncio.sleep(0)
+    return total
+
+
+class IdempotencyExpirer:
+    """Runs expire_idempotency_keys() every IDEMPOTENCY_EXPIRY_INTERVAL seconds."""
+
+    def __init__(self) -> None:
+        self._task: asyncio.Task | None = None
+        self.runs = 0
+        self.rows = 0
+        self.last_rows = 0
+        self.last_ms = 0.0
+        self.failures = 0
+
+    async def run_once(self) -> int:
+        start = time.monotonic()
+        rows = await expire_idempotency_keys()
+        self.runs += 1
+        self.rows += rows
+        self.last_rows = rows
+        self.last_ms = round(1000 * (time.monotonic() - start), 3)
+        return rows
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.IDEMPOTENCY_EXPIRY_INTERVAL)
+            try:
+                await self.run_once()
+            except Exception:
+                self.failures += 1
+                logger.warning("Idempotency key expiry failed", exc_info=True)
+
+    def start(self) -> None:
+        if self._task is None and settings.IDEMPOTENCY_EXPIRY_INTERVAL > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "runs": self.runs,
+            "rows": self.rows,
+            "last_rows": self.last_rows,
+            "last_ms": self.last_ms,
+            "failures": self.failures,
+        }
+
+
+idempotency_expirer = IdempotencyExpirer()
@@ -0,0 +1,91 @@
+"""Write-behind tracking of API key last_used_at."""
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime
+from uuid import UUID
+
+from sqlalchemy import DateTime, column, func, update, values
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+
+from app.core.config import settings
+from app.db.models import ApiKey
+from app.db.session import async_session
+
+logger = logging.getLogger(__name__)
+
+_FLUSH_BATCH = 1000
+
+
+class KeyUsageRecorder:
+    """
+    Latest use per API key, kept in memory by record() and written by
+    flush() as one UPDATE ... FROM (VALUES ...) per batch of keys. A
+    background task flushes every API_KEY_USAGE_FLUSH_INTERVAL seconds,
+    which bounds how stale last_used_at can be; stop() flushes the rest.
+    """
+
+    def __init__(self) -> None:
+        self._pending: dict[str, datetime] = {}
+        self._task: asyncio.Task | None = None
+        self.flushed = 0
+
+    def record(self, api_key_id: str) -> None:
+        self._pending[api_key_id] = datetime.utcnow()
+
+    async def flush(self) -> int:
+        """Write pending usage. Returns the number of keys updated."""
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        rows = [(UUID(key_id), used_at) for key_id, used_at in pending.items()]
+
+        try:
+            async with async_session() as session:
+                for i in range(0, len(rows), _FLUSH_BATCH):
+                    used = values(
+                        column("id", PG_UUID(as_uuid=True)), column("used_at", DateTime), name="used"
+                    ).data(rows[i : i + _FLUSH_BATCH])
+                    await session.execute(
+                        update(ApiKey)
+                        .where(ApiKey.id == used.c.id)
+                        # Other workers flush too: never move last_used_at backwards
+                        .values(last_used_at=func.greatest(ApiKey.last_used_at, used.c.used_at))
+                    )
+                await session.commit()
+        except Exception:
+            # Keep the usage for the next flush unless the key was used again since
+            for key_id, used_at in pending.items():
+                self._pending.setdefault(key_id, used_at)
+            raise
+        self.flushed += len(rows)
+        return len(rows)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.API_KEY_USAGE_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception:
+                logger.warning("API key usage flush failed", exc_info=True)
+
+    def start(self) -> None:
+        if self._task is None and settings.API_KEY_USAGE_FLUSH_INTERVAL > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.warning("Final API key usage flush failed", exc_info=True)
+
+
+key_usage = KeyUsageRecorder()
@@ -0,0 +1,146 @@
+"""Content-addressed request payloads: each distinct body is written once per tenant."""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import zlib
+from typing import Any, Iterable
+
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.db.models import RequestPayload, RequestPayloadBlob
+
+
+def request_hash(tenant_id: str | UUID, payload: dict[str, Any]) -> str:
+    """
+    The request_payloads key of a tenant's request body. The tenant is part
+    of the hash, so tenants never share a payload row and can't tell (from
+    timing or counters) whether another tenant sent the same body.
+    """
+    raw = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(f"{tenant_id}:".encode("utf-8") + raw).hexdigest()
+
+
+def preview(value: Any, chars: int) -> Any:
+    """value with every string longer than chars cut, noting how much was dropped."""
+    if isinstance(value, str) and len(value) > chars:
+        return f"{value[:chars]}...[{len(value) - chars} more chars]"
+    if isinstance(value, dict):
+        return {k: preview(v, chars) for k, v in value.items()}
+    if isinstance(value, list):
+        return [preview(v, chars) for v in value]
+    return value
+
+
+def inflate(data: bytes) -> dict[str, Any]:
+    """The full payload from a request_payload_blobs row."""
+    return json.loads(zlib.decompress(data))
+
+
+def _compress_all(raws: dict[str, bytes]) -> dict[str, bytes]:
+    return {h: zlib.compress(raw) for h, raw in raws.items()}
+
+
+class PayloadStore:
+    """
+    Writes request payloads into request_payloads keyed by request_hash.
+    Hashes this worker has already committed are remembered, so repeats of
+    a payload skip the INSERT entirely; the rest are multi-row INSERT ... ON
+    CONFLICT DO NOTHING, which also covers payloads other workers wrote.
+    Payload rows are never deleted, so a remembered hash stays valid.
+
+    Payloads over PAYLOAD_COMPRESS_THRESHOLD bytes are compressed into
+    request_payload_blobs; their request_payloads row keeps a preview, so
+    scans stay small and only load() (or a select of the blob) pays for
+    decompression.
+    """
+
+    def __init__(self, maxsize: int):
+        self._stored = LRUCache(maxsize=maxsize)
+        self.written = 0
+        self.compressed = 0
+        self.compressed_bytes_in = 0
+        self.compressed_bytes_out = 0
+
+    async def write(self, session: AsyncSession, payloads: dict[str, dict[str, Any]]) -> list[str]:
+        """
+        INSERT those of payloads (hash -> body) not known to be stored, in
+        session's transaction. Returns their hashes, for remember() once the
+        transaction commits.
+        """
+        new = [h for h in payloads if self._stored.get(h) is None]
+        if not new:
+            return new
+
+        oversized = {}
+        threshold = settings.PAYLOAD_COMPRESS_THRESHOLD
+        if threshold > 0:
+            for h in new:
+                raw = json.dumps(payloads[h], default=str).encode("utf-8")
+                if len(raw) > threshold:
+                    oversized[h] = raw
+        blobs = {}
+        if oversized:
+            # zlib releases the GIL; keep large payloads off the event loop
+            blobs = await asyncio.to_thread(_compress_all, oversized)
+
+        chars = settings.PAYLOAD_PREVIEW_CHARS
+        rows = [
+            {
+                "hash": h,
+                "payload": preview(payloads[h], chars) if h in blobs else payloads[h],
+                "compressed": h in blobs,
+            }
+            for h in new
+        ]
+        await session.execute(pg_insert(RequestPayload).values(rows).on_conflict_do_nothing())
+        if blobs:
+            await session.execute(
+                pg_insert(RequestPayloadBlob)
+                .values([{"hash": h, "data": data, "size": len(oversized[h])} for h, data in blobs.items()])
+                .on_conflict_do_nothing()
+            )
+            self.compressed += len(blobs)
+            self.compressed_bytes_in += sum(len(raw) for raw in oversized.values())
+            self.compressed_bytes_out += sum(len(data) for data in blobs.values())
+        self.written += len(new)
+        return new
+
+    async def load(self, session: AsyncSession, request_hash: str) -> dict[str, Any] | None:
+        """The full payload for request_hash, decompressing it if it was stored out of row."""
+        result = await session.execute(
+            select(RequestPayload.payload, RequestPayloadBlob.data)
+            .outerjoin(RequestPayloadBlob, RequestPayloadBlob.hash == RequestPayload.hash)
+            .where(RequestPayload.hash == request_hash)
+        )
+        row = result.first()
+        if row is None:
+            return None
+        payload, data = row
+        return inflate(data) if data is not None else payload
+
+    def remember(self, hashes: Iterable[str]) -> None:
+        for h in hashes:
+            self._stored.set(h, True)
+
+    def clear(self) -> None:
+        self._stored.clear()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "known": len(self._stored),
+            "written": self.written,
+            "compressed": self.compressed,
+            "compressed_bytes_in": self.compressed_bytes_in,
+            "compressed_bytes_out": self.compressed_bytes_out,
+        }
+
+
+payload_store = PayloadStore(maxsize=settings.PAYLOAD_STORE_CACHE_SIZE)
@@ -0,0 +1,146 @@
+"""Vectorized policy evaluation over many match contexts (analytics, replay)."""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Callable, Sequence
+
+import numpy as np
+
+from app.services.policy_engine import (
+    _SCALARS,
+    PRECEDENCE,
+    CompiledPolicySet,
+    CompiledRule,
+    compile_policies,
+)
+
+
+@dataclass
+class BatchDecision:
+    """
+    Per-row results of evaluate_policies_batch.
+    hits is a (rows x rules) boolean matrix whose columns follow rules;
+    winners holds the deciding rule's column, or -1 for the default.
+    """
+
+    decisions: list[str]
+    reasons: list[str]
+    hits: np.ndarray
+    winners: np.ndarray
+    rules: list[CompiledRule]
+
+    def __len__(self) -> int:
+        return len(self.decisions)
+
+    def hits_for(self, row: int) -> list[dict]:
+        """Hit list for one row, identical to PolicyDecision.hits."""
+        rules = self.rules
+        return [rules[i].hit() for i in np.flatnonzero(self.hits[row])]
+
+
+class _Columns:
+    """Context fields encoded as categorical codes over their distinct values."""
+
+    def __init__(self, contexts: Sequence[dict]):
+        self._contexts = contexts
+        self._encoded: dict[str, tuple[np.ndarray, list]] = {}
+        self._masks: dict[tuple, np.ndarray] = {}
+
+    def encode(self, field: str, get: Callable[[dict], Any]) -> tuple[np.ndarray, list]:
+        if field in self._encoded:
+            return self._encoded[field]
+
+        codes = np.empty(len(self._contexts), dtype=np.int64)
+        uniques: list = []
+        lookup: dict = {}
+        for i, ctx in enumerate(self._contexts):
+            v = get(ctx)
+            if isinstance(v, _SCALARS):
+                key = (type(v), v)
+                code = lookup.get(key)
+                if code is None:
+                    code = lookup[key] = len(uniques)
+                    uniques.append(v)
+            else:
+                code = len(uniques)
+                uniques.append(v)
+            codes[i] = code
+
+        self._encoded[field] = (codes, uniques)
+        return codes, uniques
+
+    def mask(
+        self, key: Any, field: str, get: Callable[[dict], Any], pred: Callable[[Any], bool]
+    ) -> np.ndarray:
+        """Row mask for pred(get(ctx)), evaluated once per distinct field value."""
+        try:
+            cached = self._masks.get(key)
+        except TypeError:
+            key, cached = None, None
+        if cached is not None:
+            return cached
+
+        codes, uniques = self.encode(field, get)
+        table = np.fromiter((bool(pred(v)) for v in uniques), dtype=bool, count=len(uniques))
+        mask = table[codes]
+        if key is not None:
+            self._masks[key] = mask
+        return mask
+
+
+def _rule_mask(rule: CompiledRule, columns: _Columns, contexts: Sequence[dict]) -> np.ndarray:
+    n = len(contexts)
+    if rule.fallback is not None:
+        return np.fromiter((rule.matches(ctx) for ctx in contexts), dtype=bool, count=n)
+
+    mask = np.ones(n, dtype=bool)
+    for c in rule.clauses:
+        mask &= columns.mask(c.key, c.path, c.get, c.test)
+    return mask
+
+
+def evaluate_policies_batch(
+    policies: list[dict[str, Any]] | CompiledPolicySet,
+    contexts: Sequence[dict[str, Any]],
+) -> BatchDecision:
+    """
+    Evaluate many match contexts at once.
+    Each clause is evaluated once per distinct field value and broadcast to
+    rows through categorical codes; results match evaluate_policies per row.
+    Memory is rows x rules booleans, so callers should chunk large inputs.
+    """
+    if not isinstance(policies, CompiledPolicySet):
+        policies = compile_policies(policies)
+    rules = policies.rules
+    n = len(contexts)
+
+    columns = _Columns(contexts)
+    hits = np.zeros((n, len(rules)), dtype=bool, order="F")
+    for rule in rules:
+        hits[:, rule.order] = _rule_mask(rule, columns, contexts)
+
+    defaults = [ctx.get("default_decision") or "ALLOW" for ctx in contexts]
+    floors = np.fromiter((PRECEDENCE.get(d, 0) for d in defaults), dtype=np.int64, count=n)
+
+    # Winner is the last matching rule of the highest tier not below the row's default.
+    winner = np.full(n, -1, dtype=np.int64)
+    precedence = np.fromiter((r.precedence for r in rules), dtype=np.int64, count=len(rules))
+    for tier in sorted(set(precedence.tolist()), reverse=True):
+        cols = np.flatnonzero(precedence == tier)
+        sub = hits[:, cols]
+        matched = sub.any(axis=1)
+        last = cols[len(cols) - 1 - sub[:, ::-1].argmax(axis=1)]
+        take = (winner < 0) & matched & (floors <= tier)
+        winner[take] = last[take]
+
+    decisions: list[str] = []
+    reasons: list[str] = []
+    for i, w in enumerate(winner.tolist()):
+        if w < 0:
+            decisions.append(defaults[i])
+            reasons.append("default")
+        else:
+            decisions.append(rules[w].effect)
+            reasons.append(rules[w].reason)
+
+    return BatchDecision(decisions=decisions, reasons=reasons, hits=hits, winners=winner, rules=rules)
@@ -0,0 +1,224 @@
+"""Per-tenant policy snapshot cache with cross-worker invalidation."""
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable
+from uuid import UUID
+
+import asyncpg
+from sqlalchemy import select, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.models import Policy, RiskStageSetting
+from app.db.session import async_session
+from app.services.policy_engine import CompiledPolicySet, compile_policies
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "agentshield_policy_changed"
+
+
+@dataclass
+class PolicySnapshot:
+    tenant_id: str
+    version: int
+    fingerprint: tuple
+    compiled: CompiledPolicySet
+    loaded_at: float
+    # Risk stages the tenant has switched off
+    disabled_stages: frozenset[str] = field(default_factory=frozenset)
+
+
+def _listen_dsn() -> str:
+    """Plain libpq DSN for a dedicated asyncpg LISTEN connection."""
+    url = make_url(settings.DATABASE_URL).set(drivername="postgresql")
+    return url.render_as_string(hide_password=False)
+
+
+class PolicySnapshotCache:
+    """
+    Enabled policies (and risk stage settings) per tenant, compiled once and shared by all requests in
+    the worker. Entries are dropped when policies change, either locally or
+    via Postgres NOTIFY from another worker; POLICY_CACHE_TTL bounds staleness
+    if a notification is ever missed.
+    """
+
+    def __init__(self) -> None:
+        self._snapshots: dict[str, PolicySnapshot] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._generation = 0
+        self._versions = itertools.count(1)
+        # Replaced compiled sets whose rule counters have not been drained yet
+        self._retired: deque[tuple[str, CompiledPolicySet]] = deque(maxlen=1000)
+        self._listener: asyncio.Task | None = None
+        # Other channels served by the same LISTEN connection: channel -> handler
+        self._subscribers: dict[str, Callable[[str | None], None]] = {}
+        self.hits = 0
+        self.loads = 0
+
+    def _fresh(self, snap: PolicySnapshot | None) -> bool:
+        if snap is None:
+            return False
+        ttl = settings.POLICY_CACHE_TTL
+        return ttl > 0 and time.monotonic() - snap.loaded_at < ttl
+
+    async def get(self, tenant_id: str) -> PolicySnapshot:
+        """Return the tenant's policy snapshot, loading it on miss."""
+        snap = self._snapshots.get(tenant_id)
+        if self._fresh(snap):
+            self.hits += 1
+            return snap
+
+        lock = self._locks.setdefault(tenant_id, asyncio.Lock())
+        async with lock:
+            snap = self._snapshots.get(tenant_id)
+            if self._fresh(snap):
+                self.hits += 1
+                return snap
+            return await self._load(tenant_id, snap)
+
+    async def _load(self, tenant_id: str, previous: PolicySnapshot | None) -> PolicySnapshot:
+        generation = self._generation
+
+        async with async_session() as session:
+            result = await session.execute(
+                select(Policy).where(
+                    Policy.tenant_id == UUID(tenant_id),
+                    Policy.enabled == True,
+                )
+            )
+            policies = result.scalars().all()
+            result = await session.execute(
+                select(RiskStageSetting.stage).where(
+                    RiskStageSetting.tenant_id == UUID(tenant_id),
+                    RiskStageSetting.enabled == False,
+                )
+            )
+            disabled_stages = frozenset(result.scalars().all())
+
+        fingerprint = tuple((p.id, p.version, p.updated_at) for p in policies)
+        if previous and previous.fingerprint == fingerprint:
+            version = previous.version
+            compiled = previous.compiled
+        else:
+            version = next(self._versions)
+            compiled = compile_policies(
+                [
+                    {"name": p.name, "enabled": p.enabled, "rules": (p.dsl or {}).get("rules", [])}
+                    for p in policies
+                ]
+            )
+
+        snap = PolicySnapshot(
+            tenant_id=tenant_id,
+            version=version,
+            fingerprint=fingerprint,
+            compiled=compiled,
+            loaded_at=time.monotonic(),
+            disabled_stages=disabled_stages,
+        )
+        self.loads += 1
+        # An invalidation that raced with this load wins: don't cache stale rows.
+        if generation == self._generation:
+            if previous and previous.compiled is not compiled:
+                self._retired.append((tenant_id, previous.compiled))
+            self._snapshots[tenant_id] = snap
+        return snap
+
+    def invalidate(self, tenant_id: str | None = None) -> None:
+        """Drop one tenant's snapshot, or all snapshots if tenant_id is None."""
+        self._generation += 1
+        if tenant_id is None:
+            dropped = list(self._snapshots.values())
+            self._snapshots.clear()
+        else:
+            snap = self._snapshots.pop(tenant_id, None)
+            dropped = [snap] if snap else []
+        self._retired.extend((snap.tenant_id, snap.compiled) for snap in dropped)
+
+    def snapshots(self) -> list[PolicySnapshot]:
+        """Currently cached snapshots."""
+        return list(self._snapshots.values())
+
+    def compiled_sets(self, tenant_id: str) -> list[CompiledPolicySet]:
+        """The tenant's cached and not yet drained retired compiled sets."""
+        sets = [compiled for tid, compiled in self._retired if tid == tenant_id]
+        snap = self._snapshots.get(tenant_id)
+        if snap is not None:
+            sets.append(snap.compiled)
+        return sets
+
+    def drain_retired(self) -> list[tuple[str, CompiledPolicySet]]:
+        """Pop compiled sets replaced since the last call, with their tenant ids."""
+        retired = list(self._retired)
+        self._retired.clear()
+        return retired
+
+    async def publish_change(self, session: AsyncSession, tenant_id: str) -> None:
+        """
+        Queue a NOTIFY for other workers in the caller's transaction.
+        Postgres delivers it on commit; call invalidate() after committing.
+        """
+        await session.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": NOTIFY_CHANNEL, "payload": tenant_id},
+        )
+
+    def _on_notify(self, conn, pid, channel, payload) -> None:
+        self.invalidate(payload or None)
+
+    def subscribe(self, channel: str, handler: Callable[[str | None], None]) -> None:
+        """
+        Also listen on channel, calling handler(payload) per notification and
+        handler(None) after (re)connecting, when changes may have been missed.
+        """
+        self._subscribers[channel] = handler
+
+    def _subscriber_callback(self, handler: Callable[[str | None], None]):
+        return lambda conn, pid, channel, payload: handler(payload or None)
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                conn = await asyncpg.connect(_listen_dsn())
+                try:
+                    await conn.add_listener(NOTIFY_CHANNEL, self._on_notify)
+                    for channel, handler in self._subscribers.items():
+                        await conn.add_listener(channel, self._subscriber_callback(handler))
+                    # Changes made while we were disconnected were never delivered.
+                    self.invalidate()
+                    for handler in self._subscribers.values():
+                        handler(None)
+                    while not conn.is_closed():
+                        await asyncio.sleep(5)
+                finally:
+                    await conn.close()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("Policy cache listener disconnected, retrying", exc_info=True)
+            await asyncio.sleep(1)
+
+    def start(self) -> None:
+        """Start the LISTEN task for cross-worker invalidation."""
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+
+policy_cache = PolicySnapshotCache()
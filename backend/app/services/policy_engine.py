@@ -1,68 +1,643 @@
 """Policy-as-code DSL evaluator."""
 from __future__ import annotations
 
-from dataclasses import dataclass
-from fnmatch import fnmatch
-from typing import Any
+import functools
+import operator
+import os
+import re
+from dataclasses import dataclass, field
+from fnmatch import fnmatch, translate
+from typing import Any, Callable, Hashable
+
+PRECEDENCE = {"DENY": 3, "REQUIRE_APPROVAL": 2, "ALLOW": 1}
+COMPARE_OPERATORS = {"gt": operator.gt, "gte": operator.ge, "lt": operator.lt, "lte": operator.le}
+MATCH_OPERATORS = ("equals", "in", "glob", *COMPARE_OPERATORS)
+
+# Risk score at or above which the default decision becomes REQUIRE_APPROVAL
+APPROVAL_RISK_THRESHOLD = 60
+
+_MISSING = object()
+
+
+class PolicyValidationError(ValueError):
+    """Raised when a policy DSL is malformed."""
 
 
 @dataclass
 class PolicyDecision:
     decision: str
     reason: str
-    hits: list[dict]
+    hits: list[dict] | None
+    explain: Callable[[], list[dict]] | None = field(default=None, repr=False, compare=False)
+
+    def resolve_hits(self) -> list[dict]:
+        """Return hits, computing them on first use for decision-only results."""
+        if self.hits is None:
+            self.hits = self.explain() if self.explain else []
+            self.explain = None
+        return self.hits
+
+
+def match_context(source: Any, risk_score: int) -> dict[str, Any]:
+    """
+    Build the policy match context from an evaluate request or a stored
+    Evaluation (both expose the same action attributes).
+    """
+    return {
+        "action_type": source.action_type,
+        "actor": source.actor,
+        "agent": source.agent,
+        "tool_name": source.tool_name,
+        "aws_service": source.aws_service,
+        "aws_operation": source.aws_operation,
+        "risk_score": risk_score,
+        "default_decision": "REQUIRE_APPROVAL" if risk_score >= APPROVAL_RISK_THRESHOLD else "ALLOW",
+        "tool_args": getattr(source, "tool_args", None),
+        "params": getattr(source, "params", None),
+        "context": getattr(source, "context", None),
+    }
+
+
+_PATH_STEP = re.compile(r"([^.\[\]]+)|\[(-?\d+)\]")
+
+
+def _parse_path(path: str) -> tuple[str | int, ...] | None:
+    """Split a.b[0].c (optionally prefixed with $.) into steps; None if malformed."""
+    if path.startswith("$."):
+        path = path[2:]
+    steps: list[str | int] = []
+    pos = 0
+    while pos < len(path):
+        if steps and path[pos] == ".":
+            pos += 1
+        m = _PATH_STEP.match(path, pos)
+        if m is None:
+            return None
+        steps.append(m.group(1) if m.group(1) is not None else int(m.group(2)))
+        pos = m.end()
+    return tuple(steps) if steps else None
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_path(path: Any) -> Callable[[dict], Any]:
+    """
+    Compile a field path into an accessor for match contexts. Plain names
+    read ctx[name]; dotted/JSONPath-style paths (tool_args.command,
+    $.context.env, params.items[0]) walk nested dicts and lists. A key
+    present verbatim in the context wins, and missing steps yield None.
+    """
+    steps = _parse_path(path) if isinstance(path, str) else None
+    if steps is None or steps == (path,):
+        return lambda ctx: ctx.get(path)
+
+    def get(ctx: dict) -> Any:
+        cur = ctx.get(path, _MISSING)
+        if cur is not _MISSING:
+            return cur
+        cur = ctx
+        for step in steps:
+            if isinstance(cur, dict):
+                cur = cur.get(step if isinstance(step, str) else str(step))
+            elif isinstance(cur, (list, tuple)):
+                try:
+                    cur = cur[int(step)]
+                except (ValueError, IndexError):
+                    return None
+            else:
+                return None
+        return cur
+
+    return get
+
+
+def _compare(op: str, x: Any, bound: Any) -> bool:
+    """Numeric comparison; non-numeric values (including bools) never match."""
+    if not _is_number(x) or not _is_number(bound):
+        return False
+    return COMPARE_OPERATORS[op](x, bound)
+
+
+def _is_number(v: Any) -> bool:
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
 
 
 def _match_all(match: dict, ctx: dict) -> bool:
     """
     Match context against rule.
-    Supports: equals, in, glob.
+    Supports: equals, in, glob, gt, gte, lt, lte on field paths.
     """
     for k, v in (match.get("equals") or {}).items():
-        if ctx.get(k) != v:
+        if compile_path(k)(ctx) != v:
             return False
 
     for k, arr in (match.get("in") or {}).items():
-        val = ctx.get(k)
+        val = compile_path(k)(ctx)
         if val not in (arr or []):
             return False
 
     for k, pat in (match.get("glob") or {}).items():
-        if not fnmatch(str(ctx.get(k) or ""), str(pat)):
+        if not fnmatch(str(compile_path(k)(ctx) or ""), str(pat)):
             return False
 
+    for op in COMPARE_OPERATORS:
+        for k, bound in (match.get(op) or {}).items():
+            if not _compare(op, compile_path(k)(ctx), bound):
+                return False
+
+    return True
+
+
+def _hashable(value: Any) -> bool:
+    try:
+        hash(value)
+    except TypeError:
+        return False
     return True
 
 
-def evaluate_policies(policies: list[dict[str, Any]], ctx: dict[str, Any]) -> PolicyDecision:
+def _contains(container: Any, value: Any) -> bool:
+    """Membership test that treats unhashable values as absent from a set."""
+    try:
+        return value in container
+    except TypeError:
+        return False
+
+
+def _compile_glob(pat: Any) -> Callable[[str], Any]:
+    """Precompile an fnmatch pattern with the same semantics as fnmatch()."""
+    return re.compile(translate(os.path.normcase(str(pat)))).match
+
+
+# Relative cost of testing a clause; cheaper clauses run first on ties
+_CLAUSE_COST = {"equals": 1, "in": 1, "glob": 3, **{op: 1 for op in COMPARE_OPERATORS}}
+# Scalar types whose equal values behave identically under every clause
+_SCALARS = (str, int, float, bool, type(None))
+
+
+def _operand_key(v: Any) -> Hashable:
+    """Hashable identity for a clause operand that never conflates 1 and True."""
+    if isinstance(v, _SCALARS):
+        return (type(v), v)
+    if isinstance(v, (list, tuple)):
+        return tuple(_operand_key(x) for x in v)
+    return ("id", id(v))
+
+
+@dataclass
+class Clause:
+    """One match condition on a context field path."""
+
+    op: str
+    path: str
+    test: Callable[[Any], bool]
+    key: Hashable
+    # Values the clause accepts when they are all hashable, else None (not indexable)
+    values: tuple | None = None
+    get: Callable[[dict], Any] | None = field(default=None, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        if self.get is None:
+            self.get = compile_path(self.path)
+
+
+def _equals_clause(path: str, v: Any) -> Clause:
+    return Clause(
+        op="equals",
+        path=path,
+        test=lambda x: not (x != v),
+        key=("equals", path, _operand_key(v)),
+        values=(v,) if _hashable(v) else None,
+    )
+
+
+def _in_clause(path: str, arr: Any) -> Clause:
+    arr = list(arr or [])
+    if all(_hashable(x) for x in arr):
+        members = frozenset(arr)
+        test = lambda x: _contains(members, x)  # noqa: E731
+        values = tuple(arr)
+    else:
+        test = lambda x: x in arr  # noqa: E731
+        values = None
+    return Clause(op="in", path=path, test=test, key=("in", path, _operand_key(arr)), values=values)
+
+
+def _glob_clause(path: str, pat: Any) -> Clause:
+    match = _compile_glob(pat)
+    return Clause(
+        op="glob",
+        path=path,
+        test=lambda x: match(os.path.normcase(str(x or ""))) is not None,
+        key=("glob", path, str(pat)),
+    )
+
+
+def _compare_clause(op: str, path: str, bound: Any) -> Clause:
+    cmp = COMPARE_OPERATORS[op]
+    if _is_number(bound):
+        test = lambda x: _is_number(x) and cmp(x, bound)  # noqa: E731
+    else:
+        test = lambda x: False  # noqa: E731
+    return Clause(op=op, path=path, test=test, key=(op, path, _operand_key(bound)))
+
+
+@dataclass
+class CompiledRule:
     """
-    Evaluate policies in order. First matching rule wins by effect precedence:
-    DENY > REQUIRE_APPROVAL > ALLOW
+    A rule with its match clauses pre-parsed for fast evaluation.
+    The anchor clause is satisfied by the index lookup; checks are the
+    remaining clauses in evaluation order.
     """
-    hits: list[dict] = []
-    default_decision = ctx.get("default_decision") or "ALLOW"
-    decision = default_decision
-    reason = "default"
 
-    precedence = {"DENY": 3, "REQUIRE_APPROVAL": 2, "ALLOW": 1}
+    order: int
+    policy: str
+    name: str
+    effect: Any
+    reason: str
+    precedence: int = 0
+    clauses: list[Clause] = field(default_factory=list)
+    anchor: Clause | None = None
+    checks: tuple[Clause, ...] = ()
+    fallback: dict | None = None
+    evaluated: int = 0
+    matched: int = 0
 
-    for p in policies:
-        if not p.get("enabled", True):
+    def matches(self, ctx: dict) -> bool:
+        """Check the clauses not already satisfied by the index lookup."""
+        self.evaluated += 1
+        if self.fallback is not None:
+            if not _match_all(self.fallback, ctx):
+                return False
+        else:
+            for c in self.checks:
+                if not c.test(c.get(ctx)):
+                    return False
+        self.matched += 1
+        return True
+
+    def set_anchor(self, anchor: Clause | None, rank: Callable[[Clause], Any] | None = None) -> None:
+        """Pick the index anchor and order the remaining clauses by rank."""
+        self.anchor = anchor
+        checks = [c for c in self.clauses if c is not anchor]
+        if rank is not None:
+            checks.sort(key=rank)
+        self.checks = tuple(checks)
+
+    def hit(self) -> dict:
+        return {"policy": self.policy, "rule": self.name, "effect": self.effect}
+
+
+def _validate_rule(rule: Any, where: str) -> None:
+    """Reject rules that the legacy evaluator would silently mis-handle."""
+    if not isinstance(rule, dict):
+        raise PolicyValidationError(f"{where}: rule must be an object")
+
+    for attr in ("name", "reason"):
+        if rule.get(attr) is not None and not isinstance(rule[attr], str):
+            raise PolicyValidationError(f"{where}.{attr}: must be a string")
+
+    effect = rule.get("effect", "ALLOW")
+    if effect not in PRECEDENCE:
+        raise PolicyValidationError(
+            f"{where}.effect: must be one of {', '.join(PRECEDENCE)}, got {effect!r}"
+        )
+
+    match = rule.get("match", {})
+    if not isinstance(match, dict):
+        raise PolicyValidationError(f"{where}.match: must be an object")
+
+    unknown = sorted(set(match) - set(MATCH_OPERATORS))
+    if unknown:
+        raise PolicyValidationError(
+            f"{where}.match: unknown operator(s) {', '.join(unknown)}"
+        )
+
+    for op in MATCH_OPERATORS:
+        clause = match.get(op)
+        if clause is None:
             continue
+        if not isinstance(clause, dict):
+            raise PolicyValidationError(f"{where}.match.{op}: must be an object")
+        for k, v in clause.items():
+            if not isinstance(k, str) or _parse_path(k) is None:
+                raise PolicyValidationError(f"{where}.match.{op}: invalid field path {k!r}")
+            if op in COMPARE_OPERATORS and not _is_number(v):
+                raise PolicyValidationError(f"{where}.match.{op}.{k}: must be a number")
+            if op == "in" and not isinstance(v, list):
+                raise PolicyValidationError(f"{where}.match.in.{k}: must be a list")
+            if op == "glob" and not isinstance(v, str):
+                raise PolicyValidationError(f"{where}.match.glob.{k}: must be a string")
+
+
+def _compile_rule(order: int, policy: dict, rule: dict) -> CompiledRule:
+    """Compile a rule and pick a static index anchor (equals, then shortest in)."""
+    compiled = CompiledRule(
+        order=order,
+        policy=policy.get("name", "unknown"),
+        name=rule.get("name", "unnamed"),
+        effect=rule.get("effect", "ALLOW"),
+        reason=rule.get("reason") or f"matched:{policy.get('name')}:{rule.get('name')}",
+    )
+    effect = compiled.effect
+    compiled.precedence = PRECEDENCE.get(effect, 0) if _hashable(effect) else 0
+
+    match = rule.get("match", {})
+    equals = match.get("equals") or {}
+    members = match.get("in") or {}
+    globs = match.get("glob") or {}
+    compares = {op: match.get(op) or {} for op in COMPARE_OPERATORS}
+
+    if (
+        not isinstance(equals, dict)
+        or not isinstance(members, dict)
+        or not isinstance(globs, dict)
+        or not all(isinstance(c, dict) for c in compares.values())
+        or any(arr and not isinstance(arr, (list, tuple)) for arr in members.values())
+    ):
+        # Shapes only the legacy matcher understands: keep its exact behaviour.
+        compiled.fallback = match
+        return compiled
+
+    compiled.clauses = (
+        [_equals_clause(k, v) for k, v in equals.items()]
+        + [_in_clause(k, arr) for k, arr in members.items()]
+        + [_glob_clause(k, pat) for k, pat in globs.items()]
+        + [_compare_clause(op, k, b) for op, c in compares.items() for k, b in c.items()]
+    )
+    indexable = [c for c in compiled.clauses if c.values is not None]
+    indexable.sort(key=lambda c: (len(c.values), c.op != "equals"))
+    compiled.set_anchor(indexable[0] if indexable else None)
+    return compiled
+
+
+# Observe one in this many contexts for selectivity statistics
+STATS_SAMPLE_EVERY = 16
+_OTHER = object()
+
+
+class CompiledPolicySet:
+    """
+    Indexed decision structure for a tenant's policies.
+    Rules anchored on an equals/in clause are only visited when the context
+    value for that field hits the hash index; the rest are always checked.
+    Evaluation order and precedence match evaluate_policies exactly.
+
+    A sample of contexts feeds per-field value histograms; optimize() uses
+    them to re-anchor each rule on its most selective clause and to test the
+    remaining clauses most-selective first. Both are pure conjunction
+    reorderings, so decisions, reasons and hits are unaffected.
+    """
+
+    def __init__(self, rules: list[CompiledRule]):
+        self.rules = rules
+        self._requests = 0
+        self._observed = 0
+        self._histograms: dict[str, dict[Any, int]] = {}
+        self._build_index()
+        self.paths = self._referenced_paths()
+        self._key_getters = tuple(compile_path(p) for p in self.paths or ())
+
+    def __len__(self) -> int:
+        return len(self.rules)
 
-        for rule in p.get("rules", []):
-            if not _match_all(rule.get("match", {}), ctx):
+    def _build_index(self) -> None:
+        index: dict[str, dict[Any, list[int]]] = {}
+        getters: dict[str, Callable[[dict], Any]] = {}
+        unanchored: list[int] = []
+        tracked: dict[str, set] = {}
+
+        for rule in self.rules:
+            for c in rule.clauses:
+                if c.values is not None:
+                    tracked.setdefault(c.path, set()).update(c.values)
+
+            if rule.fallback is not None or rule.anchor is None:
+                unanchored.append(rule.order)
+                continue
+
+            buckets = index.setdefault(rule.anchor.path, {})
+            getters.setdefault(rule.anchor.path, rule.anchor.get)
+            for v in rule.anchor.values:
+                bucket = buckets.setdefault(v, [])
+                if not bucket or bucket[-1] != rule.order:
+                    bucket.append(rule.order)
+
+        self._index = index
+        self._getters = getters
+        self._unanchored = unanchored
+        self._tracked = tracked
+
+    def candidates(self, ctx: dict) -> list[CompiledRule]:
+        """Rules that may match ctx, in stored order."""
+        self._requests += 1
+        if self._requests % STATS_SAMPLE_EVERY == 0:
+            self._observe(ctx)
+
+        orders = list(self._unanchored)
+        getters = self._getters
+        for path, buckets in self._index.items():
+            try:
+                bucket = buckets.get(getters[path](ctx))
+            except TypeError:
                 continue
+            if bucket:
+                orders.extend(bucket)
+        orders.sort()
+        rules = self.rules
+        return [rules[i] for i in orders]
 
-            effect = rule.get("effect", "ALLOW")
-            hits.append({
-                "policy": p.get("name", "unknown"),
-                "rule": rule.get("name", "unnamed"),
-                "effect": effect,
-            })
+    def _observe(self, ctx: dict) -> None:
+        self._observed += 1
+        for path, values in self._tracked.items():
+            v = compile_path(path)(ctx)
+            try:
+                key = v if v in values else _OTHER
+            except TypeError:
+                key = _OTHER
+            hist = self._histograms.setdefault(path, {})
+            hist[key] = hist.get(key, 0) + 1
 
-            if precedence.get(effect, 0) >= precedence.get(decision, 0):
-                decision = effect
-                reason = rule.get("reason") or f"matched:{p.get('name')}:{rule.get('name')}"
+    def _referenced_paths(self) -> tuple[str, ...] | None:
+        """Field paths any rule reads, or None if a legacy rule's paths are unknowable."""
+        paths: set = set()
+        for rule in self.rules:
+            if rule.fallback is None:
+                paths.update(c.path for c in rule.clauses)
+                continue
+            if not isinstance(rule.fallback, dict):
+                return None
+            for op in MATCH_OPERATORS:
+                clause = rule.fallback.get(op)
+                if clause and not isinstance(clause, dict):
+                    return None
+                paths.update(clause or ())
+        return tuple(sorted(paths, key=repr))
+
+    def context_key(self, ctx: dict[str, Any]) -> tuple | None:
+        """
+        Hashable key of everything in ctx that can influence the decision:
+        the referenced field values and the default decision. None when a
+        value is not a scalar, so callers should not cache the result.
+        """
+        if self.paths is None:
+            return None
+        key = [ctx.get("default_decision")]
+        for get in self._key_getters:
+            v = get(ctx)
+            if not isinstance(v, _SCALARS):
+                return None
+            key.append((type(v), v))
+        if not isinstance(key[0], _SCALARS):
+            return None
+        return tuple(key)
+
+    def _pass_rate(self, clause: Clause) -> float:
+        """Estimated fraction of contexts that satisfy an indexable clause."""
+        if clause.values is None or not self._observed:
+            return 1.0
+        hist = self._histograms.get(clause.path, {})
+        return sum(hist.get(v, 0) for v in set(clause.values)) / self._observed
+
+    def optimize(self, min_samples: int = 100) -> bool:
+        """
+        Re-anchor and reorder clauses from the sampled histograms.
+        Returns False (and does nothing) until min_samples contexts are seen.
+        """
+        if self._observed < min_samples:
+            return False
+
+        def rank(c: Clause) -> tuple[float, int]:
+            return (self._pass_rate(c), _CLAUSE_COST[c.op])
+
+        for rule in self.rules:
+            if rule.fallback is not None:
+                continue
+            indexable = [c for c in rule.clauses if c.values is not None]
+            anchor = min(indexable, key=rank) if indexable else None
+            rule.set_anchor(anchor, rank)
 
-    return PolicyDecision(decision=decision, reason=reason, hits=hits)
+        self._build_index()
+        self._histograms = {}
+        self._observed = 0
+        return True
+
+    def peek_stats(self) -> list[tuple[str, str, int, int]]:
+        """Return (policy, rule, evaluated, matched) since the last drain."""
+        return [(rule.policy, rule.name, rule.evaluated, rule.matched) for rule in self.rules if rule.evaluated]
+
+    def drain_stats(self) -> list[tuple[str, str, int, int]]:
+        """Return (policy, rule, evaluated, matched) since the last drain and reset."""
+        out = self.peek_stats()
+        for rule in self.rules:
+            rule.evaluated = 0
+            rule.matched = 0
+        return out
+
+    def evaluate(self, ctx: dict[str, Any], *, decision_only: bool = False) -> PolicyDecision:
+        """
+        Evaluate ctx against the rule set.
+        With decision_only=True, stop at the first rule that fixes the outcome
+        and compute hits lazily via PolicyDecision.resolve_hits().
+        """
+        if decision_only:
+            return self._decide(ctx)
+
+        hits: list[dict] = []
+        decision = ctx.get("default_decision") or "ALLOW"
+        reason = "default"
+
+        for rule in self.candidates(ctx):
+            if not rule.matches(ctx):
+                continue
+
+            hits.append(rule.hit())
+
+            if PRECEDENCE.get(rule.effect, 0) >= PRECEDENCE.get(decision, 0):
+                decision = rule.effect
+                reason = rule.reason
+
+        return PolicyDecision(decision=decision, reason=reason, hits=hits)
+
+    def _decide(self, ctx: dict[str, Any]) -> PolicyDecision:
+        """
+        The outcome is the last matching rule of the highest precedence that
+        is not below the default, so scan tiers from DENY down and each tier
+        backwards; the first match settles decision and reason.
+        """
+        default_decision = ctx.get("default_decision") or "ALLOW"
+        floor = PRECEDENCE.get(default_decision, 0)
+        decision = default_decision
+        reason = "default"
+
+        candidates = self.candidates(ctx)
+        tiers: dict[int, list[CompiledRule]] = {}
+        for rule in candidates:
+            tiers.setdefault(rule.precedence, []).append(rule)
+
+        seen: dict[int, bool] = {}
+        for tier in sorted(tiers, reverse=True):
+            if tier < floor:
+                break
+            matched = None
+            for rule in reversed(tiers[tier]):
+                if rule.matches(ctx):
+                    seen[rule.order] = True
+                    matched = rule
+                    break
+                seen[rule.order] = False
+            if matched is not None:
+                decision = matched.effect
+                reason = matched.reason
+                break
+
+        def explain() -> list[dict]:
+            return [
+                rule.hit()
+                for rule in candidates
+                if seen.get(rule.order, None) or (rule.order not in seen and rule.matches(ctx))
+            ]
+
+        return PolicyDecision(decision=decision, reason=reason, hits=None, explain=explain)
+
+
+def compile_policies(policies: list[dict[str, Any]], *, strict: bool = False) -> CompiledPolicySet:
+    """
+    Compile policy DSLs into a CompiledPolicySet.
+    With strict=True malformed rules raise PolicyValidationError; otherwise
+    they are kept with the legacy matcher so stored policies behave as before.
+    """
+    rules: list[CompiledRule] = []
+
+    for pi, p in enumerate(policies):
+        if strict:
+            if not isinstance(p, dict):
+                raise PolicyValidationError(f"policies[{pi}]: policy must be an object")
+            if not isinstance(p.get("rules", []), list):
+                raise PolicyValidationError(f"policies[{pi}].rules: must be a list")
+
+        if not p.get("enabled", True):
+            continue
+
+        for ri, rule in enumerate(p.get("rules", [])):
+            if strict:
+                _validate_rule(rule, f"{p.get('name', 'unknown')}.rules[{ri}]")
+            rules.append(_compile_rule(len(rules), p, rule))
+
+    return CompiledPolicySet(rules)
+
+
+def evaluate_policies(
+    policies: list[dict[str, Any]] | CompiledPolicySet,
+    ctx: dict[str, Any],
+    *,
+    decision_only: bool = False,
+) -> PolicyDecision:
+    """
+    Evaluate policies in order. First matching rule wins by effect precedence:
+    DENY > REQUIRE_APPROVAL > ALLOW
+    Accepts raw policy DSLs or a precompiled CompiledPolicySet.
+    With decision_only=True hits are left to PolicyDecision.resolve_hits().
+    """
+    if not isinstance(policies, CompiledPolicySet):
+        policies = compile_policies(policies)
+    return policies.evaluate(ctx, decision_only=decision_only)
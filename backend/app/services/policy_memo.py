@@ -0,0 +1,46 @@
+"""Memoized policy decisions keyed on the match context."""
+from __future__ import annotations
+
+from typing import Any
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.services.policy_cache import PolicySnapshot
+from app.services.policy_engine import PolicyDecision
+
+
+class DecisionMemo:
+    """
+    LRU/TTL cache of PolicyDecision per (tenant, policy-set version, context).
+    A policy change produces a new snapshot version, so stale entries are
+    never hit and simply age out. Only the field paths the policy set reads
+    are part of the key; contexts with non-scalar values there bypass the memo.
+    """
+
+    def __init__(self, maxsize: int, ttl: float | None = None):
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    def evaluate(self, snapshot: PolicySnapshot, ctx: dict[str, Any]) -> PolicyDecision:
+        ctx_key = snapshot.compiled.context_key(ctx)
+        if ctx_key is None:
+            return snapshot.compiled.evaluate(ctx, decision_only=True)
+
+        key = (snapshot.tenant_id, snapshot.version, ctx_key)
+        pd = self._cache.get(key)
+
+        if pd is None:
+            pd = snapshot.compiled.evaluate(ctx, decision_only=True)
+            self._cache.set(key, pd)
+        return pd
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> dict[str, int]:
+        return self._cache.stats()
+
+
+decision_memo = DecisionMemo(
+    maxsize=settings.POLICY_MEMO_SIZE,
+    ttl=settings.POLICY_MEMO_TTL or None,
+)
@@ -0,0 +1,277 @@
+"""Policy replay: what-if evaluation of a candidate policy over past evaluations."""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, NamedTuple
+from uuid import UUID
+
+from sqlalchemy import select, text
+
+from app.core.config import settings
+from app.db.models import Evaluation, Policy
+from app.db.session import async_session
+from app.services.policy_batch import evaluate_policies_batch
+from app.services.payload_store import inflate
+from app.services.policy_engine import CompiledPolicySet, compile_policies, match_context
+
+# Only the columns needed to rebuild the match context; request_payload (joined
+# from request_payloads) is only read if a policy reads one of _PAYLOAD_FIELDS
+# through a field path.
+_REPLAY_COLUMNS = (
+    Evaluation.id,
+    Evaluation.created_at,
+    Evaluation.action_type,
+    Evaluation.actor,
+    Evaluation.agent,
+    Evaluation.tool_name,
+    Evaluation.aws_service,
+    Evaluation.aws_operation,
+    Evaluation.risk_score,
+    Evaluation.decision,
+)
+_PAYLOAD_FIELDS = ("tool_args", "params", "context")
+
+logger = logging.getLogger(__name__)
+
+# Shared by every replay; workers compile each policy set once, keyed by digest
+_pool: ProcessPoolExecutor | None = None
+_worker_policies: tuple[str, CompiledPolicySet] | None = None
+
+
+class _ReplayRow(NamedTuple):
+    id: UUID
+    created_at: datetime
+    action_type: str
+    actor: str | None
+    agent: str | None
+    tool_name: str | None
+    aws_service: str | None
+    aws_operation: str | None
+    risk_score: int
+    decision: str
+    payload: dict | None = None
+    # Compressed full payload when payload is only a preview; inflated in the worker
+    blob: bytes | None = None
+
+    @property
+    def tool_args(self) -> Any:
+        return (self.payload or {}).get("tool_args")
+
+    @property
+    def params(self) -> Any:
+        return (self.payload or {}).get("params")
+
+    @property
+    def context(self) -> Any:
+        return (self.payload or {}).get("context")
+
+
+@dataclass
+class ReplayReport:
+    total: int = 0
+    flipped: int = 0
+    by_transition: dict[str, int] = field(default_factory=dict)
+    by_rule: dict[str, int] = field(default_factory=dict)
+    by_actor: dict[str, int] = field(default_factory=dict)
+    by_tool: dict[str, int] = field(default_factory=dict)
+    samples: list[dict] = field(default_factory=list)
+
+
+def candidate_policy_set(current: list[dict[str, Any]], candidate: dict[str, Any]) -> list[dict[str, Any]]:
+    """Current enabled policies with the candidate upserted by name."""
+    replaced = False
+    policies = []
+    for p in current:
+        if p["name"] == candidate["name"]:
+            p = candidate
+            replaced = True
+        policies.append(p)
+    if not replaced:
+        policies.append(candidate)
+    return policies
+
+
+def _reads_payload(compiled: CompiledPolicySet) -> bool:
+    """Whether any rule reads a request field only stored in request_payload."""
+    if compiled.paths is None:
+        return True
+    roots = {str(p).removeprefix("$.").split(".")[0].split("[")[0] for p in compiled.paths}
+    return not roots.isdisjoint(_PAYLOAD_FIELDS)
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.REPLAY_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def shutdown_replay_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _policy_digest(policies: list[dict[str, Any]]) -> str:
+    return hashlib.sha256(json.dumps(policies, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _replay_in_worker(digest: str, policies: list[dict[str, Any]], rows: list[_ReplayRow]) -> list[tuple[str, str]]:
+    global _worker_policies
+    if _worker_policies is None or _worker_policies[0] != digest:
+        _worker_policies = (digest, compile_policies(policies))
+    return _replay_chunk(rows, _worker_policies[1])
+
+
+def _replay_chunk(rows: list[_ReplayRow], compiled: CompiledPolicySet) -> list[tuple[str, str]]:
+    """Evaluate a chunk of replay rows; returns (decision, deciding rule) per row."""
+    rows = [row._replace(payload=inflate(row.blob), blob=None) if row.blob else row for row in rows]
+    contexts = [match_context(row, row.risk_score) for row in rows]
+    batch = evaluate_policies_batch(compiled, contexts)
+    rules = batch.rules
+    return [
+        (decision, f"{rules[w].policy}:{rules[w].name}" if w >= 0 else "default")
+        for decision, w in zip(batch.decisions, batch.winners.tolist())
+    ]
+
+
+def _tool_label(row: _ReplayRow) -> str:
+    if row.tool_name:
+        return row.tool_name
+    if row.aws_service or row.aws_operation:
+        return f"{row.aws_service or ''}.{row.aws_operation or ''}"
+    return row.action_type
+
+
+def _accumulate(
+    report: ReplayReport,
+    rows: list[_ReplayRow],
+    results: list[tuple[str, str]],
+    sample_size: int,
+) -> None:
+    transitions = Counter()
+    by_rule = Counter()
+    by_actor = Counter()
+    by_tool = Counter()
+
+    for row, (decision, rule) in zip(rows, results):
+        report.total += 1
+        if decision == row.decision:
+            continue
+        report.flipped += 1
+        transitions[f"{row.decision}->{decision}"] += 1
+        by_rule[rule] += 1
+        by_actor[row.actor or "unknown"] += 1
+        by_tool[_tool_label(row)] += 1
+        if len(report.samples) < sample_size:
+            report.samples.append(
+                {
+                    "evaluation_id": str(row.id),
+                    "created_at": row.created_at.isoformat(),
+                    "actor": row.actor,
+                    "tool": _tool_label(row),
+                    "old_decision": row.decision,
+                    "new_decision": decision,
+                    "rule": rule,
+                }
+            )
+
+    for target, counts in (
+        (report.by_transition, transitions),
+        (report.by_rule, by_rule),
+        (report.by_actor, by_actor),
+        (report.by_tool, by_tool),
+    ):
+        for k, v in counts.items():
+            target[k] = target.get(k, 0) + v
+
+
+async def replay_policies(
+    tenant_id: str,
+    candidate: dict[str, Any],
+    *,
+    since: datetime | None = None,
+    limit: int | None = None,
+    sample_size: int = 20,
+) -> ReplayReport:
+    """
+    Re-run the tenant's past evaluations against its policies with candidate
+    upserted, and count decisions that would change. Rows are streamed with a
+    server-side cursor in a read-only transaction and scored in a process pool.
+    """
+    tid = UUID(tenant_id)
+    report = ReplayReport()
+
+    async with async_session() as session:
+        result = await session.execute(
+            select(Policy).where(Policy.tenant_id == tid, Policy.enabled == True)
+        )
+        current = [
+            {"name": p.name, "enabled": p.enabled, "rules": (p.dsl or {}).get("rules", [])}
+            for p in result.scalars().all()
+        ]
+    policies = candidate_policy_set(current, candidate)
+    compiled = compile_policies(policies)
+
+    columns = _REPLAY_COLUMNS
+    if _reads_payload(compiled):
+        columns += (Evaluation.request_payload, Evaluation.request_payload_blob)
+    stmt = (
+        select(*columns)
+        .where(Evaluation.tenant_id == tid)
+        .order_by(Evaluation.created_at)
+        .execution_options(yield_per=settings.REPLAY_CHUNK_SIZE)
+    )
+    if since is not None:
+        stmt = stmt.where(Evaluation.created_at >= since)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+
+    loop = asyncio.get_running_loop()
+    max_in_flight = max(settings.REPLAY_WORKERS, 1) * 2
+    pending: list[tuple[list[_ReplayRow], asyncio.Future]] = []
+
+    async def drain(keep: int) -> None:
+        while len(pending) > keep:
+            rows, fut = pending.pop(0)
+            _accumulate(report, rows, await fut, sample_size)
+
+    pool = _executor() if settings.REPLAY_WORKERS > 0 else None
+    digest = _policy_digest(policies)
+
+    try:
+        async with async_session() as session:
+            await session.execute(text("SET TRANSACTION READ ONLY"))
+            stream = await session.stream(stmt)
+            async for partition in stream.partitions(settings.REPLAY_CHUNK_SIZE):
+                rows = [_ReplayRow(*r) for r in partition]
+                if pool is None:
+                    _accumulate(report, rows, _replay_chunk(rows, compiled), sample_size)
+                    continue
+                pending.append((rows, loop.run_in_executor(pool, _replay_in_worker, digest, policies, rows)))
+                await drain(max_in_flight)
+            await drain(0)
+            await session.rollback()
+    except BrokenProcessPool:
+        logger.warning("Replay pool broke, recreating on next replay", exc_info=True)
+        shutdown_replay_pool()
+        raise
+    finally:
+        # Chunks not yet started are dropped; the pool stays up for the next replay
+        for _, fut in pending:
+            fut.cancel()
+
+    return report
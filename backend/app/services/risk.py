@@ -1,6 +1,16 @@
 """Risk scoring for agent actions (tool calls, AWS API, codegen)."""
-import re
-from typing import Any
+import hashlib
+import importlib
+import time
+from dataclasses import dataclass, field
+from itertools import chain
+from typing import Any, Callable, Iterable, Iterator
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.services.policy_engine import APPROVAL_RISK_THRESHOLD
+from app.services.secret_scan import detect_secrets
+from app.services.signatures import SignatureSet, signature_library
 
 # High-risk IAM operations that warrant blocking or approval
 DANGEROUS_IAM_OPS = {
@@ -20,62 +30,396 @@ DANGEROUS_IAM_OPS = {
     "DeleteAccessKey",
 }
 
-# Shell patterns that indicate potentially malicious commands
-DANGEROUS_SHELL_PATTERNS = [
-    r"\brm\s+-rf\b",
-    r"\bcurl\b.*\|\s*sh\b",
-    r"\bwget\b.*\|\s*sh\b",
-    r"\bchmod\s+\+x\b",
-    r"\b(bash|sh)\s+-c\b",
-    r"\bmkfs\.(ext4|xfs)\b",
-]
-
 # Sensitive tools that should trigger approval
 SENSITIVE_TOOLS = {"shell", "bash", "terminal", "python_repl", "sql", "codegen", "execute_code"}
 
 
-def score_risk(action_type: str, payload: dict[str, Any]) -> tuple[int, list[str]]:
+@dataclass
+class ScanBudget:
+    """Limits on how much of a payload one risk scan may visit."""
+
+    max_nodes: int
+    max_chars: int
+    nodes: int = 0
+    chars: int = 0
+    truncated: bool = False
+
+
+_END = object()
+
+
+def iter_strings(obj: Any, budget: ScanBudget) -> Iterator[str]:
     """
-    Compute risk score (0-100) and list of signals.
-    Higher score = higher risk = more likely to require approval or denial.
+    Yield dict keys and string leaves of a nested payload depth-first, in
+    document order, without recursion or copying. Stops (setting
+    budget.truncated) once max_nodes values or max_chars of text are visited;
+    a string crossing the character limit is yielded as a prefix.
+    """
+    stack = [iter((obj,))]
+    while stack:
+        node = next(stack[-1], _END)
+        if node is _END:
+            stack.pop()
+            continue
+
+        budget.nodes += 1
+        if budget.nodes > budget.max_nodes:
+            budget.truncated = True
+            return
+
+        if isinstance(node, str):
+            remaining = budget.max_chars - budget.chars
+            if len(node) > remaining:
+                budget.truncated = True
+                budget.chars = budget.max_chars
+                if remaining > 0:
+                    yield node[:remaining]
+                return
+            budget.chars += len(node)
+            yield node
+        elif isinstance(node, dict):
+            stack.append(chain.from_iterable(node.items()))
+        elif isinstance(node, (list, tuple)):
+            stack.append(iter(node))
+
+
+# tool_args scanned before the rest, so padding elsewhere can't push them past the budget
+PRIORITY_TOOL_ARGS = ("command", "code", "input")
+
+
+def _tool_arg_strings(args: Any, budget: ScanBudget) -> Iterator[str]:
+    if not isinstance(args, dict):
+        yield from iter_strings(args, budget)
+        return
+    for key in PRIORITY_TOOL_ARGS:
+        if key in args:
+            yield from iter_strings({key: args[key]}, budget)
+    yield from iter_strings({k: v for k, v in args.items() if k not in PRIORITY_TOOL_ARGS}, budget)
+
+
+class RiskScoreCache:
+    """
+    LRU cache of (score, signals) keyed on action fields and a hash of the
+    scanned content. Keys carry the signature-set version, and loading a new
+    signature set clears the cache.
+    """
+
+    def __init__(self, maxsize: int):
+        self._cache = LRUCache(maxsize=maxsize)
+        self._signatures: SignatureSet | None = None
+        self.invalidations = 0
+
+    def get(self, key: tuple, signatures: SignatureSet) -> tuple[int, tuple[str, ...]] | None:
+        if signatures is not self._signatures:
+            if self._signatures is not None:
+                self._cache.clear()
+                self.invalidations += 1
+            self._signatures = signatures
+        return self._cache.get(key)
+
+    def set(self, key: tuple, value: tuple[int, tuple[str, ...]]) -> None:
+        self._cache.set(key, value)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            **self._cache.stats(),
+            "invalidations": self.invalidations,
+            "signature_version": self._signatures.version if self._signatures else None,
+        }
+
+
+risk_cache = RiskScoreCache(maxsize=settings.RISK_CACHE_SIZE)
+
+
+def _content_digest(texts: list[str]) -> bytes:
+    h = hashlib.blake2b(digest_size=16)
+    for t in texts:
+        data = t.encode("utf-8", "surrogatepass")
+        h.update(len(data).to_bytes(8, "little"))
+        h.update(data)
+    return h.digest()
+
+
+@dataclass
+class RiskScan:
+    """The parts of a payload that determine its risk score, ready to scan."""
+
+    action_type: str
+    fields: tuple[str, ...]
+    texts: list[str]
+    truncated: bool
+    chars: int
+    digest: bytes
+
+    def cache_key(self, signatures: SignatureSet, disabled: frozenset[str] = frozenset()) -> tuple:
+        return (
+            self.action_type,
+            *self.fields,
+            self.truncated,
+            signatures.version,
+            tuple(sorted(disabled)),
+            self.digest,
+        )
+
+
+def prepare_scan(action_type: str, payload: dict[str, Any]) -> RiskScan | None:
+    """Collect and hash the strings to scan (within budget); None if nothing is scored."""
+    budget = ScanBudget(max_nodes=settings.RISK_SCAN_MAX_NODES, max_chars=settings.RISK_SCAN_MAX_CHARS)
+
+    if action_type == "aws_api":
+        fields = ((payload.get("aws_service") or "").lower(), payload.get("aws_operation") or "")
+        texts = list(iter_strings(payload.get("params") or {}, budget))
+    elif action_type in {"tool_call", "codegen"}:
+        fields = ((payload.get("tool_name") or "").lower(),)
+        texts = list(_tool_arg_strings(payload.get("tool_args") or {}, budget))
+    else:
+        return None
+
+    return RiskScan(
+        action_type=action_type,
+        fields=fields,
+        texts=texts,
+        truncated=budget.truncated,
+        chars=budget.chars,
+        digest=_content_digest(texts),
+    )
+
+
+@dataclass
+class RiskResult:
+    """Outcome of one pipeline run."""
+
+    score: int
+    signals: tuple[str, ...]
+    # False when a stage ran out of its work budget
+    complete: bool = True
+    # Seconds spent per stage that ran
+    timings: dict[str, float] = field(default_factory=dict)
+
+
+class StageContext:
+    """What a risk stage sees: the prepared scan, signatures and its work budget."""
+
+    def __init__(self, scan: RiskScan, signatures: SignatureSet, max_chars: int):
+        self.scan = scan
+        self.signatures = signatures
+        self.max_chars = max_chars
+        self.chars = 0
+        self.score = 0
+        self.signals: list[str] = []
+        self.cut = False
+
+    def add(self, score: int, signal: str) -> None:
+        self.score += score
+        self.signals.append(signal)
+
+    def expired(self) -> bool:
+        return self.cut
+
+    def texts(self) -> Iterator[str]:
+        """
+        The scan's strings, stopping (and marking the stage cut) before the
+        one that would take it past max_chars. The bound is on content, not
+        time, so the same payload is always cut at the same place.
+        """
+        for t in self.scan.texts:
+            if self.chars + len(t) > self.max_chars:
+                self.cut = True
+                return
+            self.chars += len(t)
+            yield t
+
+
+@dataclass
+class RiskStage:
+    """A registered detector with its work budget, time budget and timing counters."""
+
+    name: str
+    action_types: frozenset[str]
+    run: Callable[[StageContext], None]
+    max_chars: int | None = None
+    budget_ms: float | None = None
+    calls: int = 0
+    seconds: float = 0.0
+    max_seconds: float = 0.0
+    over_budget: int = 0
+
+    @property
+    def chars(self) -> int:
+        return settings.RISK_STAGE_MAX_CHARS if self.max_chars is None else self.max_chars
+
+    @property
+    def budget(self) -> float:
+        ms = settings.RISK_STAGE_BUDGET_MS if self.budget_ms is None else self.budget_ms
+        return ms / 1000
+
+    def record(self, seconds: float) -> None:
+        self.calls += 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        if seconds > self.budget:
+            self.over_budget += 1
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "action_types": sorted(self.action_types),
+            "max_chars": self.chars,
+            "budget_ms": self.budget * 1000,
+            "calls": self.calls,
+            "avg_ms": round(1000 * self.seconds / self.calls, 3) if self.calls else 0.0,
+            "max_ms": round(1000 * self.max_seconds, 3),
+            "over_budget": self.over_budget,
+        }
+
+
+# Registered stages, run in registration order
+RISK_STAGES: dict[str, RiskStage] = {}
+
+
+def register_stage(
+    name: str,
+    action_types: Iterable[str],
+    *,
+    max_chars: int | None = None,
+    budget_ms: float | None = None,
+) -> Callable[[Callable[[StageContext], None]], Callable[[StageContext], None]]:
+    """
+    Decorator registering fn(ctx: StageContext) as a risk stage. Stages add
+    to the score with ctx.add() and read content through ctx.texts(), which
+    stops after max_chars (RISK_STAGE_MAX_CHARS by default). budget_ms
+    (RISK_STAGE_BUDGET_MS by default) is a time budget for monitoring: runs
+    that exceed it are counted as over_budget, not cut short.
+    """
+
+    def decorator(fn: Callable[[StageContext], None]) -> Callable[[StageContext], None]:
+        if name in RISK_STAGES:
+            raise ValueError(f"Risk stage {name!r} already registered")
+        RISK_STAGES[name] = RiskStage(
+            name=name, action_types=frozenset(action_types), run=fn, max_chars=max_chars, budget_ms=budget_ms
+        )
+        return fn
+
+    return decorator
+
+
+def record_timings(timings: dict[str, float]) -> None:
+    """Add a result's per-stage timings to the stage counters of this process."""
+    for name, seconds in timings.items():
+        stage = RISK_STAGES.get(name)
+        if stage is not None:
+            stage.record(seconds)
+
+
+@register_stage("high_value_service", {"aws_api"})
+def _high_value_service(ctx: StageContext) -> None:
+    svc = ctx.scan.fields[0]
+    if svc in {"iam", "organizations", "sso", "sts"}:
+        ctx.add(30, f"high_value_service:{svc}")
+
+
+@register_stage("iam_ops", {"aws_api"})
+def _iam_ops(ctx: StageContext) -> None:
+    op = ctx.scan.fields[1]
+    if op in DANGEROUS_IAM_OPS:
+        ctx.add(40, f"dangerous_operation:{op}")
+
+
+@register_stage("wildcards", {"aws_api"})
+def _wildcards(ctx: StageContext) -> None:
+    if any("*" in t for t in ctx.texts()):
+        ctx.add(15, "wildcard_detected")
+
+
+@register_stage("sensitive_tool", {"tool_call", "codegen"})
+def _sensitive_tool(ctx: StageContext) -> None:
+    tool = ctx.scan.fields[0]
+    if tool in SENSITIVE_TOOLS:
+        ctx.add(25, f"sensitive_tool:{tool}")
+
+
+@register_stage("shell_patterns", {"tool_call", "codegen"})
+def _shell_patterns(ctx: StageContext) -> None:
+    # Signatures from app/data/risk_signatures.json over every string in tool_args
+    for sig in ctx.signatures.scan_all(ctx.texts()):
+        ctx.add(sig.score, sig.signal)
+
+
+@register_stage("secrets", {"tool_call", "codegen"})
+def _secrets(ctx: StageContext) -> None:
+    # Credential formats (AWS, GitHub, Slack, JWT, PEM) and high-entropy tokens
+    if detect_secrets(ctx.texts()):
+        ctx.add(50, "secret_material_detected")
+
+
+def score_scan(
+    scan: RiskScan, signatures: SignatureSet, disabled: frozenset[str] = frozenset()
+) -> RiskResult:
+    """
+    Run the registered stages that apply to the action and are not disabled,
+    stopping once the score reaches 100. This is the CPU-heavy part.
+    A scan truncated by its budget, or a stage cut short by its work budget,
+    fails closed: the score is raised to at least APPROVAL_RISK_THRESHOLD, as
+    for a scan timeout, so padding a payload cannot hide dangerous content
+    past the cutoff.
     """
     score = 0
     signals: list[str] = []
+    timings: dict[str, float] = {}
+    complete = True
 
-    if action_type == "aws_api":
-        svc = (payload.get("aws_service") or "").lower()
-        op = payload.get("aws_operation") or ""
-        params = payload.get("params") or {}
-
-        if svc in {"iam", "organizations", "sso", "sts"}:
-            score += 30
-            signals.append(f"high_value_service:{svc}")
-
-        if op in DANGEROUS_IAM_OPS:
-            score += 40
-            signals.append(f"dangerous_operation:{op}")
-
-        doc = str(params)
-        if "*" in doc:
-            score += 15
-            signals.append("wildcard_detected")
-
-    if action_type in {"tool_call", "codegen"}:
-        tool = (payload.get("tool_name") or "").lower()
-        args = payload.get("tool_args") or {}
-        text = str(args.get("command") or args.get("code") or args.get("input") or "")
-
-        if tool in SENSITIVE_TOOLS:
-            score += 25
-            signals.append(f"sensitive_tool:{tool}")
-
-        for pat in DANGEROUS_SHELL_PATTERNS:
-            if re.search(pat, text, re.IGNORECASE):
-                score += 40
-                signals.append(f"dangerous_pattern:{pat[:30]}")
-
-        if "AWS_SECRET_ACCESS_KEY" in text or "BEGIN PRIVATE KEY" in text:
-            score += 50
-            signals.append("secret_material_detected")
-
-    return min(score, 100), signals
+    for stage in RISK_STAGES.values():
+        if score >= 100:
+            break
+        if stage.name in disabled or scan.action_type not in stage.action_types:
+            continue
+        ctx = StageContext(scan, signatures, stage.chars)
+        start = time.perf_counter()
+        stage.run(ctx)
+        timings[stage.name] = time.perf_counter() - start
+        score += ctx.score
+        signals.extend(ctx.signals)
+        if ctx.cut:
+            complete = False
+            signals.append(f"stage_budget_exceeded:{stage.name}")
+
+    if scan.truncated:
+        signals.append("scan_truncated")
+
+    score = min(score, 100)
+    if scan.truncated or not complete:
+        score = max(score, APPROVAL_RISK_THRESHOLD)
+    return RiskResult(score=score, signals=tuple(signals), complete=complete, timings=timings)
+
+
+def score_risk(
+    action_type: str, payload: dict[str, Any], disabled: frozenset[str] = frozenset()
+) -> tuple[int, list[str]]:
+    """
+    Compute risk score (0-100) and list of signals.
+    Higher score = higher risk = more likely to require approval or denial.
+    Stages named in disabled are skipped (per-tenant settings). Results are
+    cached on the scanned content (see RiskScoreCache).
+    """
+    scan = prepare_scan(action_type, payload)
+    if scan is None:
+        return 0, []
+
+    signatures = signature_library.current
+    key = scan.cache_key(signatures, disabled)
+    cached = risk_cache.get(key, signatures)
+    if cached is not None:
+        score, signals = cached
+        return score, list(signals)
+
+    result = score_scan(scan, signatures, disabled)
+    record_timings(result.timings)
+    risk_cache.set(key, (result.score, result.signals))
+    return result.score, list(result.signals)
+
+
+for _module in filter(None, (m.strip() for m in settings.RISK_STAGE_MODULES.split(","))):
+    # Custom stages register themselves on import (also inside scan workers)
+    importlib.import_module(_module)
@@ -0,0 +1,173 @@
+"""Risk scoring service that moves large payload scans off the event loop."""
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import replace
+from pathlib import Path
+from typing import Any
+
+from app.core.config import settings
+from app.services.policy_engine import APPROVAL_RISK_THRESHOLD
+from app.services.risk import RiskResult, RiskScan, prepare_scan, record_timings, risk_cache, score_scan
+from app.services.signatures import SignatureSet, signature_library
+
+logger = logging.getLogger(__name__)
+
+
+def _scan_in_worker(
+    scan: RiskScan, path: str | Path | None, version: str, disabled: frozenset[str]
+) -> RiskResult:
+    signatures = signature_library.current
+    if signature_library.path != path or signatures.version != version:
+        signatures = signature_library.reload(path)
+    return score_scan(scan, signatures, disabled)
+
+
+class RiskScanService:
+    """
+    Scores payloads inline when small and in a process pool when they exceed
+    RISK_OFFLOAD_MIN_CHARS. At most RISK_POOL_QUEUE_SIZE scans are queued or
+    running; callers wait for a slot (back-pressure) within the same
+    RISK_SCAN_TIMEOUT deadline as the scan itself. A scan that misses its
+    deadline is scored without content inspection, floored at the approval
+    threshold, and flagged scan_timeout, scan_overloaded or scan_failed.
+    """
+
+    def __init__(self) -> None:
+        self._pool: ProcessPoolExecutor | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self.depth = 0
+        self.max_depth = 0
+        self.inline = 0
+        self.offloaded = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.failures = 0
+        self.scan_seconds = 0.0
+        self.max_scan_seconds = 0.0
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=settings.RISK_POOL_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    async def score_risk(
+        self, action_type: str, payload: dict[str, Any], disabled: frozenset[str] = frozenset()
+    ) -> tuple[int, list[str]]:
+        """Async score_risk(): same results and cache, large scans in the pool."""
+        scan = prepare_scan(action_type, payload)
+        if scan is None:
+            return 0, []
+
+        signatures = signature_library.current
+        key = scan.cache_key(signatures, disabled)
+        cached = risk_cache.get(key, signatures)
+        if cached is not None:
+            score, signals = cached
+            return score, list(signals)
+
+        if settings.RISK_POOL_WORKERS <= 0 or scan.chars < settings.RISK_OFFLOAD_MIN_CHARS:
+            self.inline += 1
+            result = score_scan(scan, signatures, disabled)
+        else:
+            result, failure = await self._offload(scan, signatures, disabled)
+            if result is None:
+                return self._unscanned(scan, signatures, disabled, failure)
+
+        record_timings(result.timings)
+        risk_cache.set(key, (result.score, result.signals))
+        return result.score, list(result.signals)
+
+    async def _offload(
+        self, scan: RiskScan, signatures: SignatureSet, disabled: frozenset[str]
+    ) -> tuple[RiskResult | None, str]:
+        """Run score_scan in the pool; returns (result, "") or (None, failure signal)."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(settings.RISK_POOL_QUEUE_SIZE)
+        slots = self._slots
+        start = time.monotonic()
+        deadline = start + settings.RISK_SCAN_TIMEOUT
+
+        if slots.locked():
+            try:
+                await asyncio.wait_for(slots.acquire(), settings.RISK_SCAN_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                return None, "scan_overloaded"
+        else:
+            await slots.acquire()
+
+        self.depth += 1
+        self.max_depth = max(self.max_depth, self.depth)
+
+        def release(_fut: asyncio.Future) -> None:
+            # The slot is held until the worker is done, even after a timeout.
+            self.depth -= 1
+            slots.release()
+
+        try:
+            fut = asyncio.get_running_loop().run_in_executor(
+                self._executor(), _scan_in_worker, scan, signature_library.path, signatures.version, disabled
+            )
+        except BrokenProcessPool:
+            release(None)
+            self._pool = None
+            self.failures += 1
+            return None, "scan_failed"
+        fut.add_done_callback(release)
+
+        try:
+            result = await asyncio.wait_for(asyncio.shield(fut), max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return None, "scan_timeout"
+        except BrokenProcessPool:
+            self._pool = None
+            self.failures += 1
+            logger.warning("Risk scan pool broke, recreating", exc_info=True)
+            return None, "scan_failed"
+
+        elapsed = time.monotonic() - start
+        self.offloaded += 1
+        self.scan_seconds += elapsed
+        self.max_scan_seconds = max(self.max_scan_seconds, elapsed)
+        return result, ""
+
+    def _unscanned(
+        self, scan: RiskScan, signatures: SignatureSet, disabled: frozenset[str], failure: str
+    ) -> tuple[int, list[str]]:
+        """Score from action fields only, for content that could not be scanned."""
+        result = score_scan(replace(scan, texts=[]), signatures, disabled)
+        return max(result.score, APPROVAL_RISK_THRESHOLD), [*result.signals, failure]
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "workers": settings.RISK_POOL_WORKERS,
+            "queue_size": settings.RISK_POOL_QUEUE_SIZE,
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "inline": self.inline,
+            "offloaded": self.offloaded,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "failures": self.failures,
+            "avg_scan_ms": round(1000 * self.scan_seconds / self.offloaded, 3) if self.offloaded else 0.0,
+            "max_scan_ms": round(1000 * self.max_scan_seconds, 3),
+        }
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        self._slots = None
+
+
+risk_scanner = RiskScanService()
@@ -0,0 +1,132 @@
+"""Per-rule evaluation statistics: periodic flush to the database and rule re-ordering."""
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime
+from uuid import UUID
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.core.config import settings
+from app.db.models import RuleStat
+from app.db.session import async_session
+from app.services.policy_cache import policy_cache
+
+logger = logging.getLogger(__name__)
+
+_FLUSH_BATCH = 1000
+
+# Counters drained from compiled sets whose write has not committed yet
+_unflushed: dict[tuple[str, str, str], list[int]] = {}
+
+
+def _add(totals: dict, key: tuple, evaluated: int, matched: int) -> None:
+    acc = totals.setdefault(key, [0, 0])
+    acc[0] += evaluated
+    acc[1] += matched
+
+
+async def flush_rule_stats() -> int:
+    """
+    Drain in-memory rule counters from all compiled policy sets and add them
+    to rule_stats with batched upserts. Returns the number of rows written.
+    If the write fails the counters are kept for the next flush.
+    """
+    global _unflushed
+    compiled_sets = [(s.tenant_id, s.compiled) for s in policy_cache.snapshots()]
+    compiled_sets += policy_cache.drain_retired()
+    for tenant_id, compiled in compiled_sets:
+        for policy, rule, evaluated, matched in compiled.drain_stats():
+            _add(_unflushed, (tenant_id, str(policy)[:200], str(rule)[:200]), evaluated, matched)
+
+    if not _unflushed:
+        return 0
+    totals, _unflushed = _unflushed, {}
+
+    now = datetime.utcnow()
+    rows = [
+        {
+            "tenant_id": UUID(tenant_id),
+            "policy_name": policy,
+            "rule_name": rule,
+            "evaluated": evaluated,
+            "matched": matched,
+            "updated_at": now,
+        }
+        for (tenant_id, policy, rule), (evaluated, matched) in totals.items()
+    ]
+    try:
+        async with async_session() as session:
+            # Stay well under Postgres' bind-parameter limit per statement
+            for i in range(0, len(rows), _FLUSH_BATCH):
+                stmt = pg_insert(RuleStat).values(rows[i : i + _FLUSH_BATCH])
+                stmt = stmt.on_conflict_do_update(
+                    constraint="uq_rule_stats_tenant_rule",
+                    set_={
+                        "evaluated": RuleStat.evaluated + stmt.excluded.evaluated,
+                        "matched": RuleStat.matched + stmt.excluded.matched,
+                        "updated_at": stmt.excluded.updated_at,
+                    },
+                )
+                await session.execute(stmt)
+            await session.commit()
+    except Exception:
+        # Another flush may have drained new counts meanwhile: add, not replace
+        for key, (evaluated, matched) in totals.items():
+            _add(_unflushed, key, evaluated, matched)
+        raise
+    return len(totals)
+
+
+def pending_rule_stats(tenant_id: str) -> dict[tuple[str, str], list[int]]:
+    """This worker's unflushed (evaluated, matched) per (policy, rule) for one tenant, without draining."""
+    totals: dict[tuple[str, str], list[int]] = {}
+    for (tid, policy, rule), (evaluated, matched) in _unflushed.items():
+        if tid == tenant_id:
+            _add(totals, (policy, rule), evaluated, matched)
+    for compiled in policy_cache.compiled_sets(tenant_id):
+        for policy, rule, evaluated, matched in compiled.peek_stats():
+            _add(totals, (str(policy)[:200], str(rule)[:200]), evaluated, matched)
+    return totals
+
+
+def optimize_rule_order() -> int:
+    """Re-anchor cached policy sets from their sampled traffic. Returns sets changed."""
+    return sum(1 for snap in policy_cache.snapshots() if snap.compiled.optimize())
+
+
+class RuleStatsFlusher:
+    """Background task that flushes rule stats and re-orders rules periodically."""
+
+    def __init__(self) -> None:
+        self._task: asyncio.Task | None = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.RULE_STATS_FLUSH_INTERVAL)
+            try:
+                optimize_rule_order()
+                await flush_rule_stats()
+            except Exception:
+                logger.warning("Rule stats flush failed", exc_info=True)
+
+    def start(self) -> None:
+        if self._task is None and settings.RULE_STATS_FLUSH_INTERVAL > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await flush_rule_stats()
+        except Exception:
+            logger.warning("Final rule stats flush failed", exc_info=True)
+
+
+rule_stats_flusher = RuleStatsFlusher()
@@ -0,0 +1,94 @@
+"""Secret material detection: known credential formats plus high-entropy tokens."""
+from __future__ import annotations
+
+import re
+import string
+from typing import Iterable
+
+import numpy as np
+
+# Known credential formats: kind -> (markers, pattern). Every match starts
+# with one of the markers, so the pattern is only tried where a marker occurs.
+SECRET_PATTERNS = {
+    "aws_access_key_id": (
+        ("AKIA", "ASIA", "ABIA", "ACCA"),
+        r"\b(?:AKIA|ASIA|ABIA|ACCA)[0-9A-Z]{16}\b",
+    ),
+    "aws_secret_env": (("AWS_SECRET_ACCESS_KEY",), r"AWS_SECRET_ACCESS_KEY"),
+    "github_token": (
+        ("ghp_", "gho_", "ghu_", "ghs_", "ghr_", "github_pat_"),
+        r"\b(?:gh[pousr]_[A-Za-z0-9]{36,255}|github_pat_[A-Za-z0-9_]{82})\b",
+    ),
+    "slack_token": (("xoxa-", "xoxb-", "xoxp-", "xoxr-", "xoxs-"), r"\bxox[abprs]-[A-Za-z0-9-]{10,}"),
+    "slack_webhook": (
+        ("https://hooks.slack.com/services/",),
+        r"https://hooks\.slack\.com/services/T[A-Z0-9]+/B[A-Z0-9]+/[A-Za-z0-9]+",
+    ),
+    "jwt": (("eyJ",), r"\beyJ[A-Za-z0-9_-]{8,}\.eyJ[A-Za-z0-9_-]{8,}\.[A-Za-z0-9_-]{8,}"),
+    "private_key": (("BEGIN ",), r"BEGIN (?:[A-Z0-9]+ )*PRIVATE KEY"),
+}
+_COMPILED = {kind: (markers, re.compile(pat)) for kind, (markers, pat) in SECRET_PATTERNS.items()}
+
+# Entropy check: base64/URL-safe runs of this length whose Shannon entropy
+# (bits per character) reaches the threshold. Hex digests top out at 4 bits.
+ENTROPY_MIN_LEN = 32
+ENTROPY_MAX_LEN = 512
+ENTROPY_THRESHOLD = 4.5
+
+_TOKEN_ALPHABET = string.ascii_letters + string.digits + "+/=_-"
+_SYMBOLS = len(_TOKEN_ALPHABET)
+# Byte -> index in _TOKEN_ALPHABET, or -1 for bytes that end a token
+_SYMBOL = np.full(256, -1, dtype=np.int16)
+_SYMBOL[np.frombuffer(_TOKEN_ALPHABET.encode(), dtype=np.uint8)] = np.arange(_SYMBOLS)
+
+
+def token_entropies(data: bytes) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Start offsets and Shannon entropies of every token run in data within
+    the candidate length range, computed for all runs at once.
+    """
+    sym = _SYMBOL[np.frombuffer(data, dtype=np.uint8)]
+    is_token = np.concatenate(([False], sym >= 0, [False]))
+    edges = np.flatnonzero(is_token[1:] != is_token[:-1])
+    starts, lengths = edges[::2], edges[1::2] - edges[::2]
+    keep = (lengths >= ENTROPY_MIN_LEN) & (lengths <= ENTROPY_MAX_LEN)
+    starts, lengths = starts[keep], lengths[keep]
+    if not len(starts):
+        return starts, np.empty(0)
+
+    # Per-run symbol histograms via one bincount over (run, symbol) cells
+    run_ids = np.repeat(np.arange(len(starts)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    symbols = sym[np.repeat(starts, lengths) + offsets]
+    counts = np.bincount(run_ids * _SYMBOLS + symbols, minlength=len(starts) * _SYMBOLS)
+    p = counts.reshape(len(starts), _SYMBOLS) / lengths[:, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        entropy = -np.where(p > 0, p * np.log2(p), 0.0).sum(axis=1)
+    return starts, entropy
+
+
+def _has_match(text: str, markers: tuple[str, ...], regex: re.Pattern) -> bool:
+    for marker in markers:
+        i = text.find(marker)
+        while i != -1:
+            if regex.match(text, i):
+                return True
+            i = text.find(marker, i + 1)
+    return False
+
+
+def detect_secrets(texts: Iterable[str]) -> list[str]:
+    """Kinds of secret material found in texts, in SECRET_PATTERNS order then high_entropy."""
+    text = "\n".join(texts)
+    if not text:
+        return []
+
+    kinds = [
+        kind for kind, (markers, regex) in _COMPILED.items() if _has_match(text, markers, regex)
+    ]
+
+    if len(text) >= ENTROPY_MIN_LEN:
+        _, entropy = token_entropies(text.encode("utf-8"))
+        if (entropy >= ENTROPY_THRESHOLD).any():
+            kinds.append("high_entropy")
+    return kinds
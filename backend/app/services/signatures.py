@@ -0,0 +1,280 @@
+"""Risk signature libraries compiled into a single-pass multi-pattern scanner."""
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterable
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:  # pragma: no cover
+    import sre_parse
+
+from app.core.config import settings
+
+DEFAULT_SIGNATURES_PATH = Path(__file__).resolve().parent.parent / "data" / "risk_signatures.json"
+SIGNATURE_TYPES = ("regex", "literal")
+
+# Shortest required literal worth using as a regex prefilter
+_MIN_FACTOR = 2
+# Non-ASCII characters that re.IGNORECASE treats as equal to an ASCII letter
+_FOLD_SPECIALS = str.maketrans({"\u0130": "i", "\u0131": "i", "\u017f": "s", "\u212a": "k"})
+
+
+def _fold(text: str) -> str:
+    """Case-fold so that ASCII re.IGNORECASE matches remain substring matches."""
+    return text.translate(_FOLD_SPECIALS).lower()
+
+
+class SignatureError(ValueError):
+    """Raised when a signature file is malformed."""
+
+
+@dataclass(frozen=True)
+class Signature:
+    id: str
+    pattern: str
+    type: str = "regex"
+    score: int = 40
+    signal: str = ""
+    ignore_case: bool = True
+
+    def __post_init__(self) -> None:
+        if not self.signal:
+            object.__setattr__(self, "signal", f"dangerous_pattern:{self.pattern[:30]}")
+
+
+def _factors(parsed: Any) -> set[str] | None:
+    """
+    Literals of which at least one occurs in every match of a parsed pattern:
+    the longest run of ASCII literals in the sequence, or the union of the
+    factors of every branch of an alternation. None if nothing is required.
+    """
+    options: list[set[str]] = []
+    run: list[str] = []
+
+    def close_run() -> None:
+        if len(run) >= _MIN_FACTOR:
+            options.append({"".join(run)})
+        run.clear()
+
+    for op, av in parsed:
+        if op is sre_parse.LITERAL and av < 128:
+            run.append(chr(av))
+            continue
+        if op is sre_parse.AT:
+            # Zero-width assertions (\b, ^) keep adjacent literals contiguous
+            continue
+        close_run()
+        inner = None
+        if op is sre_parse.SUBPATTERN:
+            _, add_flags, del_flags, sub = av
+            if not (add_flags or del_flags):
+                inner = _factors(sub)
+        elif op is sre_parse.BRANCH:
+            branches = [_factors(b) for b in av[1]]
+            if all(branches):
+                inner = set().union(*branches)
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[0] >= 1:
+            inner = _factors(av[2])
+        if inner:
+            options.append(inner)
+    close_run()
+
+    if not options:
+        return None
+    # Prefer the option whose shortest literal is longest (rarest), then fewest literals
+    return max(options, key=lambda o: (min(map(len, o)), -len(o)))
+
+
+def _required_literals(pattern: str, flags: int) -> tuple[set[str], bool] | None:
+    """
+    Literals of which one must occur for pattern to match, case-folded when
+    the pattern ignores case, and whether it does. None if there are none.
+    """
+    parsed = sre_parse.parse(pattern, flags)
+    ignore_case = bool(parsed.state.flags & re.IGNORECASE)
+    words = _factors(parsed)
+    if not words:
+        return None
+    return ({_fold(w) for w in words} if ignore_case else words), ignore_case
+
+
+def _trie_regex(words: list[str]) -> str:
+    """Alternation of words as a trie, preferring the longest word at a position."""
+    trie: dict = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def render(node: dict) -> str:
+        alts = [re.escape(ch) + render(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        if "" in node:
+            return f"(?:{body})?"
+        return body
+
+    return render(trie)
+
+
+class _LiteralScanner:
+    """All occurrences of a literal set in one regex pass, overlaps included."""
+
+    def __init__(self, words: set[str]):
+        self._finder = re.compile(f"(?=({_trie_regex(sorted(words))}))") if words else None
+        # The scan reports the longest word at each position; every word that
+        # is a prefix of it also occurs there.
+        self._prefixes = {
+            w: [w[:i] for i in range(1, len(w) + 1) if w[:i] in words] for w in words
+        }
+
+    def scan(self, text: str) -> set[str]:
+        found: set[str] = set()
+        if self._finder is None:
+            return found
+        prefixes = self._prefixes
+        for m in self._finder.finditer(text):
+            word = m.group(1)
+            if word not in found:
+                found.update(prefixes[word])
+        return found
+
+
+class SignatureSet:
+    """
+    A versioned signature library compiled for scanning.
+    Literals and the required literals of regexes go into two trie scans
+    (case-insensitive over case-folded text, case-sensitive over raw text);
+    only regexes whose required literal occurred are then run. Results are
+    identical to testing every signature independently, with literals
+    matching like re.escape(pattern).
+    """
+
+    def __init__(self, version: str, signatures: list[Signature]):
+        self.version = version
+        self.signatures = tuple(signatures)
+        self._regexes: dict[int, re.Pattern] = {}
+        self._always: list[int] = []
+        # (ignore_case, word) -> signature indexes triggered by that word
+        triggers: dict[tuple[bool, str], list[int]] = {}
+
+        for i, sig in enumerate(self.signatures):
+            flags = re.IGNORECASE if sig.ignore_case else 0
+            pattern = sig.pattern
+            if sig.type == "literal":
+                if not sig.ignore_case or pattern.isascii():
+                    word = _fold(pattern) if sig.ignore_case else pattern
+                    triggers.setdefault((sig.ignore_case, word), []).append(i)
+                    continue
+                # Unicode case rules: match exactly like the escaped regex would
+                pattern = re.escape(pattern)
+            self._regexes[i] = re.compile(pattern, flags)
+            factors = _required_literals(pattern, flags)
+            if factors is None:
+                self._always.append(i)
+                continue
+            words, ignore_case = factors
+            for word in words:
+                triggers.setdefault((ignore_case, word), []).append(i)
+
+        self._triggers = triggers
+        self._folded = _LiteralScanner({w for ci, w in triggers if ci})
+        self._exact = _LiteralScanner({w for ci, w in triggers if not ci})
+
+    def __len__(self) -> int:
+        return len(self.signatures)
+
+    def scan(self, text: str) -> list[Signature]:
+        """Signatures that match text, in library order."""
+        return self.scan_all((text,))
+
+    def scan_all(self, texts: Iterable[str]) -> list[Signature]:
+        """Signatures that match any of texts (each scanned separately), in library order."""
+        matched: set[int] = set()
+        triggers = self._triggers
+        for text in texts:
+            candidates = set(self._always)
+            if text:
+                for w in self._folded.scan(_fold(text)):
+                    candidates.update(triggers[(True, w)])
+                for w in self._exact.scan(text):
+                    candidates.update(triggers[(False, w)])
+            for i in candidates - matched:
+                regex = self._regexes.get(i)
+                if regex is None or regex.search(text):
+                    matched.add(i)
+        return [self.signatures[i] for i in sorted(matched)]
+
+
+def _parse_signature(raw: Any, where: str) -> Signature:
+    if not isinstance(raw, dict):
+        raise SignatureError(f"{where}: signature must be an object")
+    pattern = raw.get("pattern")
+    if not isinstance(pattern, str) or not pattern:
+        raise SignatureError(f"{where}.pattern: must be a non-empty string")
+    sig_type = raw.get("type", "regex")
+    if sig_type not in SIGNATURE_TYPES:
+        raise SignatureError(f"{where}.type: must be one of {', '.join(SIGNATURE_TYPES)}")
+    score = raw.get("score", 40)
+    if not isinstance(score, int) or isinstance(score, bool):
+        raise SignatureError(f"{where}.score: must be an integer")
+    if sig_type == "regex":
+        try:
+            re.compile(pattern)
+        except re.error as e:
+            raise SignatureError(f"{where}.pattern: {e}") from e
+    return Signature(
+        id=str(raw.get("id") or pattern),
+        pattern=pattern,
+        type=sig_type,
+        score=score,
+        signal=str(raw.get("signal") or ""),
+        ignore_case=bool(raw.get("ignore_case", True)),
+    )
+
+
+def load_signatures(path: str | Path) -> SignatureSet:
+    """Load a signature file: {"version": ..., "signatures": [{"pattern": ...}, ...]}."""
+    try:
+        doc = json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e:
+        raise SignatureError(f"{path}: {e}") from e
+    if not isinstance(doc, dict) or not isinstance(doc.get("signatures"), list):
+        raise SignatureError(f"{path}: expected an object with a signatures list")
+    version = doc.get("version")
+    if not isinstance(version, (str, int)) or version == "":
+        raise SignatureError(f"{path}: missing version")
+    return SignatureSet(
+        str(version),
+        [_parse_signature(s, f"signatures[{i}]") for i, s in enumerate(doc["signatures"])],
+    )
+
+
+class SignatureLibrary:
+    """The active signature set, loaded on first use from RISK_SIGNATURES_PATH."""
+
+    def __init__(self, path: str | Path | None = None):
+        self.path = path
+        self._current: SignatureSet | None = None
+
+    @property
+    def current(self) -> SignatureSet:
+        if self._current is None:
+            self._current = load_signatures(self.path or DEFAULT_SIGNATURES_PATH)
+        return self._current
+
+    def reload(self, path: str | Path | None = None) -> SignatureSet:
+        """Load (a new) signature file and make it active."""
+        if path is not None:
+            self.path = path
+        self._current = load_signatures(self.path or DEFAULT_SIGNATURES_PATH)
+        return self._current
+
+
+signature_library = SignatureLibrary(settings.RISK_SIGNATURES_PATH or None)
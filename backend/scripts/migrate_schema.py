@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Schema migration: bring a database created by an earlier release up to date.
+init_db (create_all) only creates missing tables; this also changes existing ones:
+
+- creates request_payloads / request_payload_blobs and the indexes added to
+  evaluations and approval_requests;
+- adds evaluations.risk_signals, filled from request_payload->'risk_signals';
+- moves evaluations.request_payload into request_payloads, once per tenant
+  and body (compressing oversized ones), re-keys evaluations.request_hash to
+  the tenant-scoped hash, adds the request_hash foreign key and drops the
+  request_payload column.
+
+Idempotent; safe to re-run after an interruption. Stop the API while it runs:
+the old release can't write without request_payload, the new one without
+risk_signals.
+Run: docker compose run --rm api python -m scripts.migrate_schema
+Or: cd backend && python -m scripts.migrate_schema (with DATABASE_URL set)
+"""
+import asyncio
+from typing import Any
+
+from sqlalchemy import String, column, text, update, values
+from sqlalchemy.dialects.postgresql import JSONB, UUID as PG_UUID
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+
+from app.db.models import Base, Evaluation
+from app.db.session import engine as app_engine
+from app.services.payload_store import payload_store, request_hash
+
+_BATCH = 1000
+
+
+async def _has_column(conn, table: str, column: str) -> bool:
+    result = await conn.execute(
+        text(
+            "SELECT 1 FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = :table AND column_name = :column"
+        ),
+        {"table": table, "column": column},
+    )
+    return result.first() is not None
+
+
+async def _backfill_evaluations(engine: AsyncEngine) -> int:
+    """
+    Copy each evaluation's request_payload (minus risk_signals) into
+    request_payloads under its tenant-scoped hash, point request_hash at it
+    and fill risk_signals, _BATCH evaluations (in id order) per transaction,
+    so no statement locks or rewrites the whole table.
+    """
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+    copied = 0
+    batch: list[tuple[Any, str, list, dict[str, Any]]] = []
+
+    async def flush() -> None:
+        nonlocal copied
+        rows = values(
+            column("id", PG_UUID(as_uuid=True)),
+            column("hash", String),
+            column("signals", JSONB),
+            name="backfill",
+        ).data([(ev_id, h, signals) for ev_id, h, signals, _ in batch])
+        async with sessions() as session:
+            stored = await payload_store.write(session, {h: payload for _, h, _, payload in batch})
+            await session.execute(
+                update(Evaluation)
+                .where(Evaluation.id == rows.c.id)
+                .values(request_hash=rows.c.hash, risk_signals=rows.c.signals)
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+        payload_store.remember(stored)
+        copied += len(stored)
+        batch.clear()
+
+    async with engine.connect() as conn:
+        rows = await conn.stream(
+            text(
+                "SELECT id, tenant_id, request_payload->'risk_signals', request_payload - 'risk_signals' "
+                "FROM evaluations WHERE request_payload IS NOT NULL ORDER BY id"
+            )
+        )
+        async for ev_id, tenant_id, signals, payload in rows:
+            signals = signals if isinstance(signals, list) else []
+            batch.append((ev_id, request_hash(tenant_id, payload), signals, payload))
+            if len(batch) >= _BATCH:
+                await flush()
+    if batch:
+        await flush()
+    return copied
+
+
+async def migrate(engine: AsyncEngine) -> dict[str, Any]:
+    """Apply every pending step to the database behind engine. Returns what was done."""
+    report: dict[str, Any] = {"payloads_copied": 0, "dropped_request_payload": False}
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        # create_all skips indexes on tables that already existed
+        await conn.execute(
+            text(
+                "CREATE INDEX IF NOT EXISTS ix_eval_idempotency_created_at "
+                "ON evaluations (created_at) WHERE idempotency_key IS NOT NULL"
+            )
+        )
+        await conn.execute(
+            text(
+                "CREATE INDEX IF NOT EXISTS ix_approval_requests_evaluation_id "
+                "ON approval_requests (evaluation_id)"
+            )
+        )
+        await conn.execute(
+            text(
+                "ALTER TABLE evaluations ADD COLUMN IF NOT EXISTS "
+                "risk_signals JSONB NOT NULL DEFAULT '[]'::jsonb"
+            )
+        )
+        legacy = await _has_column(conn, "evaluations", "request_payload")
+
+    if legacy:
+        report["payloads_copied"] = await _backfill_evaluations(engine)
+
+    async with engine.begin() as conn:
+        result = await conn.execute(
+            text(
+                "SELECT 1 FROM pg_constraint "
+                "WHERE conname = 'evaluations_request_hash_fkey' AND conrelid = 'evaluations'::regclass"
+            )
+        )
+        if result.first() is None:
+            await conn.execute(
+                text(
+                    "ALTER TABLE evaluations ADD CONSTRAINT evaluations_request_hash_fkey "
+                    "FOREIGN KEY (request_hash) REFERENCES request_payloads (hash)"
+                )
+            )
+        if legacy:
+            await conn.execute(text("ALTER TABLE evaluations DROP COLUMN request_payload"))
+            report["dropped_request_payload"] = True
+        await conn.execute(text("ALTER TABLE evaluations ALTER COLUMN risk_signals DROP DEFAULT"))
+
+    return report
+
+
+async def main() -> None:
+    report = await migrate(app_engine)
+    print(f"Copied {report['payloads_copied']} distinct payloads into request_payloads")
+    if report["dropped_request_payload"]:
+        print("Dropped evaluations.request_payload")
+    print("Schema is up to date")
+    await app_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Policy replay CLI: report which past evaluations a candidate policy would flip.
+Read-only; nothing is written to the database.
+Run: docker compose exec api python -m scripts.replay candidate.json --name starter
+Or: cd backend && python -m scripts.replay candidate.json (with DATABASE_URL set)
+
+candidate.json holds the policy DSL ({"rules": [...]}) as accepted by PUT /v1/policies.
+"""
+import argparse
+import asyncio
+import json
+import os
+from dataclasses import asdict
+from datetime import datetime
+
+from sqlalchemy import select
+
+from app.db.models import Tenant
+from app.db.session import async_session
+from app.services.policy_engine import compile_policies
+from app.services.replay import replay_policies
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dsl_file", help="Path to candidate policy DSL JSON")
+    parser.add_argument("--name", help="Policy name to upsert (default: file name)")
+    parser.add_argument("--disabled", action="store_true", help="Replay with the policy disabled")
+    parser.add_argument("--tenant", default=os.environ.get("TENANT_NAME", "demo-tenant"))
+    parser.add_argument("--since", type=datetime.fromisoformat, help="Only evaluations at/after this ISO time")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--samples", type=int, default=20)
+    args = parser.parse_args()
+
+    with open(args.dsl_file) as f:
+        dsl = json.load(f)
+    name = args.name or os.path.splitext(os.path.basename(args.dsl_file))[0]
+    compile_policies([{"name": name, "rules": dsl.get("rules", [])}], strict=True)
+
+    async with async_session() as session:
+        result = await session.execute(select(Tenant).where(Tenant.name == args.tenant))
+        t = result.scalar_one_or_none()
+    if not t:
+        raise SystemExit(f"Tenant not found: {args.tenant}")
+
+    report = await replay_policies(
+        str(t.id),
+        {"name": name, "enabled": not args.disabled, "rules": dsl.get("rules", [])},
+        since=args.since,
+        limit=args.limit,
+        sample_size=args.samples,
+    )
+    print(json.dumps(asdict(report), indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -68,3 +68,144 @@ async def test_upsert_policy(app_client):
     assert r.status_code == 200
     assert r.json()["ok"] is True
     assert r.json()["name"] == "test-custom"
+
+
+@pytest.mark.asyncio
+async def test_upsert_policy_rejects_malformed_rule(app_client):
+    """Malformed rules are rejected at compile time."""
+    client, _ = app_client
+
+    r = await client.put(
+        "/v1/policies",
+        json={
+            "name": "test-malformed",
+            "enabled": True,
+            "dsl": {"rules": [{"name": "typo", "effect": "DENNY", "match": {}}]},
+        },
+    )
+    assert r.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_policy_stats_after_evaluate(app_client):
+    """Rule counters are flushed and exposed per tenant."""
+    import uuid
+
+    client, _ = app_client
+
+    r = await client.post(
+        "/v1/evaluate",
+        json={
+            "action_type": "tool_call",
+            "actor": f"stats-{uuid.uuid4().hex[:8]}",
+            "tool_name": "shell",
+            "tool_args": {"command": "ls"},
+            "context": {},
+        },
+    )
+    assert r.status_code == 200
+
+    r = await client.get("/v1/policies/stats")
+    assert r.status_code == 200
+    stats = {(s["policy"], s["rule"]): s for s in r.json()}
+    hit = stats[("starter", "require-approval-sensitive-tools")]
+    assert hit["evaluated"] >= 1 and hit["matched"] >= 1
+
+    # Reading stats writes nothing: the counters are still pending in this worker
+    from app.core.security import authenticate_api_key
+    from app.services.rule_stats import pending_rule_stats
+
+    tenant_id = (await authenticate_api_key(client.headers["X-Api-Key"])).tenant_id
+    assert pending_rule_stats(tenant_id)[("starter", "require-approval-sensitive-tools")][1] >= 1
+
+
+
+@pytest.mark.asyncio
+async def test_failed_rule_stats_flush_keeps_counters(app_client, monkeypatch):
+    """Counters drained for a write that fails are kept and written by the next flush."""
+    import uuid
+
+    from app.core.security import authenticate_api_key
+    from app.services import rule_stats
+
+    client, _ = app_client
+    tenant_id = (await authenticate_api_key(client.headers["X-Api-Key"])).tenant_id
+    key = ("starter", "require-approval-sensitive-tools")
+
+    r = await client.post(
+        "/v1/evaluate",
+        json={
+            "action_type": "tool_call",
+            "actor": f"stats-{uuid.uuid4().hex[:8]}",
+            "tool_name": "shell",
+            "tool_args": {"command": "ls"},
+            "context": {},
+        },
+    )
+    assert r.status_code == 200
+    pending = rule_stats.pending_rule_stats(tenant_id)[key]
+    assert pending[1] >= 1
+
+    def broken_session():
+        raise ConnectionError("database unavailable")
+
+    monkeypatch.setattr(rule_stats, "async_session", broken_session)
+    with pytest.raises(ConnectionError):
+        await rule_stats.flush_rule_stats()
+    assert rule_stats.pending_rule_stats(tenant_id)[key] == pending
+
+    monkeypatch.undo()
+    assert await rule_stats.flush_rule_stats() >= 1
+    assert key not in rule_stats.pending_rule_stats(tenant_id)
+
+@pytest.mark.asyncio
+async def test_oversized_payload_is_compressed_out_of_row(app_client):
+    """Large payloads keep a preview in row; audit detail and replay see the full body."""
+    import uuid
+
+    from sqlalchemy import select
+
+    from app.db.models import RequestPayload, RequestPayloadBlob
+    from app.db.session import async_session
+
+    client, _ = app_client
+    marker = uuid.uuid4().hex
+    code = "x = 1\n" * 20000 + f"# {marker}\n"
+    r = await client.post(
+        "/v1/evaluate",
+        json={"action_type": "codegen", "actor": marker, "tool_name": "python", "tool_args": {"code": code}},
+    )
+    assert r.status_code == 200
+    evaluation_id = r.json()["evaluation_id"]
+
+    r = await client.get(f"/v1/audit/{evaluation_id}")
+    assert r.status_code == 200
+    entry = r.json()
+    assert entry["request_payload"]["tool_args"]["code"] == code
+
+    async with async_session() as session:
+        result = await session.execute(
+            select(RequestPayload, RequestPayloadBlob.size)
+            .join(RequestPayloadBlob, RequestPayloadBlob.hash == RequestPayload.hash)
+            .where(RequestPayload.payload["actor"].astext == marker)
+        )
+        stored, size = result.one()
+    assert stored.compressed and size > len(code)
+    assert marker not in stored.payload["tool_args"]["code"] and len(stored.payload["tool_args"]["code"]) < 300
+
+    # A rule reading past the preview still matches on replay
+    candidate = {
+        "name": f"candidate-{marker}",
+        "enabled": True,
+        "dsl": {
+            "rules": [
+                {"name": "deny-marker", "effect": "DENY", "match": {"glob": {"tool_args.code": f"*{marker}*"}}}
+            ]
+        },
+    }
+    r = await client.post("/v1/policies/replay", json=candidate)
+    assert r.status_code == 200
+    assert r.json()["by_actor"].get(marker) == 1
+
+    r = await client.get(f"/v1/audit/{uuid.uuid4()}")
+    assert r.status_code == 404
@@ -114,3 +114,234 @@ async def test_evaluate_rejects_invalid_api_key(app_client):
             },
         )
     assert r.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_metrics_report_risk_scanner_and_caches(app_client):
+    """Evaluations show up in the worker metrics."""
+    client, _ = app_client
+
+    r = await client.post(
+        "/v1/evaluate",
+        json={"action_type": "tool_call", "tool_name": "search", "tool_args": {"query": "metrics"}},
+    )
+    assert r.status_code == 200
+
+    r = await client.get("/v1/metrics")
+    assert r.status_code == 200
+    data = r.json()
+    assert data["risk_scanner"]["inline"] + data["risk_cache"]["hits"] >= 1
+    assert {"depth", "max_depth", "avg_scan_ms", "timeouts"} <= set(data["risk_scanner"])
+    assert "hits" in data["policy_memo"]
+
+
+@pytest.mark.asyncio
+async def test_risk_stage_can_be_disabled_per_tenant(app_client):
+    """A disabled stage no longer contributes to the tenant's risk score."""
+    client, _ = app_client
+    body = {"action_type": "tool_call", "tool_name": "shell", "tool_args": {"command": "ls"}}
+
+    r = await client.put("/v1/risk/stages/sensitive_tool", json={"enabled": True})
+    assert r.status_code == 200
+    r = await client.post("/v1/evaluate", json=body)
+    assert "sensitive_tool:shell" in r.json()["risk_signals"]
+
+    r = await client.put("/v1/risk/stages/sensitive_tool", json={"enabled": False})
+    assert r.status_code == 200
+    r = await client.put("/v1/risk/stages/no_such_stage", json={"enabled": False})
+    assert r.status_code == 404
+
+    r = await client.get("/v1/risk/stages")
+    stages = {s["name"]: s for s in r.json()}
+    assert stages["sensitive_tool"]["enabled"] is False and stages["secrets"]["enabled"] is True
+
+    r = await client.post("/v1/evaluate", json=body)
+    assert "sensitive_tool:shell" not in r.json()["risk_signals"]
+    await client.put("/v1/risk/stages/sensitive_tool", json={"enabled": True})
+
+
+@pytest.mark.asyncio
+async def test_evaluation_and_approval_written_in_one_transaction(app_client):
+    """The write path INSERTs both rows and reads nothing back."""
+    from sqlalchemy import event
+
+    from app.db.session import engine
+
+    client, _ = app_client
+    body = {"action_type": "tool_call", "tool_name": "shell", "tool_args": {"command": "ls"}}
+    # Stores the payload; the next evaluation of it writes no payload row
+    await client.post("/v1/evaluate", json=body)
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement.split(None, 1)[0].upper())
+
+    event.listen(engine.sync_engine, "before_cursor_execute", record)
+    try:
+        r = await client.post("/v1/evaluate", json=body)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", record)
+
+    assert r.status_code == 200 and r.json()["approval_id"]
+    writes = statements[statements.index("INSERT"):]
+    assert writes == ["INSERT", "INSERT"]
+
+
+@pytest.mark.asyncio
+async def test_identical_payloads_are_stored_once(app_client):
+    """A tenant's evaluations of the same request share one request_payloads row, never another tenant's."""
+    import uuid
+
+    from sqlalchemy import func, select
+    from sqlalchemy.orm import undefer
+
+    from app.api.schemas import EvaluateRequest
+    from app.core.security import authenticate_api_key
+    from app.db.models import Evaluation, RequestPayload
+    from app.db.session import async_session
+    from app.services.payload_store import request_hash
+
+    client, raw_key = app_client
+    tenant_id = (await authenticate_api_key(raw_key)).tenant_id
+    body = {"action_type": "tool_call", "tool_name": "search", "tool_args": {"query": str(uuid.uuid4())}}
+    ids = []
+    for _ in range(2):
+        r = await client.post("/v1/evaluate", json=body)
+        ids.append(uuid.UUID(r.json()["evaluation_id"]))
+    r = await client.post("/v1/evaluate/batch", json={"items": [body, body]})
+    ids += [uuid.UUID(res["evaluation_id"]) for res in r.json()["results"]]
+
+    async with async_session() as session:
+        result = await session.execute(
+            select(Evaluation).where(Evaluation.id.in_(ids)).options(undefer(Evaluation.request_payload))
+        )
+        evs = result.scalars().all()
+        assert len(evs) == 4 and len({ev.request_hash for ev in evs}) == 1
+        assert all(ev.request_payload["tool_args"] == body["tool_args"] for ev in evs)
+        stored = await session.scalar(
+            select(func.count()).select_from(RequestPayload).where(RequestPayload.hash == evs[0].request_hash)
+        )
+        assert stored == 1
+    full = EvaluateRequest(**body).model_dump()
+    assert evs[0].request_hash == request_hash(tenant_id, full) != request_hash(uuid.uuid4(), full)
+
+    r = await client.get("/v1/metrics")
+    assert "deduplicated" not in r.json()["payload_store"]
+
+
+@pytest.mark.asyncio
+async def test_evaluate_batch_returns_results_in_order(app_client):
+    """Batch items are decided like /evaluate, with per-item idempotency keys."""
+    import uuid
+
+    client, _ = app_client
+    key = f"batch-{uuid.uuid4()}"
+    items = [
+        {"action_type": "tool_call", "tool_name": "search", "tool_args": {"query": "a"}},
+        {"action_type": "aws_api", "aws_service": "iam", "aws_operation": "CreateAccessKey", "params": {}},
+        {"action_type": "tool_call", "tool_name": "shell", "tool_args": {"command": "ls"}, "idempotency_key": key},
+        {"action_type": "tool_call", "tool_name": "shell", "tool_args": {"command": "ls"}, "idempotency_key": key},
+    ]
+
+    r = await client.post("/v1/evaluate/batch", json={"items": items})
+    assert r.status_code == 200
+    results = r.json()["results"]
+    assert [res["decision"] for res in results] == ["ALLOW", "DENY", "REQUIRE_APPROVAL", "REQUIRE_APPROVAL"]
+    assert results[2] == results[3] and results[2]["approval_id"]
+    assert len({res["evaluation_id"] for res in results}) == 3
+
+    # The key replays through /evaluate and through a later batch
+    r = await client.post("/v1/evaluate", json=items[2], headers={"Idempotency-Key": key})
+    assert r.json() == results[2]
+    r = await client.post("/v1/evaluate/batch", json={"items": items[2:3]})
+    assert r.json()["results"] == results[2:3]
+
+    r = await client.post("/v1/evaluate/batch", json={"items": []})
+    assert r.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_evaluate_stream_pipelines_over_one_connection(app_client, monkeypatch):
+    """Pipelined stream messages are each answered by id; bad input and keys are rejected."""
+    import asyncio
+    import json
+
+    import uvicorn
+    from websockets.asyncio.client import connect
+    from websockets.exceptions import InvalidStatus
+
+    from app.integrations.langchain_guard import AgentShieldStreamClient
+    from app.main import app
+    from app.services.key_usage import key_usage
+
+    _, raw_key = app_client
+    server = uvicorn.Server(uvicorn.Config(app, port=0, lifespan="off", log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    try:
+        async with AgentShieldStreamClient(f"http://127.0.0.1:{port}", raw_key) as guard:
+            results = await asyncio.gather(
+                guard.evaluate({"action_type": "tool_call", "tool_name": "search", "tool_args": {"q": "a"}}),
+                guard.evaluate({"action_type": "aws_api", "aws_service": "iam", "aws_operation": "CreateAccessKey"}),
+                guard.evaluate({"action_type": "tool_call", "tool_name": "shell", "tool_args": {"command": "ls"}}),
+            )
+            assert [r["decision"] for r in results] == ["ALLOW", "DENY", "REQUIRE_APPROVAL"]
+            with pytest.raises(RuntimeError, match="422"):
+                await guard.evaluate({"action_type": "not_an_action"})
+
+            # A dropped connection is reopened by the next call
+            ws = guard._ws
+            await ws.close()
+            await guard._reader
+            assert (await guard.evaluate({"action_type": "tool_call", "tool_name": "search"}))["decision"] == "ALLOW"
+            assert guard._ws is not ws
+
+        recorded = []
+        monkeypatch.setattr(key_usage, "record", recorded.append)
+        async with connect(f"ws://127.0.0.1:{port}/v1/evaluate/stream", additional_headers={"X-Api-Key": raw_key}) as ws:
+            await ws.send("not json")
+            assert json.loads(await ws.recv())["error"]["status"] == 422
+            # Idempotency keys are validated like batch items
+            request = {"action_type": "tool_call", "tool_name": "search"}
+            for key in (123, "k" * 201):
+                await ws.send(json.dumps({"id": 1, "request": request, "idempotency_key": key}))
+                assert json.loads(await ws.recv())["error"]["status"] == 422
+            await ws.send(json.dumps({"id": 2, "request": request, "idempotency_key": "  "}))
+            assert json.loads(await ws.recv())["result"]["decision"] == "ALLOW"
+        # Every message is a use of the key, not just the connection
+        assert len(recorded) == 4
+
+        with pytest.raises(InvalidStatus):
+            async with connect(f"ws://127.0.0.1:{port}/v1/evaluate/stream", additional_headers={"X-Api-Key": "bad"}):
+                pass
+    finally:
+        server.should_exit = True
+        await serving
+
+
+@pytest.mark.asyncio
+async def test_padding_past_the_stage_budget_fails_closed(app_client, monkeypatch):
+    """Padding past a stage's work budget can't turn a scan into ALLOW, and always gets the same decision."""
+    from app.core.config import settings
+    from app.services.risk import risk_cache
+
+    client, _ = app_client
+    monkeypatch.setattr(settings, "RISK_POOL_WORKERS", 0)
+    monkeypatch.setattr(settings, "RISK_STAGE_MAX_CHARS", 2000)
+
+    tool_args = {f"pad{i}": f"harmless text number {i}" for i in range(200)}
+    tool_args["zz"] = "rm -rf / --no-preserve-root"
+    results = set()
+    for _ in range(3):
+        risk_cache.clear()
+        r = await client.post(
+            "/v1/evaluate", json={"action_type": "tool_call", "tool_name": "search", "tool_args": tool_args}
+        )
+        data = r.json()
+        results.add((data["decision"], data["risk_score"], tuple(data["risk_signals"])))
+
+    assert len(results) == 1
+    assert "stage_budget_exceeded:shell_patterns" in data["risk_signals"]
+    assert data["decision"] in ("REQUIRE_APPROVAL", "DENY")
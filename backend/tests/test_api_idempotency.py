@@ -61,3 +61,181 @@ async def test_different_idempotency_keys_different_results(app_client):
 
     assert r1.status_code == 200 and r2.status_code == 200
     assert r1.json()["evaluation_id"] != r2.json()["evaluation_id"]
+
+
+@pytest.mark.asyncio
+async def test_idempotent_retry_served_from_cache_or_one_query(app_client):
+    """Retries hit the rendered-response cache; a cold cache falls back to the DB."""
+    import uuid
+
+    from app.core.idempotency import idempotency_cache
+
+    client, _ = app_client
+    payload = {"action_type": "tool_call", "tool_name": "shell", "tool_args": {"command": "ls"}}
+    headers = {"Idempotency-Key": f"cache-{uuid.uuid4()}"}
+
+    r1 = await client.post("/v1/evaluate", json=payload, headers=headers)
+    assert r1.status_code == 200
+    hits = idempotency_cache.stats()["hits"]
+    r2 = await client.post("/v1/evaluate", json=payload, headers=headers)
+    assert r2.json() == r1.json()
+    assert idempotency_cache.stats()["hits"] == hits + 1
+
+    idempotency_cache.clear()
+    db_hits = idempotency_cache.stats()["db_hits"]
+    r3 = await client.post("/v1/evaluate", json=payload, headers=headers)
+    assert r3.json() == r1.json()
+    assert idempotency_cache.stats()["db_hits"] == db_hits + 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_duplicates_share_one_evaluation(app_client):
+    """Duplicates in flight at the same time get the first request's result."""
+    import asyncio
+    import uuid
+
+    from app.core.idempotency import idempotency_flights
+
+    client, _ = app_client
+    payload = {"action_type": "tool_call", "tool_name": "search", "tool_args": {"query": "dup"}}
+    headers = {"Idempotency-Key": f"flight-{uuid.uuid4()}"}
+
+    before = idempotency_flights.coalesced
+    responses = await asyncio.gather(
+        *(client.post("/v1/evaluate", json=payload, headers=headers) for _ in range(5))
+    )
+    assert all(r.status_code == 200 for r in responses)
+    assert len({r.json()["evaluation_id"] for r in responses}) == 1
+    assert idempotency_flights.coalesced > before
+    assert len(idempotency_flights) == 0
+
+
+@pytest.mark.asyncio
+async def test_idempotency_key_locked_by_another_worker(app_client):
+    """A request waits for another worker's in-progress evaluation of the same key."""
+    import asyncio
+    import uuid
+
+    from app.core.idempotency import lock_idempotency_key
+    from app.core.security import authenticate_api_key
+    from app.db.models import Evaluation
+    from app.db.session import async_session
+    from app.services.payload_store import payload_store
+
+    client, raw_key = app_client
+    tenant_id = (await authenticate_api_key(raw_key)).tenant_id
+    key = f"worker-{uuid.uuid4()}"
+    payload = {"action_type": "tool_call", "tool_name": "search", "tool_args": {"query": "w"}}
+
+    async with async_session() as other:
+        await lock_idempotency_key(other, tenant_id, key)
+        request = asyncio.create_task(
+            client.post("/v1/evaluate", json=payload, headers={"Idempotency-Key": key})
+        )
+        await asyncio.sleep(0.3)
+        assert not request.done()
+
+        ev = Evaluation(
+            tenant_id=uuid.UUID(tenant_id),
+            idempotency_key=key,
+            action_type="tool_call",
+            request_hash="0" * 64,
+            risk_signals=[],
+            decision="ALLOW",
+            reason="other-worker",
+            risk_score=0,
+            policy_hits=[],
+        )
+        await payload_store.write(other, {ev.request_hash: {}})
+        other.add(ev)
+        await other.commit()
+
+    r = await request
+    assert r.status_code == 200
+    assert r.json()["evaluation_id"] == str(ev.id) and r.json()["reason"] == "other-worker"
+
+
+
+@pytest.mark.asyncio
+async def test_keyed_evaluation_holds_one_connection(app_client):
+    """The locked re-check runs on the connection holding the key lock, not a second one."""
+    import uuid
+
+    from sqlalchemy import event
+
+    from app.db.session import engine
+
+    client, _ = app_client
+    pool = engine.sync_engine.pool
+    baseline = pool.checkedout()
+    peak = [baseline]
+
+    def on_checkout(*_):
+        peak[0] = max(peak[0], pool.checkedout())
+
+    event.listen(pool, "checkout", on_checkout)
+    try:
+        for body in (
+            {"action_type": "tool_call", "tool_name": "search", "tool_args": {"query": "one"}},
+            {"items": [{"action_type": "tool_call", "tool_name": "search", "idempotency_key": f"b-{uuid.uuid4()}"}]},
+        ):
+            path = "/v1/evaluate/batch" if "items" in body else "/v1/evaluate"
+            r = await client.post(path, json=body, headers={"Idempotency-Key": f"conn-{uuid.uuid4()}"})
+            assert r.status_code == 200
+    finally:
+        event.remove(pool, "checkout", on_checkout)
+    assert peak[0] - baseline == 1
+
+
+@pytest.mark.asyncio
+async def test_expired_idempotency_keys_are_ignored_and_cleared(app_client):
+    """Keys older than IDEMPOTENCY_TTL no longer replay and are released in batches."""
+    import uuid
+    from datetime import datetime, timedelta
+
+    from sqlalchemy import func, select, update
+
+    from app.core.config import settings
+    from app.core.idempotency import idempotency_cache
+    from app.db.models import Evaluation
+    from app.db.session import async_session
+    from app.services.idempotency_expiry import expire_idempotency_keys, idempotency_expirer
+
+    client, _ = app_client
+    payload = {"action_type": "tool_call", "tool_name": "search", "tool_args": {"query": "old"}}
+    keys = [f"expire-{uuid.uuid4()}" for _ in range(4)]
+    first = {}
+    for key in keys:
+        r = await client.post("/v1/evaluate", json=payload, headers={"Idempotency-Key": key})
+        first[key] = r.json()["evaluation_id"]
+
+    # Age all but keys[2] past the TTL
+    old = datetime.utcnow() - timedelta(seconds=settings.IDEMPOTENCY_TTL + 60)
+    async with async_session() as session:
+        await session.execute(
+            update(Evaluation)
+            .where(Evaluation.idempotency_key.in_([keys[0], keys[1], keys[3]]))
+            .values(created_at=old)
+        )
+        await session.commit()
+    idempotency_cache.clear()
+
+    # An expired key evaluates afresh, even before the expiry task clears it:
+    # the INSERT that collides with it releases the key and is retried
+    r = await client.post("/v1/evaluate", json=payload, headers={"Idempotency-Key": keys[0]})
+    assert r.status_code == 200 and r.json()["evaluation_id"] != first[keys[0]]
+    r = await client.post("/v1/evaluate/batch", json={"items": [{**payload, "idempotency_key": keys[3]}]})
+    assert r.status_code == 200 and r.json()["results"][0]["evaluation_id"] != first[keys[3]]
+
+    assert await expire_idempotency_keys(batch_size=1) >= 1
+    async with async_session() as session:
+        live = await session.execute(
+            select(func.count()).where(Evaluation.idempotency_key.in_(keys))
+        )
+        assert live.scalar_one() == 3  # keys[0] and keys[3] (new evaluations) and keys[2]
+
+    r = await client.post("/v1/evaluate", json=payload, headers={"Idempotency-Key": keys[2]})
+    assert r.json()["evaluation_id"] == first[keys[2]]
+
+    await idempotency_expirer.run_once()
+    assert idempotency_expirer.stats()["runs"] == 1
@@ -0,0 +1,77 @@
+"""API key management and authentication cache tests."""
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_rescoped_and_deactivated_keys_take_effect_immediately(app_client):
+    """Cached auth contexts are dropped as soon as a key is changed."""
+    from httpx import ASGITransport, AsyncClient
+
+    from app.core.security import api_key_cache, authenticate_api_key
+    from app.main import app
+
+    client, raw_key = app_client
+    tenant_id = (await authenticate_api_key(raw_key)).tenant_id
+
+    r = await client.post(f"/v1/tenants/{tenant_id}/api-keys", json={"name": "ops", "scopes": ["admin"]})
+    assert r.status_code == 200
+    created = r.json()
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(
+        transport=transport, base_url="http://test", headers={"X-Api-Key": created["api_key"]}
+    ) as ops:
+        assert (await ops.get("/v1/metrics")).status_code == 200
+        hits = api_key_cache.stats()["known"]["hits"]
+        assert (await ops.get("/v1/metrics")).status_code == 200
+        assert api_key_cache.stats()["known"]["hits"] == hits + 1
+
+        url = f"/v1/tenants/{tenant_id}/api-keys/{created['api_key_id']}"
+        r = await client.patch(url, json={"scopes": ["read"]})
+        assert r.status_code == 200 and r.json()["scopes"] == ["read"]
+        assert (await ops.get("/v1/metrics")).status_code == 403
+
+        r = await client.patch(url, json={"is_active": False})
+        assert r.status_code == 200
+        assert (await ops.get("/v1/metrics")).status_code == 401
+
+    r = await client.patch(f"/v1/tenants/{tenant_id}/api-keys/not-a-uuid", json={"is_active": False})
+    assert r.status_code == 400
+
+    # Unknown keys are negatively cached
+    async with AsyncClient(
+        transport=transport, base_url="http://test", headers={"X-Api-Key": "ash_live_unknown"}
+    ) as bad:
+        assert (await bad.get("/v1/metrics")).status_code == 401
+        before = api_key_cache.stats()["unknown"]["hits"]
+        assert (await bad.get("/v1/metrics")).status_code == 401
+        assert api_key_cache.stats()["unknown"]["hits"] == before + 1
+
+
+@pytest.mark.asyncio
+async def test_key_usage_is_flushed_in_batches(app_client):
+    """last_used_at is written by flush(), not per request."""
+    from uuid import UUID
+
+    from sqlalchemy import select
+
+    from app.core.security import authenticate_api_key
+    from app.db.models import ApiKey
+    from app.db.session import async_session
+    from app.services.key_usage import key_usage
+
+    client, raw_key = app_client
+    ctx = await authenticate_api_key(raw_key)
+    await key_usage.flush()
+
+    for _ in range(3):
+        assert (await client.get("/v1/metrics")).status_code == 200
+    async with async_session() as session:
+        key = await session.get(ApiKey, UUID(ctx.api_key_id))
+        assert key.last_used_at is None
+
+    assert await key_usage.flush() == 1
+    async with async_session() as session:
+        used = (await session.execute(select(ApiKey.last_used_at).where(ApiKey.id == UUID(ctx.api_key_id)))).scalar_one()
+    assert used is not None
+    assert await key_usage.flush() == 0
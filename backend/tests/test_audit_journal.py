@@ -0,0 +1,232 @@
+"""Write-behind audit journal tests."""
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_journaled_evaluations_are_drained_and_replayed(app_client, tmp_path, monkeypatch):
+    """ALLOW/DENY rows are journaled, then inserted; orphaned journals are replayed."""
+    import uuid
+
+    from sqlalchemy.orm import undefer
+
+    from app.core.config import settings
+    from app.db.models import Evaluation
+    from app.db.session import async_session
+    from app.services.audit_journal import audit_journal
+
+    client, _ = app_client
+    monkeypatch.setattr(settings, "AUDIT_JOURNAL_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "AUDIT_JOURNAL_FSYNC", False)
+    payload = {"action_type": "tool_call", "tool_name": "search", "tool_args": {"query": "journal"}}
+
+    r = await client.post("/v1/evaluate", json=payload)
+    assert r.status_code == 200 and r.json()["decision"] == "ALLOW"
+    ev_id = uuid.UUID(r.json()["evaluation_id"])
+    async with async_session() as session:
+        assert await session.get(Evaluation, ev_id) is None
+
+    # Approvals still go straight to Postgres
+    r = await client.post("/v1/evaluate", json={"action_type": "tool_call", "tool_name": "shell", "tool_args": {}})
+    assert r.json()["decision"] == "REQUIRE_APPROVAL"
+    async with async_session() as session:
+        assert await session.get(Evaluation, uuid.UUID(r.json()["evaluation_id"])) is not None
+
+    # A journal left by a crashed worker, with a torn last line
+    orphan = tmp_path / "audit-1-deadbeef.jsonl"
+    line = (tmp_path / next(p.name for p in tmp_path.glob("audit-*.jsonl"))).read_bytes()
+    orphan_id = uuid.uuid4()
+    orphan.write_bytes(line.replace(str(ev_id).encode(), str(orphan_id).encode()) + b'{"id": "trunc')
+
+    assert await audit_journal.drain() == 2
+    assert list(tmp_path.glob("audit-*.jsonl")) == []
+    async with async_session() as session:
+        ev = await session.get(Evaluation, ev_id, options=[undefer(Evaluation.request_payload)])
+        assert ev.decision == "ALLOW" and ev.request_payload["tool_args"] == {"query": "journal"}
+        assert await session.get(Evaluation, orphan_id) is not None
+
+    # Replaying an already drained journal inserts nothing twice
+    orphan.write_bytes(line)
+    assert await audit_journal.drain() == 0
+    assert audit_journal.stats()["appended"] == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_appends_share_one_write(tmp_path, monkeypatch):
+    """Appends made while a write is pending are group-committed with one fsync."""
+    import asyncio
+    import uuid
+    from datetime import datetime
+
+    from app.core.config import settings
+    from app.db.models import Evaluation
+    from app.services.audit_journal import audit_journal
+
+    monkeypatch.setattr(settings, "AUDIT_JOURNAL_DIR", str(tmp_path))
+    evs = [
+        Evaluation(
+            id=uuid.uuid4(),
+            tenant_id=uuid.uuid4(),
+            action_type="tool_call",
+            request_hash="0" * 64,
+            risk_signals=[],
+            decision="ALLOW",
+            reason="default",
+            risk_score=0,
+            policy_hits=[],
+            created_at=datetime.utcnow(),
+        )
+        for _ in range(10)
+    ]
+    appended, writes = audit_journal.appended, audit_journal.writes
+
+    await asyncio.gather(*(audit_journal.append(ev, {}) for ev in evs))
+    assert audit_journal.appended - appended == 10
+    assert audit_journal.writes - writes == 1
+    (journal,) = tmp_path.glob("audit-*.jsonl")
+    assert len(journal.read_bytes().splitlines()) == 10
+
+    async with audit_journal._write_lock:
+        audit_journal._seal()
+    journal.unlink()
+
+
+@pytest.mark.asyncio
+async def test_rejected_rows_are_set_aside(app_client, tmp_path, monkeypatch):
+    """A row Postgres refuses doesn't block the rest of its journal."""
+    import json
+    import uuid
+
+    from app.core.config import settings
+    from app.db.models import Evaluation
+    from app.db.session import async_session
+    from app.services.audit_journal import audit_journal
+
+    client, _ = app_client
+    monkeypatch.setattr(settings, "AUDIT_JOURNAL_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "AUDIT_JOURNAL_FSYNC", False)
+
+    r = await client.post("/v1/evaluate", json={"action_type": "tool_call", "tool_name": "search", "tool_args": {}})
+    good_id = r.json()["evaluation_id"]
+    (journal,) = tmp_path.glob("audit-*.jsonl")
+    line = journal.read_bytes().splitlines()[0]
+    # Same row for a tenant that doesn't exist: the FK rejects it
+    bad = json.loads(line)
+    bad["id"], bad["tenant_id"] = str(uuid.uuid4()), str(uuid.uuid4())
+    orphan = tmp_path / "audit-2-cafebabe.jsonl"
+    orphan.write_bytes(json.dumps(bad).encode() + b"\n")
+
+    rejected = audit_journal.stats()["rejected"]
+    assert await audit_journal.drain() == 1
+    assert list(tmp_path.glob("audit-*.jsonl")) == []
+    assert (tmp_path / "rejected-audit-2-cafebabe.jsonl").read_bytes().splitlines() == [json.dumps(bad).encode()]
+    assert audit_journal.stats()["rejected"] == rejected + 1
+    async with async_session() as session:
+        assert await session.get(Evaluation, uuid.UUID(good_id)) is not None
+
+
+@pytest.mark.asyncio
+async def test_journal_lines_from_before_payload_store_are_drained(app_client, tmp_path, monkeypatch):
+    """Lines with the old request_payload column (no separate payload) still drain."""
+    import hashlib
+    import json
+    import uuid
+
+    from sqlalchemy.orm import undefer
+
+    from app.core.config import settings
+    from app.db.models import Evaluation
+    from app.db.session import async_session
+    from app.services.audit_journal import audit_journal
+    from app.services.payload_store import request_hash
+
+    client, _ = app_client
+    monkeypatch.setattr(settings, "AUDIT_JOURNAL_DIR", str(tmp_path))
+    await client.post("/v1/evaluate", json={"action_type": "tool_call", "tool_name": "search", "tool_args": {}})
+    (journal,) = tmp_path.glob("audit-*.jsonl")
+    row = json.loads(journal.read_bytes().splitlines()[0])
+    legacy_id = uuid.uuid4()
+    tool_args = {"query": str(legacy_id)}
+    body = {**row.pop("payload"), "tool_args": tool_args}
+    # Legacy lines hashed the body alone; drained under the tenant-scoped hash
+    row["id"] = str(legacy_id)
+    row["request_hash"] = hashlib.sha256(json.dumps(body, sort_keys=True).encode()).hexdigest()
+    row["request_payload"] = {**body, "risk_signals": ["legacy"]}
+    del row["risk_signals"]
+    (tmp_path / "audit-3-0ldf0rma.jsonl").write_bytes(json.dumps(row).encode() + b"\n")
+
+    assert await audit_journal.drain() == 2
+    async with async_session() as session:
+        ev = await session.get(Evaluation, legacy_id, options=[undefer(Evaluation.request_payload)])
+        assert ev.risk_signals == ["legacy"] and ev.request_payload["tool_args"] == tool_args
+        assert ev.request_hash == request_hash(row["tenant_id"], body)
+
+
+def test_journal_files_are_locked_before_they_are_visible(tmp_path, monkeypatch):
+    """A journal only appears under its drainable name once its writer holds the lock."""
+    import fcntl
+    import os
+
+    from app.core.config import settings
+    from app.services.audit_journal import AuditJournal, _try_lock
+
+    monkeypatch.setattr(settings, "AUDIT_JOURNAL_DIR", str(tmp_path))
+    journal = AuditJournal()
+    journal._open()
+    try:
+        assert [p.name for p in tmp_path.iterdir()] == [journal._path.name]
+        assert _try_lock(journal._path) is None
+
+        # Deleted by another drainer (and the name reused) while we waited for the lock
+        stale = tmp_path / "audit-3-feedface.jsonl"
+        stale.write_bytes(b"")
+        flock = fcntl.flock
+
+        def flock_after_delete(fd, op):
+            monkeypatch.setattr(fcntl, "flock", flock)
+            stale.unlink()
+            stale.write_bytes(b"")
+            return flock(fd, op)
+
+        monkeypatch.setattr(fcntl, "flock", flock_after_delete)
+        assert _try_lock(stale) is None
+        fd = _try_lock(stale)
+        assert fd is not None
+        os.close(fd)
+    finally:
+        journal._seal()
+
+
+@pytest.mark.asyncio
+async def test_stop_drains_appends_still_in_flight(app_client, tmp_path, monkeypatch):
+    """stop() waits for pending group commits, so their rows are in the final drain."""
+    import asyncio
+    import uuid
+
+    from app.core.config import settings
+    from app.db.models import Evaluation
+    from app.db.session import async_session
+    from app.services.audit_journal import audit_journal
+
+    client, _ = app_client
+    monkeypatch.setattr(settings, "AUDIT_JOURNAL_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "AUDIT_JOURNAL_FSYNC", False)
+
+    r = await client.post("/v1/evaluate", json={"action_type": "tool_call", "tool_name": "search", "tool_args": {}})
+    first = uuid.UUID(r.json()["evaluation_id"])
+    async with async_session() as session:
+        ev = await session.get(Evaluation, first)
+    assert ev is None
+    await audit_journal.drain()
+    async with async_session() as session:
+        ev = await session.get(Evaluation, first)
+    ev.id = uuid.uuid4()
+
+    # Not yet written when stop() begins
+    append = asyncio.create_task(audit_journal.append(ev, {}))
+    await asyncio.sleep(0)
+    assert audit_journal._commits
+    await audit_journal.stop()
+    await append
+    assert list(tmp_path.glob("audit-*.jsonl")) == []
+    async with async_session() as session:
+        assert await session.get(Evaluation, ev.id) is not None
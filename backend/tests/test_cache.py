@@ -0,0 +1,56 @@
+"""In-process LRU cache and decision memo tests."""
+import time
+
+from app.core.cache import LRUCache
+
+
+def test_lru_evicts_least_recently_used():
+    c = LRUCache(maxsize=2)
+    c.set("a", 1)
+    c.set("b", 2)
+    assert c.get("a") == 1
+    c.set("c", 3)
+    assert "b" not in c
+    assert c.get("a") == 1 and c.get("c") == 3
+    assert c.stats()["evictions"] == 1
+
+
+def test_lru_ttl_expires_entries():
+    c = LRUCache(maxsize=10, ttl=0.01)
+    c.set("a", 1)
+    assert c.get("a") == 1
+    time.sleep(0.02)
+    assert c.get("a") is None
+    stats = c.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1 and stats["expirations"] == 1
+
+
+def test_decision_memo_keys_on_context_and_policy_version():
+    from app.services.policy_cache import PolicySnapshot
+    from app.services.policy_engine import compile_policies, match_context
+    from app.services.policy_memo import DecisionMemo
+
+    class Action:
+        action_type = "tool_call"
+        actor = "alice"
+        agent = None
+        tool_name = "shell"
+        aws_service = None
+        aws_operation = None
+
+    deny = compile_policies(
+        [{"name": "p", "rules": [{"name": "r", "effect": "DENY", "match": {"equals": {"tool_name": "shell"}}}]}]
+    )
+    allow = compile_policies([])
+    memo = DecisionMemo(maxsize=100)
+    ctx = match_context(Action, 10)
+
+    v1 = PolicySnapshot(tenant_id="t", version=1, fingerprint=(), compiled=deny, loaded_at=0)
+    assert memo.evaluate(v1, ctx).decision == "DENY"
+    assert memo.evaluate(v1, dict(ctx)).resolve_hits() == [{"policy": "p", "rule": "r", "effect": "DENY"}]
+    assert memo.stats()["hits"] == 1
+
+    v2 = PolicySnapshot(tenant_id="t", version=2, fingerprint=(), compiled=allow, loaded_at=0)
+    assert memo.evaluate(v2, ctx).decision == "ALLOW"
+    assert memo.evaluate(v1, match_context(Action, 90)).decision == "DENY"
+    assert memo.stats()["misses"] == 3
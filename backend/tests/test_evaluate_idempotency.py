@@ -1,8 +1,72 @@
 """Idempotency: logic covered in test_api_idempotency.py (integration).
 Unit-level: idempotency key present returns cached evaluation; absent creates new.
 """
+import pytest
 
 
 def test_idempotency_behavior_documented():
     """Placeholder - full flow tested in test_api_idempotency.py with real DB."""
     assert True
+
+
+@pytest.mark.asyncio
+async def test_single_flight_leader_cancellation_does_not_cancel_followers():
+    """A follower re-runs the call when the leader it waited on is cancelled."""
+    import asyncio
+
+    from app.core.idempotency import SingleFlight
+
+    flights = SingleFlight()
+    calls = []
+    started = asyncio.Event()
+
+    async def fn():
+        calls.append(1)
+        started.set()
+        await asyncio.sleep(0 if len(calls) > 1 else 10)
+        return len(calls)
+
+    leader = asyncio.create_task(flights.run("k", fn))
+    await started.wait()
+    follower = asyncio.create_task(flights.run("k", fn))
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    assert await follower == 2
+    assert leader.cancelled() and len(flights) == 0
+
+
+@pytest.mark.asyncio
+async def test_redis_hits_expire_locally_with_the_redis_entry(monkeypatch):
+    """A response read from Redis is cached locally only for the entry's remaining lifetime."""
+    import time
+
+    from app.core.idempotency import IdempotencyCache
+    from app.core.redis import shared_redis
+
+    class Pipeline:
+        def __init__(self, data):
+            self.data, self.ops = data, []
+
+        def get(self, key):
+            self.ops.append(self.data.get(key))
+
+        def pttl(self, key):
+            self.ops.append(1500 if key in self.data else -2)
+
+        async def execute(self):
+            return self.ops
+
+    class Redis:
+        data = {"agentshield:idem:t:k": '{"decision": "ALLOW"}'}
+
+        def pipeline(self, transaction=True):
+            return Pipeline(self.data)
+
+    monkeypatch.setattr(shared_redis, "client", lambda: Redis())
+    cache = IdempotencyCache(maxsize=10)
+    assert await cache.get("t", "k") == {"decision": "ALLOW"}
+    assert cache.redis_hits == 1
+
+    expires_at, _ = cache._cache._data[("t", "k")]
+    assert expires_at - time.monotonic() <= 1.5
@@ -0,0 +1,101 @@
+"""Migration of a database created before request payloads moved out of evaluations."""
+import hashlib
+import json
+import uuid
+
+import pytest
+
+_LEGACY_DDL = [
+    "CREATE TABLE tenants (id UUID PRIMARY KEY, name VARCHAR(200) UNIQUE NOT NULL, created_at TIMESTAMP NOT NULL)",
+    """CREATE TABLE evaluations (
+        id UUID PRIMARY KEY, tenant_id UUID NOT NULL REFERENCES tenants (id),
+        idempotency_key VARCHAR(200), trace_id VARCHAR(100), action_type VARCHAR(40) NOT NULL,
+        actor VARCHAR(200), agent VARCHAR(200), tool_name VARCHAR(200), aws_service VARCHAR(80),
+        aws_operation VARCHAR(120), request_payload JSONB NOT NULL, request_hash VARCHAR(64) NOT NULL,
+        decision VARCHAR(30) NOT NULL, reason VARCHAR(500) NOT NULL, risk_score INTEGER NOT NULL,
+        policy_hits JSONB NOT NULL, created_at TIMESTAMP NOT NULL,
+        CONSTRAINT uq_eval_tenant_idempotency UNIQUE (tenant_id, idempotency_key)
+    )""",
+    """CREATE TABLE approval_requests (
+        id UUID PRIMARY KEY, tenant_id UUID NOT NULL REFERENCES tenants (id),
+        evaluation_id UUID NOT NULL REFERENCES evaluations (id), status VARCHAR(30) NOT NULL,
+        approver VARCHAR(200), comment VARCHAR(500), created_at TIMESTAMP NOT NULL, resolved_at TIMESTAMP
+    )""",
+]
+
+
+@pytest.mark.asyncio
+async def test_migrate_legacy_evaluations(test_db_url):
+    """Payloads move to request_payloads (once per tenant and body), risk_signals get their own column."""
+    from sqlalchemy import select, text
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlalchemy.orm import undefer
+
+    from app.db.models import Evaluation, RequestPayload
+    from app.db.session import async_session
+    from app.services.payload_store import payload_store, request_hash
+
+    from scripts.migrate_schema import migrate
+
+    schema = f"legacy_{uuid.uuid4().hex[:8]}"
+    admin = create_async_engine(test_db_url)
+    async with admin.begin() as conn:
+        await conn.execute(text(f"CREATE SCHEMA {schema}"))
+    engine = create_async_engine(test_db_url, connect_args={"server_settings": {"search_path": schema}})
+    try:
+        tenant_id, other_tenant = uuid.uuid4(), uuid.uuid4()
+        same = {"action_type": "tool_call", "tool_name": "search", "tool_args": {"query": "a"}}
+        other = {"action_type": "tool_call", "tool_name": "shell", "tool_args": {"command": "ls"}}
+        async with engine.begin() as conn:
+            for ddl in _LEGACY_DDL:
+                await conn.execute(text(ddl))
+            for tid, name in ((tenant_id, "legacy"), (other_tenant, "legacy-2")):
+                await conn.execute(text("INSERT INTO tenants VALUES (:id, :name, now())"), {"id": tid, "name": name})
+            for tid, body, signals in (
+                (tenant_id, same, []),
+                (tenant_id, same, []),
+                (tenant_id, other, ["sensitive_tool:shell"]),
+                (other_tenant, same, []),
+            ):
+                await conn.execute(
+                    text(
+                        "INSERT INTO evaluations (id, tenant_id, action_type, request_payload, request_hash,"
+                        " decision, reason, risk_score, policy_hits, created_at)"
+                        " VALUES (:id, :tenant, 'tool_call', CAST(:payload AS JSONB), :hash,"
+                        " 'ALLOW', 'default', 0, '[]', now())"
+                    ),
+                    {
+                        "id": uuid.uuid4(),
+                        "tenant": tid,
+                        "payload": json.dumps({**body, "risk_signals": signals}),
+                        # Legacy hashes did not include the tenant
+                        "hash": hashlib.sha256(json.dumps(body, sort_keys=True).encode()).hexdigest(),
+                    },
+                )
+
+        report = await migrate(engine)
+        assert report == {"payloads_copied": 3, "dropped_request_payload": True}
+        # Re-running is a no-op
+        assert await migrate(engine) == {"payloads_copied": 0, "dropped_request_payload": False}
+
+        async with async_session(bind=engine) as session:
+            result = await session.execute(
+                select(Evaluation).options(undefer(Evaluation.request_payload)).order_by(Evaluation.risk_signals)
+            )
+            evs = result.scalars().all()
+            assert [ev.risk_signals for ev in evs] == [[], [], [], ["sensitive_tool:shell"]]
+            assert [ev.request_payload["tool_name"] for ev in evs] == ["search", "search", "search", "shell"]
+            # Re-keyed per tenant: the other tenant's identical body has its own row
+            assert {ev.request_hash for ev in evs} == {
+                request_hash(tenant_id, same),
+                request_hash(tenant_id, other),
+                request_hash(other_tenant, same),
+            }
+            assert len((await session.execute(select(RequestPayload))).all()) == 3
+    finally:
+        # Hashes remembered as stored here don't exist in the main schema
+        payload_store.clear()
+        await engine.dispose()
+        async with admin.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+        await admin.dispose()
@@ -0,0 +1,77 @@
+"""Vectorized batch policy evaluation tests."""
+import random
+
+from app.services.policy_batch import evaluate_policies_batch
+from app.services.policy_engine import compile_policies, evaluate_policies
+
+FIELDS = {
+    "action_type": ["tool_call", "aws_api", "codegen", None],
+    "tool_name": ["shell", "search", "sql", None],
+    "aws_service": ["iam", "s3", "sts", None],
+    "aws_operation": ["CreateAccessKey", "GetObject", "PutUserPolicy", None],
+    "risk_score": [0, 1, 1.0, True, 80],
+}
+
+
+def _random_policies(rng):
+    def rand_rule(i):
+        match = {}
+        for op in ("equals", "in", "glob"):
+            if rng.random() < 0.5:
+                continue
+            clause = {}
+            for k in rng.sample(list(FIELDS), rng.randint(1, 2)):
+                if op == "equals":
+                    clause[k] = rng.choice(FIELDS[k])
+                elif op == "in":
+                    clause[k] = rng.sample(FIELDS[k], rng.randint(0, 3))
+                else:
+                    clause[k] = rng.choice(["*", "*Access*", "s*", "[ab]*", "?ql", "1*", "True"])
+            match[op] = clause
+        return {
+            "name": f"r{i}",
+            "effect": rng.choice(["ALLOW", "DENY", "REQUIRE_APPROVAL"]),
+            "reason": rng.choice([None, f"reason-{i}"]),
+            "match": match,
+        }
+
+    return [
+        {"name": f"p{j}", "enabled": rng.random() < 0.9, "rules": [rand_rule(i) for i in range(30)]}
+        for j in range(4)
+    ]
+
+
+def test_batch_matches_per_row_evaluation():
+    rng = random.Random(42)
+    policies = _random_policies(rng)
+    contexts = []
+    for _ in range(3000):
+        ctx = {k: rng.choice(v) for k, v in FIELDS.items()}
+        ctx["default_decision"] = rng.choice(["ALLOW", "REQUIRE_APPROVAL"])
+        contexts.append(ctx)
+
+    compiled = compile_policies(policies)
+    batch = evaluate_policies_batch(compiled, contexts)
+    assert len(batch) == len(contexts)
+    for i, ctx in enumerate(contexts):
+        d = evaluate_policies(compiled, ctx)
+        assert batch.decisions[i] == d.decision
+        assert batch.reasons[i] == d.reason
+        assert batch.hits_for(i) == d.hits
+
+
+def test_batch_handles_legacy_rule_shapes_and_empty_input():
+    policies = [
+        {
+            "name": "legacy",
+            "rules": [
+                {"name": "substr", "effect": "DENY", "match": {"in": {"tool_name": "shell-and-sql"}}},
+            ],
+        }
+    ]
+    contexts = [{"tool_name": "sql"}, {"tool_name": "search"}]
+    batch = evaluate_policies_batch(policies, contexts)
+    assert batch.decisions == ["DENY", "ALLOW"]
+
+    empty = evaluate_policies_batch(policies, [])
+    assert empty.decisions == [] and empty.hits.shape == (0, 1)
@@ -0,0 +1,52 @@
+"""Integration tests for the per-tenant policy snapshot cache."""
+import uuid
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_policy_change_invalidates_snapshot(app_client):
+    """Upsert and toggle take effect on the next evaluate without a restart."""
+    from app.services.policy_cache import policy_cache
+
+    client, _ = app_client
+    actor = f"cache-test-{uuid.uuid4().hex[:8]}"
+    payload = {
+        "action_type": "tool_call",
+        "actor": actor,
+        "tool_name": "search",
+        "tool_args": {"query": "hello"},
+        "context": {},
+    }
+
+    r = await client.post("/v1/evaluate", json=payload)
+    assert r.json()["decision"] == "ALLOW"
+
+    # Steady state: the next evaluate is served from the snapshot
+    loads = policy_cache.loads
+    r = await client.post("/v1/evaluate", json=payload)
+    assert r.json()["decision"] == "ALLOW"
+    assert policy_cache.loads == loads
+
+    r = await client.put(
+        "/v1/policies",
+        json={
+            "name": actor,
+            "enabled": True,
+            "dsl": {
+                "rules": [
+                    {"name": "deny-actor", "effect": "DENY", "match": {"equals": {"actor": actor}}}
+                ]
+            },
+        },
+    )
+    policy_id = r.json()["id"]
+
+    r = await client.post("/v1/evaluate", json=payload)
+    assert r.json()["decision"] == "DENY"
+
+    r = await client.post(f"/v1/policies/{policy_id}/toggle?enabled=false")
+    assert r.status_code == 200
+
+    r = await client.post("/v1/evaluate", json=payload)
+    assert r.json()["decision"] == "ALLOW"
@@ -51,3 +51,220 @@ def test_disabled_policy_ignored():
     ctx = {"action_type": "aws_api"}
     d = evaluate_policies(policies, ctx)
     assert d.decision == "ALLOW"
+
+
+def _linear_reference(policies, ctx):
+    """Original linear scan, kept as the oracle for the compiled engine."""
+    from app.services.policy_engine import _match_all
+
+    hits = []
+    decision = ctx.get("default_decision") or "ALLOW"
+    reason = "default"
+    precedence = {"DENY": 3, "REQUIRE_APPROVAL": 2, "ALLOW": 1}
+    for p in policies:
+        if not p.get("enabled", True):
+            continue
+        for rule in p.get("rules", []):
+            if not _match_all(rule.get("match", {}), ctx):
+                continue
+            effect = rule.get("effect", "ALLOW")
+            hits.append({"policy": p.get("name", "unknown"), "rule": rule.get("name", "unnamed"), "effect": effect})
+            if precedence.get(effect, 0) >= precedence.get(decision, 0):
+                decision = effect
+                reason = rule.get("reason") or f"matched:{p.get('name')}:{rule.get('name')}"
+    return decision, reason, hits
+
+
+def test_compiled_matches_linear_scan():
+    import random
+
+    from app.services.policy_engine import compile_policies
+
+    rng = random.Random(1234)
+    fields = {
+        "action_type": ["tool_call", "aws_api", "codegen", None],
+        "tool_name": ["shell", "search", "sql", None],
+        "aws_service": ["iam", "s3", "sts", None],
+        "aws_operation": ["CreateAccessKey", "GetObject", "PutUserPolicy", None],
+        "actor": ["alice", "bob", None],
+        "tool_args.command": ["ls", "rm -rf /", None],
+        "risk_score": [0, 40, 60, 95],
+    }
+    effects = ["ALLOW", "DENY", "REQUIRE_APPROVAL"]
+
+    def rand_rule(i):
+        match = {}
+        for op in ("equals", "in", "glob", "gte", "lt"):
+            if rng.random() < 0.5:
+                continue
+            clause = {}
+            for k in rng.sample(list(fields), rng.randint(1, 2)):
+                if op in ("gte", "lt"):
+                    clause[k] = rng.choice([0, 50, 60, 90])
+                elif op == "equals":
+                    clause[k] = rng.choice(fields[k])
+                elif op == "in":
+                    clause[k] = rng.sample(fields[k], rng.randint(0, 3))
+                else:
+                    clause[k] = rng.choice(["*", "*Access*", "s*", "[ab]*", "?ql"])
+            match[op] = clause
+        rule = {"name": f"r{i}", "effect": rng.choice(effects), "match": match}
+        if rng.random() < 0.5:
+            rule["reason"] = f"reason-{i}"
+        return rule
+
+    policies = [
+        {"name": f"p{j}", "enabled": rng.random() < 0.9, "rules": [rand_rule(i) for i in range(40)]}
+        for j in range(5)
+    ]
+    compiled = compile_policies(policies)
+
+    for _ in range(2000):
+        ctx = {k: rng.choice(v) for k, v in fields.items()}
+        ctx["tool_args"] = {"command": ctx.pop("tool_args.command")}
+        ctx["default_decision"] = rng.choice(["ALLOW", "REQUIRE_APPROVAL"])
+        expected = _linear_reference(policies, ctx)
+        d = compiled.evaluate(ctx)
+        assert (d.decision, d.reason, d.hits) == expected
+        fast = compiled.evaluate(ctx, decision_only=True)
+        assert (fast.decision, fast.reason, fast.resolve_hits()) == expected
+
+
+def test_compiled_index_prunes_candidates():
+    from app.services.policy_engine import compile_policies
+
+    policies = [
+        {
+            "name": "p1",
+            "rules": [
+                {"name": f"tool-{i}", "effect": "DENY", "match": {"equals": {"tool_name": f"t{i}"}}}
+                for i in range(1000)
+            ],
+        }
+    ]
+    compiled = compile_policies(policies)
+    ctx = {"action_type": "tool_call", "tool_name": "t500"}
+    assert [r.name for r in compiled.candidates(ctx)] == ["tool-500"]
+    assert evaluate_policies(compiled, ctx).reason == "matched:p1:tool-500"
+
+
+@pytest.mark.parametrize(
+    "rule",
+    [
+        {"name": "bad-effect", "effect": "BLOCK", "match": {}},
+        {"name": "bad-op", "effect": "DENY", "match": {"regex": {"tool_name": ".*"}}},
+        {"name": "bad-in", "effect": "DENY", "match": {"in": {"tool_name": "shell"}}},
+        {"name": "bad-glob", "effect": "DENY", "match": {"glob": {"aws_operation": ["*"]}}},
+        {"name": "bad-gte", "effect": "DENY", "match": {"gte": {"risk_score": "80"}}},
+        {"name": "bad-path", "effect": "DENY", "match": {"equals": {"tool_args..command": "ls"}}},
+        "not-a-rule",
+    ],
+)
+def test_strict_compile_rejects_malformed_rules(rule):
+    from app.services.policy_engine import PolicyValidationError, compile_policies
+
+    with pytest.raises(PolicyValidationError):
+        compile_policies([{"name": "p1", "rules": [rule]}], strict=True)
+
+
+def test_nested_paths_and_numeric_comparisons():
+    from app.services.policy_engine import compile_policies, match_context
+
+    class Action:
+        action_type = "tool_call"
+        actor = "alice"
+        agent = None
+        tool_name = "shell"
+        aws_service = None
+        aws_operation = None
+        tool_args = {"command": "rm -rf /tmp/x", "files": ["a.txt", "b.txt"]}
+        params = None
+        context = {"env": "prod"}
+
+    policies = [
+        {
+            "name": "p1",
+            "rules": [
+                {"name": "prod-shell", "effect": "REQUIRE_APPROVAL", "match": {"equals": {"context.env": "prod"}}},
+                {"name": "rm", "effect": "DENY", "match": {"glob": {"$.tool_args.command": "rm *"}, "gte": {"risk_score": 80}}},
+                {"name": "first-file", "effect": "ALLOW", "match": {"equals": {"tool_args.files[0]": "a.txt"}}},
+                {"name": "missing", "effect": "DENY", "match": {"equals": {"params.x.y": "z"}}},
+            ],
+        }
+    ]
+    compiled = compile_policies(policies, strict=True)
+
+    low = compiled.evaluate(match_context(Action, 50))
+    assert low.decision == "REQUIRE_APPROVAL"
+    assert [h["rule"] for h in low.hits] == ["prod-shell", "first-file"]
+
+    high = compiled.evaluate(match_context(Action, 85))
+    assert (high.decision, high.reason) == ("DENY", "matched:p1:rm")
+
+    # Memo key covers exactly the referenced paths plus the default decision
+    ctx = match_context(Action, 50)
+    assert compiled.context_key(ctx) == compiled.context_key({**ctx, "actor": "bob"})
+    assert compiled.context_key(ctx) != compiled.context_key({**ctx, "context": {"env": "dev"}})
+
+
+def test_decision_only_stops_at_deny_and_explains_lazily():
+    from app.services.policy_engine import compile_policies
+
+    calls = []
+
+    class CountingCtx(dict):
+        def get(self, key, default=None):
+            calls.append(key)
+            return super().get(key, default)
+
+    rules = [
+        {"name": f"allow-{i}", "effect": "ALLOW", "match": {"glob": {"tool_name": "s*"}}}
+        for i in range(50)
+    ]
+    rules.append({"name": "deny-shell", "effect": "DENY", "reason": "no shell", "match": {"glob": {"tool_name": "sh*"}}})
+    compiled = compile_policies([{"name": "p1", "rules": rules}])
+
+    ctx = CountingCtx(action_type="tool_call", tool_name="shell")
+    d = compiled.evaluate(ctx, decision_only=True)
+    assert (d.decision, d.reason, d.hits) == ("DENY", "no shell", None)
+    assert calls.count("tool_name") == 1
+
+    assert len(d.resolve_hits()) == 51
+    assert d.resolve_hits()[-1] == {"policy": "p1", "rule": "deny-shell", "effect": "DENY"}
+
+
+def test_optimize_reanchors_on_selective_clause_without_changing_results():
+    import random
+
+    from app.services.policy_engine import STATS_SAMPLE_EVERY, compile_policies
+
+    rules = [
+        {
+            "name": f"tool-{i}",
+            "effect": "DENY" if i % 7 == 0 else "REQUIRE_APPROVAL",
+            "match": {"equals": {"action_type": "tool_call", "tool_name": f"t{i}"}},
+        }
+        for i in range(200)
+    ]
+    policies = [{"name": "p1", "rules": rules}]
+    compiled = compile_policies(policies)
+    rng = random.Random(7)
+    contexts = [
+        {"action_type": "tool_call", "tool_name": f"t{rng.randrange(400)}", "default_decision": "ALLOW"}
+        for _ in range(200 * STATS_SAMPLE_EVERY)
+    ]
+
+    # Statically anchored on action_type: every rule is a candidate
+    assert len(compiled.candidates(contexts[0])) == 200
+    for ctx in contexts:
+        compiled.evaluate(ctx, decision_only=True)
+    assert compiled.optimize()
+
+    assert len(compiled.candidates({"action_type": "tool_call", "tool_name": "t3"})) == 1
+    for ctx in contexts[:500]:
+        d = compiled.evaluate(ctx)
+        assert (d.decision, d.reason, d.hits) == _linear_reference(policies, ctx)
+
+    stats = {rule: (ev, m) for _, rule, ev, m in compiled.drain_stats()}
+    assert stats["tool-3"][0] >= stats["tool-3"][1] > 0
+    assert compiled.drain_stats() == []
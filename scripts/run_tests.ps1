@@ -23,7 +23,7 @@ try {
         python -m pytest tests/ -v
     } else {
         Write-Host "Running unit tests only (no DB required)" -ForegroundColor Cyan
-        python -m pytest tests/test_policy_engine.py tests/test_risk.py tests/test_evaluate_idempotency.py -v
+        python -m pytest tests/test_policy_engine.py tests/test_policy_batch.py tests/test_cache.py tests/test_risk.py tests/test_secret_scan.py tests/test_evaluate_idempotency.py -v
     }
 } finally {
     Pop-Location
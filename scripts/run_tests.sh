@@ -21,6 +21,6 @@ case "${1:-}" in
     ;;
   *)
     echo "Running unit tests only (no DB required)..."
-    python -m pytest tests/test_policy_engine.py tests/test_risk.py tests/test_evaluate_idempotency.py -v
+    python -m pytest tests/test_policy_engine.py tests/test_policy_batch.py tests/test_cache.py tests/test_risk.py tests/test_secret_scan.py tests/test_evaluate_idempotency.py -v
     ;;
 esac